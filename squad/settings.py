@@ -163,6 +163,30 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = "UTC"
+# squad/task.py is not an app "tasks" module, so autodiscover won't find it
+CELERY_IMPORTS = ("squad.task",)
+CELERY_BEAT_SCHEDULE = {
+    # Flush SMPP credit reservations from Redis into Postgres
+    "reconcile-credit-ledger": {
+        "task": "squad.task.reconcile_credit_ledger_task",
+        "schedule": float(os.getenv("CREDIT_LEDGER_RECONCILE_SECONDS", 5)),
+    },
+    # Fail SMPP messages stuck in 'queued' (used to run in the SMPP server's DLR loop)
+    "reap-stale-messages": {
+        "task": "squad.task.reap_stale_messages_task",
+        "schedule": float(os.getenv("STALE_MESSAGE_REAP_SECONDS", 5)),
+    },
+    # Fail parts with no vendor DLR (used to run in the vendor worker's loop)
+    "sweep-stale-submissions": {
+        "task": "squad.task.sweep_stale_submissions_task",
+        "schedule": float(os.getenv("STALE_SUBMISSION_SWEEP_SECONDS", 60)),
+    },
+    # Re-queue parts whose vendor dispatcher stopped renewing its claim
+    "release-expired-claims": {
+        "task": "squad.task.release_expired_claims_task",
+        "schedule": float(os.getenv("CLAIM_RECOVERY_SECONDS", 30)),
+    },
+}
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
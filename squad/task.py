@@ -54,13 +54,15 @@ import uuid
 from django.db.models import Q
 
 import html  # Add this to your imports at the top of the file!
-import math
 import openpyxl
 from django.utils import timezone
 from squadServices.models import Campaign
 from squadServices.models.smpp.smppSMS import SMSMessage
 from squadServices.models.detailedReport.detailedReport import DetailedSMSReport
 from squadServices.helper.checkNumber import clean_phone_number
+from squadServices.helper.countryPrefixHelper import resolve_destination_country
+from squadServices.helper.messageId import new_message_id
+from squadServices.helper.smsCodec import get_encoding_and_segments
 from squadServices.helper.smsSplitter import create_message_parts
 
 logger = logging.getLogger(__name__)
@@ -963,23 +965,6 @@ def is_valid_contact(contact):
     return contact.isdigit() and 7 <= len(contact) <= 15
 
 
-# Helper function to calculate SMS parts
-def get_encoding_and_segments(text):
-    gsm7_basic = "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞ\x1bÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
-    gsm7_ext = "^{}\\[~]|€"
-    encoding = "GSM-7"
-    for char in text:
-        if char not in gsm7_basic and char not in gsm7_ext:
-            encoding = "UCS-2"
-            break
-    length = len(text)
-    if encoding == "GSM-7":
-        segments = 1 if length <= 160 else math.ceil(length / 153)
-    else:
-        segments = 1 if length <= 70 else math.ceil(length / 67)
-    return encoding, segments, length
-
-
 @shared_task
 def process_campaign_contacts_task(
     campaign_id, file_path, contacts_string, user_id, message_text, client_id
@@ -1102,17 +1087,10 @@ def process_campaign_contacts_task(
                 print(
                     f"Queuing SMS to {destination_addr} with encoding {encoding_type} and {total_segments} segments"
                 )
-                unique_msg_id = str(uuid.uuid4())
+                unique_msg_id = new_message_id()
 
                 # --- A. FIND THE DESTINATION COUNTRY ---
-                destination_country = None
-                for i in range(4, 0, -1):
-                    possible_code = destination_addr[:i]
-                    destination_country = Country.objects.filter(
-                        countryCode=possible_code, isDeleted=False
-                    ).first()
-                    if destination_country:
-                        break
+                destination_country = resolve_destination_country(destination_addr)
 
                 if not destination_country:
                     print(f"Skipping {destination_addr}: Unrecognized Country Code")
@@ -1285,3 +1263,35 @@ def process_campaign_contacts_task(
             except Exception:
                 pass
             default_storage.delete(file_path)
+
+
+@shared_task
+def reconcile_credit_ledger_task():
+    """Writes the SMPP credit reservations held in Redis back into Postgres."""
+    from squadServices.helper.creditLedger import reconcile_credit_ledger
+
+    return reconcile_credit_ledger()
+
+
+@shared_task
+def reap_stale_messages_task():
+    """Fails SMPP messages stuck in 'queued' (set-based, in chunks)."""
+    from squadServices.helper.staleMessageSweeper import reap_stale_messages
+
+    return reap_stale_messages()
+
+
+@shared_task
+def sweep_stale_submissions_task():
+    """Fails message parts the vendor never sent a DLR for (set-based, in chunks)."""
+    from squadServices.helper.staleMessageSweeper import sweep_stale_submissions
+
+    return sweep_stale_submissions()
+
+
+@shared_task
+def release_expired_claims_task():
+    """Re-queues message parts claimed by a vendor dispatcher that has died."""
+    from squadServices.helper.partClaim import release_expired_claims
+
+    return release_expired_claims()
@@ -5,3 +5,7 @@ class SquadServicesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "squadServices"
     label = "squadServices"
+
+    def ready(self):
+        # Registers the cache invalidation receivers
+        from squadServices.signals import cacheSignals  # noqa: F401
@@ -0,0 +1,156 @@
+import hashlib
+import hmac
+import ipaddress
+import logging
+import os
+import secrets
+import threading
+import time
+
+from squadServices.helper.cacheInvalidation import (
+    listen_cache_version,
+    publish_cache_version,
+)
+from squadServices.models.clientModel.client import Client, IpWhitelist
+
+logger = logging.getLogger(__name__)
+
+# Bumped (and published) whenever a Client, ClientPolicy or IpWhitelist changes
+AUTH_VERSION_KEY = "squad:bind_auth:version"
+AUTH_INVALIDATION_CHANNEL = "squad:bind_auth:invalidate"
+
+# Even without an invalidation, credentials are re-read this often (seconds)
+AUTH_CACHE_TTL = int(os.environ.get("SMPP_AUTH_CACHE_TTL", 60))
+
+MISS = object()  # "not cached", as opposed to None = "known, but rejected"
+
+
+class IpNetworkIndex:
+    """
+    The whitelist of one client, compiled into {prefix length: {network int}}
+    per IP version. A lookup masks the address once per distinct prefix length
+    and does a set lookup, so single IPs and CIDR ranges both match in O(1).
+    """
+
+    __slots__ = ("networks",)
+
+    def __init__(self, entries):
+        self.networks = {4: {}, 6: {}}
+        for entry in entries:
+            try:
+                network = ipaddress.ip_network(str(entry).strip(), strict=False)
+            except ValueError:
+                logger.warning(f"Ignoring invalid whitelist entry '{entry}'")
+                continue
+            by_prefix = self.networks[network.version]
+            by_prefix.setdefault(network.prefixlen, set()).add(
+                int(network.network_address)
+            )
+
+    def __contains__(self, ip_address):
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return False
+        # IPv4 clients reaching an IPv6 socket show up as ::ffff:a.b.c.d
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+
+        value = int(address)
+        bits = address.max_prefixlen
+        for prefixlen, networks in self.networks[address.version].items():
+            mask = ((1 << prefixlen) - 1) << (bits - prefixlen)
+            if value & mask in networks:
+                return True
+        return False
+
+
+def hash_password(salt, password):
+    return hashlib.sha256(salt + (password or "").encode("utf-8")).digest()
+
+
+class BindAuthCache:
+    """
+    Per-process cache of bind credentials (with the ClientPolicy) and of the
+    compiled IP whitelists, so a reconnect storm doesn't turn into a storm of
+    Postgres queries. Passwords are only kept as salted hashes.
+
+    get_*() never touch the database and return MISS when the caller has to
+    run the matching load_*() (sync, via db_sync_to_async) first.
+    """
+
+    def __init__(self, ttl=AUTH_CACHE_TTL):
+        self.ttl = ttl
+        self.salt = secrets.token_bytes(16)
+        self.credentials = {}  # username -> (loaded at, [(password hash, client)])
+        self.whitelists = {}  # client id -> (loaded at, IpNetworkIndex)
+        self.version = None
+        self.lock = threading.Lock()
+
+    def fresh(self, entry):
+        return entry is not None and time.monotonic() - entry[0] <= self.ttl
+
+    def get_client(self, username, password):
+        """Returns the Client, None for bad credentials, or MISS."""
+        entry = self.credentials.get(username)
+        if not self.fresh(entry):
+            return MISS
+        return self.match_password(entry[1], password)
+
+    def match_password(self, accounts, password):
+        password_hash = hash_password(self.salt, password)
+        for candidate_hash, client in accounts:
+            if hmac.compare_digest(candidate_hash, password_hash):
+                return client
+        return None
+
+    def load_client(self, username):
+        """Reads the accounts of username from Postgres; returns them for match_password."""
+        version = self.version
+        accounts = [
+            (hash_password(self.salt, client.smppPassword), client)
+            for client in Client.objects.select_related("clientPolicy").filter(
+                smppUsername=username, isDeleted=False
+            )
+        ]
+        self.store(self.credentials, username, accounts, version)
+        return accounts
+
+    def get_whitelist(self, client_id):
+        entry = self.whitelists.get(client_id)
+        if not self.fresh(entry):
+            return MISS
+        return entry[1]
+
+    def load_whitelist(self, client_id):
+        version = self.version
+        index = IpNetworkIndex(
+            IpWhitelist.objects.filter(client_id=client_id, isDeleted=False)
+            .values_list("ip", flat=True)
+        )
+        self.store(self.whitelists, client_id, index, version)
+        return index
+
+    def store(self, entries, key, value, version):
+        with self.lock:
+            # Something changed while we were reading it; let the next bind reload
+            if version != self.version:
+                return
+            entries[key] = (time.monotonic(), value)
+
+    def invalidate(self, version=None):
+        with self.lock:
+            self.credentials = {}
+            self.whitelists = {}
+            self.version = version
+
+    async def listen(self):
+        """Background task: drops everything whenever another process bumps the version."""
+        await listen_cache_version(
+            AUTH_VERSION_KEY, AUTH_INVALIDATION_CHANNEL, self.invalidate
+        )
+
+
+def publish_auth_change():
+    """Tells every SMPP process to re-read bind credentials and whitelists."""
+    publish_cache_version(AUTH_VERSION_KEY, AUTH_INVALIDATION_CHANNEL)
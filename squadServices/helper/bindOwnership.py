@@ -0,0 +1,75 @@
+import logging
+import os
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# smpp:vendor_owner:<smpp config id> holds the token of the dispatcher that
+# binds to that vendor; everyone else leaves it alone
+OWNER_KEY_PREFIX = "smpp:vendor_owner:"
+# A dispatcher that stops renewing (crashed) loses its vendors after this long
+OWNER_LEASE_SECONDS = int(os.environ.get("SMPP_VENDOR_OWNER_SECONDS", 30))
+
+# Returns 2 if the key was free and is now ours, 1 if it was ours already
+# (lease renewed), 0 if another dispatcher holds it.
+CLAIM_OWNER_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if not owner then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+    return 2
+end
+if owner == ARGV[1] then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+RELEASE_OWNER_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+CLAIMED = 2
+RENEWED = 1
+HELD_ELSEWHERE = 0
+
+
+class BindOwnership:
+    """
+    Which dispatcher binds to which SMPP config, so several newRunSmpp
+    processes never open more than maxSession binds to one vendor between
+    them, and none resets the bind status of a vendor another one holds.
+    """
+
+    def __init__(self, worker_token, ttl=OWNER_LEASE_SECONDS, client=None):
+        self.worker_token = worker_token
+        self.ttl = ttl
+        self.client = client or redis.Redis(
+            host=os.environ.get("REDIS_HOST", "redis"), port=6379, db=1
+        )
+        self.claim_script = self.client.register_script(CLAIM_OWNER_SCRIPT)
+        self.release_script = self.client.register_script(RELEASE_OWNER_SCRIPT)
+
+    def key(self, smpp_id):
+        return f"{OWNER_KEY_PREFIX}{smpp_id}"
+
+    def claim(self, smpp_id):
+        """CLAIMED, RENEWED or HELD_ELSEWHERE."""
+        return int(
+            self.claim_script(
+                keys=[self.key(smpp_id)], args=[self.worker_token, self.ttl]
+            )
+        )
+
+    def release(self, smpp_ids):
+        for smpp_id in smpp_ids:
+            try:
+                self.release_script(
+                    keys=[self.key(smpp_id)], args=[self.worker_token]
+                )
+            except redis.RedisError as e:
+                logger.warning(f"Could not release vendor {smpp_id}: {e}")
@@ -0,0 +1,50 @@
+import asyncio
+import logging
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# In-process caches of the SMPP server (routes, bind credentials...) are dropped
+# by bumping a version key in Redis and publishing the new value on a channel.
+
+redis_client = redis.StrictRedis.from_url(settings.CELERY_RESULT_BACKEND)
+
+
+def publish_cache_version(version_key, channel):
+    """Bumps the version and tells every listening process about it."""
+    try:
+        version = redis_client.incr(version_key)
+        redis_client.publish(channel, version)
+    except redis.RedisError as e:
+        logger.warning(f"Could not publish {version_key}: {e}")
+
+
+async def listen_cache_version(version_key, channel, on_version):
+    """
+    Background task: calls on_version(version) with the current version once
+    subscribed, then for every published bump. While Redis is unreachable it
+    calls on_version(None) so the cache falls back to its TTL.
+    """
+    while True:
+        client = aioredis.Redis.from_url(settings.CELERY_RESULT_BACKEND)
+        try:
+            async with client.pubsub() as pubsub:
+                await pubsub.subscribe(channel)
+                # Anything published while we were not subscribed is covered by this
+                current = await client.get(version_key)
+                on_version(int(current) if current else 0)
+
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        on_version(int(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Lost Redis while listening on {channel}, retrying: {e}")
+            on_version(None)
+            await asyncio.sleep(2)
+        finally:
+            await client.aclose()
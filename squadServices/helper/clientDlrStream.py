@@ -0,0 +1,107 @@
+import logging
+import os
+
+import redis
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# One Redis stream per SMPP client username. The vendor side (newRunSmpp) adds
+# an event when a message reaches its final status; the SMPP server workers
+# holding a bind for that username read it through a consumer group and push
+# the deliver_sm straight away.
+CLIENT_DLR_STREAM_PREFIX = "smpp:client_dlr:"
+CLIENT_DLR_GROUP = "smpp-server"
+# Per client; anything older is still recovered by the DB polling path
+CLIENT_DLR_STREAM_MAXLEN = 10000
+
+STAT_MAP = {"delivered": "DELIVRD", "failed": "REJECTD"}
+
+# Same Redis db as the SMPP server's buffers and ledger
+redis_client = redis.Redis(
+    host=os.environ.get("REDIS_HOST", "redis"), port=6379, db=1
+)
+
+
+def client_dlr_stream_key(username):
+    return f"{CLIENT_DLR_STREAM_PREFIX}{username}"
+
+
+def format_dlr_date(value):
+    return (value or timezone.now()).strftime("%y%m%d%H%M%S")
+
+
+def build_client_dlr_event(msg, username, status_code, delivered_parts):
+    """
+    Everything send_deliver_sm needs, as flat strings, so the SMPP server
+    can answer without touching the database.
+    """
+    total_parts = int(msg.segmentNumber) if msg.segmentNumber else 1
+    return {
+        "pk": str(msg.pk),
+        "username": username,
+        "message_id": msg.message_id or "",
+        "destination": msg.destination or "",
+        "system_id": msg.systemId or "",
+        "stat": STAT_MAP.get(msg.status, "UNKNOWN"),
+        "err": status_code or "000",
+        "sub": str(total_parts),
+        "dlvrd": str(delivered_parts),
+        "submit_date": format_dlr_date(msg.queued_at),
+        "done_date": format_dlr_date(None),
+        "text": (msg.text or "")[:20],
+    }
+
+
+def client_dlr_entry(msg, status_code, delivered_parts):
+    """(stream key, event) for a message that needs a client DLR, else None."""
+    if not msg.sendClientDlr or msg.clientDlrPushed or msg.status not in STAT_MAP:
+        return None
+    client = msg.client
+    if client is None:
+        return None
+    event = build_client_dlr_event(
+        msg, client.smppUsername, status_code, delivered_parts
+    )
+    return client_dlr_stream_key(client.smppUsername), event
+
+
+def publish_client_dlr(msg, status_code=None, delivered_parts=0):
+    """
+    Queues the client DLR of a message that just reached delivered/failed.
+    msg.client should already be loaded (select_related) to avoid a query.
+    Best effort: if Redis is down the SMPP server's DB recovery poll sends it.
+    """
+    entry = client_dlr_entry(msg, status_code, delivered_parts)
+    if entry is None:
+        return
+    stream_key, event = entry
+    try:
+        redis_client.xadd(
+            stream_key, event, maxlen=CLIENT_DLR_STREAM_MAXLEN, approximate=True
+        )
+    except redis.RedisError as e:
+        logger.warning(f"Could not publish client DLR for message {msg.pk}: {e}")
+
+
+def publish_client_dlrs(messages, status_code=None, delivered_parts=None):
+    """
+    publish_client_dlr for a whole batch in one round trip.
+    delivered_parts maps message pk -> delivered part count (default 0).
+    """
+    delivered_parts = delivered_parts or {}
+    pipe = redis_client.pipeline(transaction=False)
+    queued = 0
+    for msg in messages:
+        entry = client_dlr_entry(msg, status_code, delivered_parts.get(msg.pk, 0))
+        if entry is None:
+            continue
+        stream_key, event = entry
+        pipe.xadd(stream_key, event, maxlen=CLIENT_DLR_STREAM_MAXLEN, approximate=True)
+        queued += 1
+    if not queued:
+        return
+    try:
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not publish {queued} client DLRs: {e}")
@@ -0,0 +1,134 @@
+import logging
+import threading
+import time
+
+import redis
+from django.conf import settings
+
+from squadServices.models.country import Country
+
+logger = logging.getLogger(__name__)
+
+# Every process (SMPP server, Celery worker, API) keeps its own copy of the trie.
+# The API bumps this key whenever a Country changes so the other processes rebuild.
+VERSION_KEY = "squad:country_prefix:version"
+
+# How often (seconds) a process asks Redis whether the countries changed.
+VERSION_CHECK_INTERVAL = 5
+
+# If Redis is unreachable we still rebuild now and then so edits are not lost forever.
+MAX_INDEX_AGE = 300
+
+_TERMINAL = ""  # key that holds the Country on the node where a dial code ends
+
+redis_client = redis.StrictRedis.from_url(settings.CELERY_RESULT_BACKEND)
+
+
+class CountryPrefixIndex:
+    """
+    Immutable prefix trie of Country.countryCode.
+    resolve() walks the digits of the number and returns the Country with the
+    longest matching dial code, without touching the database.
+    """
+
+    __slots__ = ("root", "version", "builtAt")
+
+    def __init__(self, countries, version=None):
+        self.root = {}
+        self.version = version
+        self.builtAt = time.monotonic()
+
+        for country in countries:
+            code = (country.countryCode or "").strip().lstrip("+")
+            if not code.isdigit():
+                continue
+
+            node = self.root
+            for digit in code:
+                node = node.setdefault(digit, {})
+
+            # Countries come in by name, so shared codes (e.g. "1") keep the same
+            # winner the old .first() query used to pick.
+            node.setdefault(_TERMINAL, country)
+
+    def resolve(self, number):
+        """Returns the Country owning the longest dial-code prefix of number, or None."""
+        node = self.root
+        match = None
+        for digit in number:
+            node = node.get(digit)
+            if node is None:
+                break
+            match = node.get(_TERMINAL, match)
+        return match
+
+
+_index = None
+_lock = threading.Lock()
+_last_version_check = 0.0
+
+
+def _read_remote_version():
+    try:
+        value = redis_client.get(VERSION_KEY)
+    except redis.RedisError as e:
+        logger.warning(f"Country prefix version check failed: {e}")
+        return None
+    return int(value) if value else 0
+
+
+def reload_country_prefix_index(version=None):
+    """Builds a fresh trie from the DB and swaps it in with a single assignment."""
+    global _index
+
+    countries = list(Country.objects.filter(isDeleted=False).order_by("name"))
+    new_index = CountryPrefixIndex(countries, version=version)
+    _index = new_index
+    logger.info(f"Country prefix index loaded: {len(countries)} countries (v{version})")
+    return new_index
+
+
+def get_country_prefix_index():
+    """Returns the current trie, rebuilding it when another process bumped the version."""
+    global _last_version_check
+
+    index = _index
+    now = time.monotonic()
+    if index is not None and now - _last_version_check < VERSION_CHECK_INTERVAL:
+        return index
+
+    with _lock:
+        index = _index
+        if index is not None and now - _last_version_check < VERSION_CHECK_INTERVAL:
+            return index
+
+        _last_version_check = now
+        remote_version = _read_remote_version()
+
+        stale = index is None
+        if not stale and remote_version is not None:
+            stale = remote_version != index.version
+        elif not stale:
+            stale = now - index.builtAt > MAX_INDEX_AGE
+
+        if stale:
+            index = reload_country_prefix_index(remote_version)
+        return index
+
+
+def resolve_destination_country(number):
+    """Zero-query replacement for the old 4..1 digit Country.objects.filter loop."""
+    if not number:
+        return None
+    return get_country_prefix_index().resolve(number)
+
+
+def invalidate_country_prefix_index():
+    """Tells every process to rebuild its trie on its next version check."""
+    global _index
+
+    _index = None
+    try:
+        redis_client.incr(VERSION_KEY)
+    except redis.RedisError as e:
+        logger.warning(f"Could not publish country prefix version: {e}")
@@ -0,0 +1,254 @@
+import logging
+import os
+from decimal import Decimal
+
+import redis
+from django.db import transaction
+from django.db.models import F
+
+from squadServices.models.clientModel.client import Client
+from squadServices.models.company import Company
+
+logger = logging.getLogger(__name__)
+
+# Money lives in Redis as integers of 1/10000 (the DB fields have 4 decimal places)
+SCALE = Decimal("10000")
+
+# kind -> (model, used field, limit field)
+ACCOUNT_FIELDS = {
+    "vendor": (Company, "usedVendorCredit", "vendorCreditLimit"),
+    "client": (Client, "usedCredit", "creditLimit"),
+    "customer": (Company, "usedCustomerCredit", "customerCreditLimit"),
+}
+
+ACCOUNTS_SET = "credit:accounts"  # every account seeded into Redis
+
+CREDIT_ERRORS = {
+    1: "Insufficient Vendor Credit Line for multi-part message.",
+    2: "Insufficient Client SMPP Credit Line for multi-part message.",
+    3: "Insufficient Global Company Credit Line for multi-part message.",
+}
+
+# Checks and reserves against all three limits in one atomic step.
+# Returns {1, used1, used2, used3} on success, {0, i} if limit i would be
+# exceeded, or {-1, i} if account i has not been loaded into Redis yet.
+RESERVE_SCRIPT = """
+for i = 1, 3 do
+    if redis.call('EXISTS', KEYS[i]) == 0 then
+        return {-1, i}
+    end
+end
+for i = 1, 3 do
+    local used = tonumber(redis.call('HGET', KEYS[i], 'used'))
+    local limit = tonumber(redis.call('HGET', KEYS[i], 'limit'))
+    if used + tonumber(ARGV[i]) > limit then
+        return {0, i}
+    end
+end
+local balances = {1}
+for i = 1, 3 do
+    balances[i + 1] = redis.call('HINCRBY', KEYS[i], 'used', ARGV[i])
+    redis.call('HINCRBY', KEYS[i], 'pending', ARGV[i])
+end
+return balances
+"""
+
+# Gives a reservation back (the message could not be saved)
+RELEASE_SCRIPT = """
+for i = 1, 3 do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('HINCRBY', KEYS[i], 'used', -tonumber(ARGV[i]))
+        redis.call('HINCRBY', KEYS[i], 'pending', -tonumber(ARGV[i]))
+    end
+end
+return 1
+"""
+
+# Hands the reconciler everything reserved since the last run
+TAKE_PENDING_SCRIPT = """
+local pending = tonumber(redis.call('HGET', KEYS[1], 'pending') or '0')
+redis.call('HSET', KEYS[1], 'pending', 0)
+return pending
+"""
+
+# Re-bases Redis on the Postgres value plus whatever was reserved meanwhile.
+# This also picks up limit changes and manual edits made through the API.
+RESYNC_SCRIPT = """
+redis.call('HSET', KEYS[1], 'used', ARGV[1], 'limit', ARGV[2])
+local pending = redis.call('HGET', KEYS[1], 'pending') or '0'
+return redis.call('HINCRBY', KEYS[1], 'used', pending)
+"""
+
+
+def to_units(amount):
+    return int((Decimal(amount) * SCALE).to_integral_value())
+
+
+def from_units(units):
+    return Decimal(int(units)) / SCALE
+
+
+def account_key(kind, obj_id):
+    return f"credit:{kind}:{obj_id}"
+
+
+def parse_account_key(key):
+    if isinstance(key, bytes):
+        key = key.decode()
+    _, kind, obj_id = key.split(":")
+    return kind, int(obj_id)
+
+
+def load_account_snapshot(kind, obj_id):
+    """Reads (used, limit) of one account from Postgres, in Redis units."""
+    model, used_field, limit_field = ACCOUNT_FIELDS[kind]
+    row = model.objects.filter(id=obj_id).values(used_field, limit_field).first()
+    if row is None:
+        return None
+    return to_units(row[used_field]), to_units(row[limit_field])
+
+
+def get_redis_host():
+    return os.environ.get("REDIS_HOST", "redis")
+
+
+class CreditLedger:
+    """
+    Atomic credit reservations in front of Company.usedVendorCredit,
+    Client.usedCredit and Company.usedCustomerCredit.
+
+    The SMPP server reserves here instead of locking the three Postgres rows.
+    reconcile_credit_ledger() (a Celery beat job) writes the reserved totals back.
+    """
+
+    def __init__(self, redis_client):
+        # A redis.asyncio client (the SMPP server's event loop)
+        self.redis_client = redis_client
+        self.reserve_script = redis_client.register_script(RESERVE_SCRIPT)
+        self.release_script = redis_client.register_script(RELEASE_SCRIPT)
+
+    @staticmethod
+    def keys_for(vendor_company_id, client_id, client_company_id):
+        return [
+            account_key("vendor", vendor_company_id),
+            account_key("client", client_id),
+            account_key("customer", client_company_id),
+        ]
+
+    async def seed(self, key, load_snapshot):
+        """Loads one account from Postgres the first time we see it."""
+        kind, obj_id = parse_account_key(key)
+        snapshot = await load_snapshot(kind, obj_id)
+        if snapshot is None:
+            return False
+        used, limit = snapshot
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            # HSETNX: if another worker seeded it first, keep theirs
+            pipe.hsetnx(key, "used", used)
+            pipe.hsetnx(key, "limit", limit)
+            pipe.hsetnx(key, "pending", 0)
+            pipe.sadd(ACCOUNTS_SET, key)
+            await pipe.execute()
+        return True
+
+    async def reserve(
+        self,
+        vendor_company_id,
+        client_id,
+        client_company_id,
+        vendor_amount,
+        client_amount,
+        load_snapshot,
+    ):
+        """
+        Returns (balances, None) on success, where balances is the used credit of
+        (vendor company, client, client company) after this charge, or (None, error).
+        load_snapshot is an async callable(kind, id) -> (used, limit) in units.
+        """
+        keys = self.keys_for(vendor_company_id, client_id, client_company_id)
+        amounts = [
+            to_units(vendor_amount),
+            to_units(client_amount),
+            to_units(client_amount),
+        ]
+
+        # At most one retry per account that still has to be seeded
+        for _ in range(4):
+            result = await self.reserve_script(keys=keys, args=amounts)
+            status = int(result[0])
+            if status == 1:
+                return tuple(from_units(v) for v in result[1:]), None
+            if status == 0:
+                return None, CREDIT_ERRORS[int(result[1])]
+
+            missing_key = keys[int(result[1]) - 1]
+            if not await self.seed(missing_key, load_snapshot):
+                return None, "Billing account not found."
+
+        return None, "Billing engine could not load credit accounts."
+
+    async def release(
+        self,
+        vendor_company_id,
+        client_id,
+        client_company_id,
+        vendor_amount,
+        client_amount,
+    ):
+        keys = self.keys_for(vendor_company_id, client_id, client_company_id)
+        await self.release_script(
+            keys=keys,
+            args=[
+                to_units(vendor_amount),
+                to_units(client_amount),
+                to_units(client_amount),
+            ],
+        )
+
+
+def reconcile_credit_ledger(redis_client=None):
+    """
+    Writes reserved credit from Redis into Postgres with one F() update per
+    account, then re-bases Redis on the fresh Postgres values and limits.
+    The per-message VendorTransaction/ClientTransaction rows are already
+    written by the SMPP write-behind queue.
+    """
+    if redis_client is None:
+        redis_client = redis.Redis(host=get_redis_host(), port=6379, db=1)
+
+    take_pending = redis_client.register_script(TAKE_PENDING_SCRIPT)
+    resync = redis_client.register_script(RESYNC_SCRIPT)
+
+    applied = 0
+    for key in redis_client.smembers(ACCOUNTS_SET):
+        kind, obj_id = parse_account_key(key)
+        model, used_field, limit_field = ACCOUNT_FIELDS[kind]
+
+        pending = int(take_pending(keys=[key]))
+        try:
+            # One transaction: if anything in it fails, Postgres rolls the
+            # update back too, so putting pending back can't charge it twice
+            with transaction.atomic():
+                if pending:
+                    model.objects.filter(id=obj_id).update(
+                        **{used_field: F(used_field) + from_units(pending)}
+                    )
+                snapshot = load_account_snapshot(kind, obj_id)
+        except Exception:
+            # Put the amount back so the next run retries it
+            redis_client.hincrby(key, "pending", pending)
+            raise
+        if pending:
+            applied += 1
+
+        if snapshot is None:
+            # The account is gone; stop tracking it
+            redis_client.delete(key)
+            redis_client.srem(ACCOUNTS_SET, key)
+            continue
+        used, limit = snapshot
+        resync(keys=[key], args=[used, limit])
+
+    if applied:
+        logger.info(f"Credit ledger reconciled {applied} accounts into Postgres")
+    return applied
@@ -0,0 +1,166 @@
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Threads (= Postgres connections) per SMPP worker process. Keep
+# workers * SMPP_DB_THREADS below the database's max_connections.
+DB_THREADS = int(os.environ.get("SMPP_DB_THREADS", 8))
+# How often the pool logs its queue depth and wait times (seconds, 0 = never)
+DB_STATS_INTERVAL = float(os.environ.get("SMPP_DB_STATS_INTERVAL", 60))
+# A job that waited longer than this for a thread is logged as a warning
+DB_SLOW_WAIT = float(os.environ.get("SMPP_DB_SLOW_WAIT", 0.5))
+
+
+def drop_broken_connections():
+    """
+    Django connections are per thread, so every pool thread keeps its own
+    one open between jobs. After a database error, close it if it no longer
+    works, so the thread's next job reconnects instead of failing too.
+    """
+    for conn in connections.all(initialized_only=True):
+        if conn.connection is not None and not conn.is_usable():
+            conn.close()
+
+
+class DBExecutor:
+    """
+    Runs the SMPP server's ORM calls on a fixed pool of threads instead of
+    sync_to_async's single thread-sensitive one, so sessions of different
+    clients hit Postgres in parallel.
+
+    Each call is one job on one thread, so a transaction.atomic() inside a
+    job behaves exactly as before. Queue depth, wait and run times are kept
+    for stats() and logged every DB_STATS_INTERVAL.
+    """
+
+    def __init__(self, max_workers=DB_THREADS):
+        self.max_workers = max(1, max_workers)
+        self.pool = None
+        self.lock = threading.Lock()
+        self.waiting = 0  # submitted, no free thread yet
+        self.running = 0
+        self.reset_window()
+
+    def reset_window(self):
+        self.completed = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+
+    def get_pool(self):
+        # Created on first use, so a forked SMPP worker gets its own threads
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="smpp-db"
+            )
+        return self.pool
+
+    def reset(self):
+        """After fork: the parent's threads don't exist in the child."""
+        self.pool = None
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.running = 0
+        self.reset_window()
+
+    def job(self, func, submitted_at, args, kwargs):
+        started_at = time.monotonic()
+        waited = started_at - submitted_at
+        with self.lock:
+            self.waiting -= 1
+            self.running += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        if waited > DB_SLOW_WAIT:
+            logger.warning(
+                f"DB job {func.__qualname__} waited {waited:.3f}s for a thread "
+                f"(pool of {self.max_workers})"
+            )
+
+        failed = False
+        try:
+            return func(*args, **kwargs)
+        except DatabaseError:
+            failed = True
+            drop_broken_connections()
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+                self.failed += failed
+                self.run_total += time.monotonic() - started_at
+
+    async def run(self, func, *args, **kwargs):
+        with self.lock:
+            self.waiting += 1
+        return await sync_to_async(
+            self.job, thread_sensitive=False, executor=self.get_pool()
+        )(func, time.monotonic(), args, kwargs)
+
+    def stats(self, reset=False):
+        """Queue depth now, plus job counts and times since the last reset."""
+        with self.lock:
+            completed = self.completed or 1  # averages of an idle window are 0
+            stats = {
+                "threads": self.max_workers,
+                "waiting": self.waiting,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": self.wait_total / completed * 1000,
+                "max_wait_ms": self.wait_max * 1000,
+                "avg_run_ms": self.run_total / completed * 1000,
+            }
+            if reset:
+                self.reset_window()
+        return stats
+
+    async def report_loop(self, interval=DB_STATS_INTERVAL):
+        """Background task of the SMPP worker."""
+        if interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(interval)
+            stats = self.stats(reset=True)
+            logger.info(
+                "DB pool: {waiting} waiting, {running}/{threads} running, "
+                "{completed} done ({failed} failed) in the last interval, "
+                "wait avg {avg_wait_ms:.1f}ms max {max_wait_ms:.1f}ms, "
+                "run avg {avg_run_ms:.1f}ms".format(**stats)
+            )
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.pool = None
+
+
+db_executor = DBExecutor()
+os.register_at_fork(after_in_child=db_executor.reset)
+
+
+def db_sync_to_async(func):
+    """
+    sync_to_async for ORM code of the SMPP server: runs func on the shared
+    DB pool. Works as a decorator on methods too.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await db_executor.run(func, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from squadServices.helper.smppPdu import PDU_HEADER
+
+logger = logging.getLogger(__name__)
+
+CMD_DELIVER_SM = 0x00000005
+
+# Unacked deliver_sm a single bind may have on the wire
+DLR_WINDOW = int(os.environ.get("SMPP_DLR_WINDOW", 10))
+# Seconds to wait for a deliver_sm_resp before sending again
+DLR_RESP_TIMEOUT = float(os.environ.get("SMPP_DLR_RESP_TIMEOUT", 10))
+# Sends after the first one; then the DLR is left to the DB recovery poll
+DLR_MAX_RETRIES = int(os.environ.get("SMPP_DLR_MAX_RETRIES", 3))
+DLR_RETRY_BACKOFF = 1.0  # seconds, doubled on every retry
+
+# deliver_sm_resp statuses that mean "try again later" rather than "never"
+ESME_RMSGQFUL = 0x00000014
+ESME_RTHROTTLED = 0x00000058
+ESME_RSYSERR = 0x00000008
+RETRYABLE_STATUSES = {ESME_RMSGQFUL, ESME_RTHROTTLED, ESME_RSYSERR}
+
+
+class OutboundDlr:
+    __slots__ = ("msg_id", "body", "attempts", "not_before", "deadline")
+
+    def __init__(self, msg_id, body):
+        self.msg_id = msg_id
+        self.body = body
+        self.attempts = 0
+        self.not_before = 0.0  # monotonic time before which we don't resend
+        self.deadline = 0.0  # monotonic time the deliver_sm_resp is due
+
+
+class DeliverSmOutbox:
+    """
+    Outbound deliver_sm queue of one bind. Up to `window` receipts are on the
+    wire at once, each under its own sequence number; whatever fits in the
+    window is written with a single writer.write.
+
+    A receipt only counts as delivered once the client answers ESME_ROK:
+    on_delivered(msg_ids) is then awaited with every id acked since the last
+    call, so the caller can commit clientDlrPushed in one query. Timeouts and
+    throttling are retried with backoff; anything else the client rejects, or
+    that runs out of retries, goes to on_rejected(msg_ids) / is dropped.
+    """
+
+    def __init__(
+        self,
+        writer,
+        on_delivered,
+        on_rejected=None,
+        window=DLR_WINDOW,
+        resp_timeout=DLR_RESP_TIMEOUT,
+        max_retries=DLR_MAX_RETRIES,
+    ):
+        self.writer = writer
+        self.on_delivered = on_delivered
+        self.on_rejected = on_rejected
+        self.window = max(1, window)
+        self.resp_timeout = resp_timeout
+        self.max_retries = max_retries
+        self.pending = deque()
+        self.inflight = {}  # sequence number -> OutboundDlr
+        self.queued_ids = set()  # every msg_id pending or in flight
+        self.acked = []
+        self.rejected = []
+        self.next_seq = 1
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def close(self):
+        """Stops sending; unacked receipts stay unpushed for the recovery poll."""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.commit()
+
+    def enqueue(self, msg_id, body):
+        """Returns False if that message is already queued on this bind."""
+        if msg_id in self.queued_ids:
+            return False
+        self.queued_ids.add(msg_id)
+        self.pending.append(OutboundDlr(msg_id, body))
+        self.wakeup.set()
+        return True
+
+    def handle_resp(self, seq_num, status):
+        """Called by the read loop for every deliver_sm_resp."""
+        dlr = self.inflight.pop(seq_num, None)
+        if dlr is None:
+            return  # late answer to something we already resent or gave up on
+        if status == 0:
+            self.queued_ids.discard(dlr.msg_id)
+            self.acked.append(dlr.msg_id)
+        elif status in RETRYABLE_STATUSES:
+            self.retry(dlr, f"status {hex(status)}")
+        else:
+            logger.warning(
+                f"Client rejected the DLR of message {dlr.msg_id} ({hex(status)})"
+            )
+            self.queued_ids.discard(dlr.msg_id)
+            self.rejected.append(dlr.msg_id)
+        self.wakeup.set()
+
+    def retry(self, dlr, reason):
+        if dlr.attempts > self.max_retries:
+            logger.warning(
+                f"Giving up on the DLR of message {dlr.msg_id} after "
+                f"{dlr.attempts} sends ({reason})"
+            )
+            self.queued_ids.discard(dlr.msg_id)
+            return
+        dlr.not_before = time.monotonic() + DLR_RETRY_BACKOFF * 2 ** (
+            dlr.attempts - 1
+        )
+        self.pending.append(dlr)
+
+    def allocate_seq(self):
+        seq_num = self.next_seq
+        self.next_seq = 1 if seq_num >= 0x7FFFFFFF else seq_num + 1
+        return seq_num
+
+    def expire(self, now):
+        expired = [seq for seq, dlr in self.inflight.items() if dlr.deadline <= now]
+        for seq_num in expired:
+            self.retry(self.inflight.pop(seq_num), "no deliver_sm_resp")
+
+    def take_batch(self, now):
+        """Moves what the window allows from pending to inflight; returns the PDUs."""
+        pdus = []
+        waiting = deque()
+        while self.pending and len(self.inflight) < self.window:
+            dlr = self.pending.popleft()
+            if dlr.not_before > now:
+                waiting.append(dlr)  # still backing off
+                continue
+            seq_num = self.allocate_seq()
+            dlr.attempts += 1
+            dlr.deadline = now + self.resp_timeout
+            self.inflight[seq_num] = dlr
+            pdus.append(
+                PDU_HEADER.pack(16 + len(dlr.body), CMD_DELIVER_SM, 0, seq_num)
+                + dlr.body
+            )
+        waiting.extend(self.pending)
+        self.pending = waiting
+        return pdus
+
+    def next_wakeup(self, now):
+        due = [dlr.deadline for dlr in self.inflight.values()]
+        if len(self.inflight) < self.window:
+            due.extend(dlr.not_before for dlr in self.pending)
+        return max(0.0, min(due) - now) if due else None
+
+    async def commit(self):
+        if self.acked:
+            acked, self.acked = self.acked, []
+            await self.on_delivered(acked)
+        if self.rejected:
+            rejected, self.rejected = self.rejected, []
+            if self.on_rejected is not None:
+                await self.on_rejected(rejected)
+
+    async def run(self):
+        while True:
+            try:
+                # Cleared first, so an enqueue/resp during the awaits below isn't lost
+                self.wakeup.clear()
+                now = time.monotonic()
+                self.expire(now)
+                pdus = self.take_batch(now)
+                if pdus:
+                    # ⚡️ One write (and one drain) for the whole batch
+                    async with self.writer.write_lock:
+                        self.writer.write(b"".join(pdus))
+                        await self.writer.drain()
+                await self.commit()
+
+                try:
+                    await asyncio.wait_for(
+                        self.wakeup.wait(), timeout=self.next_wakeup(time.monotonic())
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except (ConnectionError, OSError) as e:
+                logger.warning(f"DLR outbox stopped, connection lost: {e}")
+                return
+            except Exception as e:
+                logger.error(f"DLR outbox error: {e}")
+                await asyncio.sleep(1)
@@ -0,0 +1,243 @@
+import atexit
+import base64
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# "snowflake": 13-char, time-ordered (default)
+# "uuid4":     the old random 36-char ids
+MESSAGE_ID_FORMAT = os.environ.get("SMPP_MESSAGE_ID_FORMAT", "snowflake")
+
+# Fix the node per process (0-1023) if you don't want it allocated from Redis
+NODE_ID = os.environ.get("SMPP_NODE_ID")
+
+# 64-bit snowflake: 42 bits of milliseconds since EPOCH_MS (good until ~2163),
+# 10 bits of node, 12 bits of per-millisecond sequence
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+# base32hex (0-9A-V) keeps the order of the digits, and with a fixed width of
+# 13 characters the string sorts exactly like the number, so index inserts
+# stay at the end of the B-tree
+ID_LENGTH = 13
+
+NODE_COUNTER_KEY = "smpp:message_id:node"
+# smpp:message_id:node:<n> holds the token of the process using node n
+NODE_LEASE_PREFIX = "smpp:message_id:node:"
+# A process that stops renewing its node loses it after this long (seconds)
+NODE_LEASE_SECONDS = int(os.environ.get("SMPP_NODE_LEASE_SECONDS", 60))
+
+RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class NodeLeaseError(RuntimeError):
+    """No message id node could be leased and SMPP_NODE_ID is not set."""
+
+
+def encode_id(value):
+    # 64 bits -> 13 base32 digits (the last one padded with a zero bit)
+    return base64.b32hexencode(value.to_bytes(8, "big"))[:ID_LENGTH].decode()
+
+
+def decode_id(message_id):
+    return int.from_bytes(base64.b32hexdecode(message_id + "==="), "big")
+
+
+def get_redis_client():
+    return redis.Redis(host=os.environ.get("REDIS_HOST", "redis"), port=6379, db=1)
+
+
+class NodeLease:
+    """
+    One node (0-1023) held in Redis with SET NX EX, so no two live processes
+    ever share it, however many have come and gone. A daemon thread renews
+    it every third of the lease; if the lease is lost anyway (Redis flushed,
+    process stalled past the TTL), on_lost is called and the generator takes
+    a new node before its next id.
+    """
+
+    def __init__(self, on_lost=None, ttl=NODE_LEASE_SECONDS, client=None):
+        self.on_lost = on_lost
+        self.ttl = ttl
+        self.client = client
+        self.node_id = None
+        self.token = None
+        self.renewed_at = None  # monotonic time the current node was last confirmed
+        self.pid = os.getpid()
+        self.stop = threading.Event()
+        self.thread = None
+
+    def key(self, node_id):
+        return f"{NODE_LEASE_PREFIX}{node_id}"
+
+    def acquire(self):
+        if self.client is None:
+            self.client = get_redis_client()
+        token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # The counter only spreads processes over the slots; the lease decides
+        start = self.client.incr(NODE_COUNTER_KEY) - 1
+        for offset in range(MAX_NODE + 1):
+            node_id = (start + offset) & MAX_NODE
+            if self.client.set(self.key(node_id), token, nx=True, ex=self.ttl):
+                # Stamped first, so the heartbeat never pairs it with an old node
+                self.renewed_at = time.monotonic()
+                self.node_id, self.token = node_id, token
+                self.start_heartbeat()
+                return node_id
+        raise NodeLeaseError(f"All {MAX_NODE + 1} message id nodes are leased")
+
+    def start_heartbeat(self):
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self.heartbeat, name="message-id-lease", daemon=True
+            )
+            self.thread.start()
+            atexit.register(self.release)
+
+    def heartbeat(self):
+        while not self.stop.wait(self.ttl / 3):
+            node_id, token = self.node_id, self.token
+            if node_id is None:
+                continue
+            try:
+                held = self.client.eval(
+                    RENEW_LEASE_SCRIPT, 1, self.key(node_id), token, self.ttl
+                )
+                if held:
+                    self.renewed_at = time.monotonic()
+            except redis.RedisError as e:
+                logger.warning(f"Could not renew message id node {node_id}: {e}")
+                # Still ours until the TTL runs out
+                held = time.monotonic() - self.renewed_at < self.ttl
+            if not held:
+                logger.error(f"Lost the lease on message id node {node_id}")
+                if self.node_id == node_id:
+                    self.node_id = self.token = None
+                if self.on_lost is not None:
+                    self.on_lost(node_id)
+
+    def release(self):
+        # atexit handlers survive fork: only the process that leased it lets go
+        if self.node_id is None or os.getpid() != self.pid:
+            return
+        self.stop.set()
+        try:
+            self.client.eval(
+                RELEASE_LEASE_SCRIPT, 1, self.key(self.node_id), self.token
+            )
+        except redis.RedisError:
+            pass  # it expires on its own
+        self.node_id = self.token = None
+
+
+def allocate_node_id(lease):
+    """
+    SMPP_NODE_ID if set, else a node leased in Redis, so every worker
+    process (SMPP server or Celery) has its own. Without either, refuses:
+    a guessed node could repeat another process's message ids.
+    """
+    if NODE_ID is not None:
+        return int(NODE_ID) & MAX_NODE
+    try:
+        return lease.acquire()
+    except redis.RedisError as e:
+        raise NodeLeaseError(
+            f"Could not lease a message id node from Redis ({e}); "
+            "set SMPP_NODE_ID to run without it"
+        ) from e
+
+
+class SnowflakeIdGenerator:
+    """
+    Short, strictly increasing ids for one process. The node keeps processes
+    apart; within a process a lock-protected (millisecond, sequence) pair
+    never repeats, even if the clock steps back or 4096 ids are asked for in
+    one millisecond (the id then borrows the next millisecond).
+    """
+
+    def __init__(self, node_id=None):
+        self.node_id = node_id
+        self.last_ms = 0
+        self.sequence = 0
+        self.lock = threading.Lock()
+        self.lease = NodeLease(on_lost=self.drop_node)
+
+    def reset(self):
+        """After fork: the child must not reuse the parent's node."""
+        self.node_id = None
+        self.last_ms = 0
+        self.sequence = 0
+        self.lock = threading.Lock()
+        self.lease = NodeLease(on_lost=self.drop_node)
+
+    def drop_node(self, node_id):
+        """The lease is gone: lease a new node before the next id."""
+        with self.lock:
+            if self.node_id == node_id:
+                self.node_id = None
+
+    def ensure_node(self):
+        """Allocates the node up front, so the first id doesn't block on Redis."""
+        if self.node_id is None:
+            self.node_id = allocate_node_id(self.lease)
+        return self.node_id
+
+    def next_int(self):
+        with self.lock:
+            self.ensure_node()
+            now_ms = max(int(time.time() * 1000) - EPOCH_MS, self.last_ms)
+            if now_ms == self.last_ms:
+                self.sequence = (self.sequence + 1) & MAX_SEQUENCE
+                if self.sequence == 0:
+                    now_ms += 1
+            else:
+                self.sequence = 0
+            self.last_ms = now_ms
+            return (
+                (now_ms << (NODE_BITS + SEQUENCE_BITS))
+                | (self.node_id << SEQUENCE_BITS)
+                | self.sequence
+            )
+
+    def __call__(self):
+        return encode_id(self.next_int())
+
+
+def uuid4_id():
+    return str(uuid.uuid4())
+
+
+snowflake_ids = SnowflakeIdGenerator()
+os.register_at_fork(after_in_child=snowflake_ids.reset)
+
+GENERATORS = {
+    "snowflake": snowflake_ids,
+    "uuid4": uuid4_id,
+}
+
+
+def new_message_id():
+    """The id given to a new SMSMessage (and echoed in submit_sm_resp / DLRs)."""
+    return GENERATORS.get(MESSAGE_ID_FORMAT, snowflake_ids)()
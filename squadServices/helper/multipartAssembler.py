@@ -0,0 +1,98 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# "redis":  parts of one message may arrive on any SMPP process/bind
+# "memory": single-node deployments; parts wait in this process only
+MULTIPART_BACKEND = os.environ.get("SMPP_MULTIPART_BACKEND", "redis")
+
+# ⚡️ 5-MINUTE AUTO KILL SWITCH (Solves Frankenstein Collisions!)
+MULTIPART_TTL = int(os.environ.get("SMPP_MULTIPART_TTL", 300))
+
+# Incomplete messages kept by the memory backend; the oldest are dropped first
+MAX_LOCAL_MESSAGES = int(os.environ.get("SMPP_MULTIPART_LOCAL_MAX", 10000))
+
+# Stores one part and, if it was the last missing one, returns all payloads in
+# order and deletes the buffer, all in one round trip. Fields are the part
+# numbers plus "total"; resending a part just overwrites it.
+# KEYS[1] = buffer, ARGV = part number, total parts, payload, ttl (s).
+# Returns nil while parts are missing.
+STORE_PART_SCRIPT = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3], 'total', ARGV[2])
+local total = tonumber(ARGV[2])
+if redis.call('HLEN', KEYS[1]) - 1 < total then
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    return nil
+end
+local parts = {}
+for i = 1, total do
+    local part = redis.call('HGET', KEYS[1], tostring(i))
+    if not part then
+        redis.call('EXPIRE', KEYS[1], ARGV[4])
+        return nil
+    end
+    parts[i] = part
+end
+redis.call('DEL', KEYS[1])
+return parts
+"""
+
+
+def buffer_key(system_id, destination, ref_num):
+    return f"smpp:buffer:{system_id}:{destination}:{ref_num}"
+
+
+class MultipartAssembler:
+    """
+    Collects the raw payload bytes of concatenated SUBMIT_SM parts (UDH
+    already stripped) and hands back the complete, ordered list exactly once,
+    to whichever call stores the last part. Nothing is decoded here, so binary
+    and UCS-2 messages are decoded once, as a whole, by the caller.
+    """
+
+    def __init__(self, redis_client=None, backend=MULTIPART_BACKEND):
+        # The client must not decode responses: the payloads are raw bytes
+        self.redis_client = redis_client if backend == "redis" else None
+        self.script = (
+            self.redis_client.register_script(STORE_PART_SCRIPT)
+            if self.redis_client is not None
+            else None
+        )
+        self.local = OrderedDict()  # key -> (created at, {part number: payload})
+
+    async def add_part(self, key, total_parts, part_num, payload):
+        """Returns [payload of part 1..total] when complete, else None."""
+        if self.script is not None:
+            try:
+                return await self.script(
+                    keys=[key], args=[part_num, total_parts, payload, MULTIPART_TTL]
+                )
+            except redis.RedisError as e:
+                # Parts already in Redis are lost for this message, but new
+                # messages still get stitched as long as they stay on this process
+                logger.warning(f"Redis multipart buffer unavailable, using memory: {e}")
+
+        return self.add_local_part(key, total_parts, part_num, payload)
+
+    def add_local_part(self, key, total_parts, part_num, payload):
+        now = time.monotonic()
+        entry = self.local.get(key)
+        if entry is None or now - entry[0] > MULTIPART_TTL:
+            entry = (now, {})
+            self.local[key] = entry
+            while len(self.local) > MAX_LOCAL_MESSAGES:
+                self.local.popitem(last=False)
+        parts = entry[1]
+        parts[part_num] = payload
+
+        if len(parts) < total_parts or any(
+            i not in parts for i in range(1, total_parts + 1)
+        ):
+            return None
+        del self.local[key]
+        return [parts[i] for i in range(1, total_parts + 1)]
@@ -0,0 +1,165 @@
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from squadServices.helper.staleMessageSweeper import (
+    SWEEP_CHUNK_SIZE,
+    format_sql,
+    run_returning,
+)
+from squadServices.models.smpp.smppSMS import SMSMessage, SMSMessagePart
+
+logger = logging.getLogger(__name__)
+
+# How long a dispatcher may hold a claimed part without renewing it (seconds).
+# Must cover the wait for a window slot plus the submit_sm_resp timeout.
+CLAIM_LEASE_SECONDS = int(os.environ.get("SMPP_CLAIM_LEASE_SECONDS", 120))
+
+# Comma-separated SMPP config ids this dispatcher serves; empty = all of them.
+# Lets you run one newRunSmpp per vendor (or per group of vendors).
+DISPATCH_SMPP_IDS = frozenset(
+    int(smpp_id)
+    for smpp_id in os.environ.get("SMPP_DISPATCH_SMPP_IDS", "").split(",")
+    if smpp_id.strip()
+)
+
+# Moves one batch of QUEUED parts to CLAIMED for one dispatcher, oldest
+# message first. Rows another dispatcher is claiming right now are skipped,
+# so concurrent claims never overlap and never wait on each other.
+CLAIM_PARTS_SQL = """
+UPDATE {part} SET {status} = 'CLAIMED', {claimed_by} = %s,
+    {expires} = %s, {updated_at} = %s
+WHERE {part_pk} IN (
+    SELECT p.{part_pk} FROM {part} p
+    JOIN {message} m ON m.{message_pk} = p.{message_fk}
+    WHERE p.{status} = 'QUEUED' AND ({smpp_filter})
+    ORDER BY m.{created_at}, p.{part_no}
+    LIMIT %s
+    FOR UPDATE OF p SKIP LOCKED
+)
+RETURNING {part_pk}
+"""
+
+RELEASE_EXPIRED_SQL = """
+UPDATE {table} SET {status} = 'QUEUED', {claimed_by} = NULL,
+    {expires} = NULL, {updated_at} = %s
+WHERE {pk} IN (
+    SELECT {pk} FROM {table}
+    WHERE {status} = 'CLAIMED' AND {expires} <= %s
+    ORDER BY {pk}
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING {pk}
+"""
+
+
+def dispatcher_token():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_sql(include_unrouted):
+    quote = connection.ops.quote_name
+    part_field = lambda name: quote(SMSMessagePart._meta.get_field(name).column)
+    message_smpp = f"m.{quote(SMSMessage._meta.get_field('smpp').column)}"
+    smpp_filter = f"{message_smpp} = ANY(%s)"
+    if include_unrouted:
+        smpp_filter += f" OR {message_smpp} IS NULL"
+    return CLAIM_PARTS_SQL.format(
+        part=quote(SMSMessagePart._meta.db_table),
+        part_pk=quote(SMSMessagePart._meta.pk.column),
+        message=quote(SMSMessage._meta.db_table),
+        message_pk=quote(SMSMessage._meta.pk.column),
+        message_fk=part_field("message"),
+        status=part_field("submit_status"),
+        claimed_by=part_field("claimed_by"),
+        expires=part_field("claim_expires_at"),
+        updated_at=part_field("updated_at"),
+        part_no=part_field("part_no"),
+        created_at=quote(SMSMessage._meta.get_field("createdAt").column),
+        smpp_filter=smpp_filter,
+    )
+
+
+def claim_parts(worker, limit, smpp_ids, include_unrouted=False):
+    """
+    Claims up to `limit` QUEUED parts of messages routed through smpp_ids
+    (plus those with no SMPP config at all if include_unrouted) for worker,
+    and returns them with their message and SMPP config loaded.
+    """
+    if limit <= 0 or not (smpp_ids or include_unrouted):
+        return []
+    now = timezone.now()
+    with transaction.atomic():
+        part_ids = run_returning(
+            claim_sql(include_unrouted),
+            [
+                worker,
+                now + timedelta(seconds=CLAIM_LEASE_SECONDS),
+                now,
+                list(smpp_ids),
+                limit,
+            ],
+        )
+    if not part_ids:
+        return []
+    return list(
+        SMSMessagePart.objects.filter(id__in=part_ids)
+        .select_related("message", "message__smpp")
+        .order_by("message__createdAt", "part_no")
+    )
+
+
+def renew_claims(worker):
+    """Pushes out the lease of everything worker still holds; one UPDATE."""
+    return SMSMessagePart.objects.filter(
+        claimed_by=worker, submit_status="CLAIMED"
+    ).update(
+        claim_expires_at=timezone.now() + timedelta(seconds=CLAIM_LEASE_SECONDS)
+    )
+
+
+def release_claims(worker):
+    """Clean shutdown: hands worker's unsent parts back to the queue."""
+    return SMSMessagePart.objects.filter(
+        claimed_by=worker, submit_status="CLAIMED"
+    ).update(
+        submit_status="QUEUED",
+        claimed_by=None,
+        claim_expires_at=None,
+        updated_at=timezone.now(),
+    )
+
+
+def release_expired_claims(chunk_size=SWEEP_CHUNK_SIZE):
+    """
+    Puts parts whose dispatcher died (lease not renewed) back in the queue,
+    a chunk at a time. A part that dispatcher had already submitted, but whose
+    resp it never recorded, is sent again: at-least-once, never lost.
+    """
+    sql = format_sql(
+        RELEASE_EXPIRED_SQL,
+        SMSMessagePart,
+        status="submit_status",
+        claimed_by="claimed_by",
+        expires="claim_expires_at",
+        updated_at="updated_at",
+    )
+    released = 0
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            part_ids = run_returning(sql, [now, now, chunk_size])
+        released += len(part_ids)
+        if len(part_ids) < chunk_size:
+            break
+
+    if released:
+        logger.warning(
+            f"Released {released} message parts whose dispatcher stopped renewing its claim."
+        )
+    return released
@@ -0,0 +1,112 @@
+import logging
+import os
+import time
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# "memory": every SMPP process enforces the limit on its own
+# "redis":  all processes share one bucket per key (cluster-wide TPS)
+RATE_LIMIT_BACKEND = os.environ.get("SMPP_RATE_LIMIT_BACKEND", "memory")
+
+# Bucket key: "client" (all binds of a client share the TPS) or "session" (per bind)
+RATE_LIMIT_SCOPE = os.environ.get("SMPP_RATE_LIMIT_SCOPE", "client")
+
+# > 0 gives every destination prefix of that many digits its own bucket
+RATE_LIMIT_PREFIX_DIGITS = int(os.environ.get("SMPP_RATE_LIMIT_PREFIX_DIGITS", 0))
+
+# Idle buckets are refilled anyway, so past this many we drop the full ones
+MAX_LOCAL_BUCKETS = 10000
+
+# Refills the bucket for the time since the last call and takes `cost` tokens.
+# Uses the Redis clock so every SMPP process sees the same time.
+# ARGV: rate (tokens/s), burst (bucket size), cost. Returns 1 if allowed, 0 if empty.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return allowed
+"""
+
+
+class TokenBucketLimiter:
+    """
+    Token bucket per key: refills at `rate` tokens per second up to `burst`.
+    A client may send `burst` messages at once, then `rate` per second, and is
+    only throttled when its bucket is really empty (no double bursts at
+    second boundaries like the old fixed-window counter).
+    """
+
+    def __init__(self, redis_client=None, backend=RATE_LIMIT_BACKEND):
+        # key -> [tokens, last refill (monotonic)]
+        self.buckets = {}
+        self.redis_client = redis_client if backend == "redis" else None
+        self.script = (
+            self.redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+            if self.redis_client is not None
+            else None
+        )
+
+    @staticmethod
+    def build_key(client_obj, session_id=None, destination=None):
+        key = f"tps:{client_obj.id}"
+        if RATE_LIMIT_SCOPE == "session" and session_id:
+            key += f":s{session_id}"
+        if RATE_LIMIT_PREFIX_DIGITS > 0 and destination:
+            key += f":p{destination.lstrip('+')[:RATE_LIMIT_PREFIX_DIGITS]}"
+        return key
+
+    def allow_local(self, key, rate, burst, cost=1):
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= MAX_LOCAL_BUCKETS:
+                self.prune(now)
+            bucket = self.buckets[key] = [float(burst), now]
+
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens < cost:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - cost
+        return True
+
+    def prune(self, now):
+        for key, (tokens, updated) in list(self.buckets.items()):
+            # Anything idle for a few seconds is full again; forgetting it changes nothing
+            if now - updated > 10:
+                del self.buckets[key]
+
+    async def allow(self, key, rate, burst=0, cost=1):
+        """Returns True if allowed, False if the bucket is empty. rate 0 = unlimited."""
+        if rate <= 0:
+            return True
+        burst = max(burst or rate, cost)
+
+        if self.script is not None:
+            try:
+                return bool(await self.script(keys=[key], args=[rate, burst, cost]))
+            except redis.RedisError as e:
+                # Keep throttling per process rather than letting everything through
+                logger.warning(f"Redis rate limiter unavailable, using local bucket: {e}")
+
+        return self.allow_local(key, rate, burst, cost)
@@ -0,0 +1,95 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from squadServices.helper.cacheInvalidation import (
+    listen_cache_version,
+    publish_cache_version,
+)
+
+logger = logging.getLogger(__name__)
+
+# Bumped (and published) whenever a route, a rate or a vendor's rate plan changes
+ROUTE_VERSION_KEY = "squad:route_cache:version"
+ROUTE_INVALIDATION_CHANNEL = "squad:route_cache:invalidate"
+
+ROUTE_CACHE_SIZE = int(os.environ.get("SMPP_ROUTE_CACHE_SIZE", 10000))
+# Safety net in case an invalidation message is lost while Redis reconnects
+ROUTE_CACHE_TTL = int(os.environ.get("SMPP_ROUTE_CACHE_TTL", 300))
+
+
+def route_facts(route_data):
+    """
+    Keeps only what routing decided (ids, names and prices) from a
+    get_route_and_cost() result. No model instances, so nothing in the cache
+    goes stale behind our back (e.g. the credit counters of terminatingCompany).
+    """
+    return {
+        "route_id": route_data["route_id"],
+        "vendor_id": route_data["vendor"].id,
+        "vendor_name": route_data["vendor"].profileName,
+        "smpp_id": route_data["smpp"].id if route_data["smpp"] else None,
+        "terminating_company_id": route_data["terminatingCompany"].id,
+        "vendor_cost": route_data["vendor_cost"],
+        "client_cost": route_data["client_cost"],
+        "country_code": route_data["country_code"],
+        "mnc": route_data["mnc"],
+    }
+
+
+class RouteCache:
+    """
+    Bounded LRU of route facts keyed by (client id, country code).
+    All entries belong to one route version; a new version empties it.
+    Used from the sync_to_async thread and the event loop, hence the lock.
+    """
+
+    def __init__(self, max_size=ROUTE_CACHE_SIZE, ttl=ROUTE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (facts, stored at)
+        self.version = None
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Returns (copy of the facts or None, version to pass back to put)."""
+        with self.lock:
+            version = self.version
+            entry = self.entries.get(key)
+            if entry is None:
+                return None, version
+            facts, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self.entries[key]
+                return None, version
+            self.entries.move_to_end(key)
+            return dict(facts), version
+
+    def put(self, key, facts, version):
+        with self.lock:
+            # The routes changed while we were querying them; don't cache the old answer
+            if version != self.version:
+                return
+            self.entries[key] = (facts, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, version=None):
+        with self.lock:
+            self.entries.clear()
+            self.version = version
+        logger.info(f"Route cache cleared (v{version})")
+
+    async def listen(self):
+        """Background task: empties the cache whenever another process bumps the version."""
+        await listen_cache_version(
+            ROUTE_VERSION_KEY, ROUTE_INVALIDATION_CHANNEL, self.invalidate
+        )
+
+
+def publish_route_change():
+    """Tells every SMPP process to forget its cached routes."""
+    publish_cache_version(ROUTE_VERSION_KEY, ROUTE_INVALIDATION_CHANNEL)
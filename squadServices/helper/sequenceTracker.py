@@ -0,0 +1,133 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+
+# Expired sequence numbers remembered per bind, to recognise late resps
+LATE_MEMORY = 1024
+
+
+class PendingRequest:
+    __slots__ = ("future", "tick", "cmd_id", "context")
+
+    def __init__(self, future, tick, cmd_id, context):
+        self.future = future
+        self.tick = tick
+        self.cmd_id = cmd_id
+        self.context = context
+
+
+class SequenceTracker:
+    """
+    The requests one bind has on the wire, by sequence number, each waiting
+    for its resp until a deadline.
+
+    Deadlines sit in a timer wheel: one slot per `resolution` seconds, as many
+    slots as the longest timeout needs. expire() (called every tick) only
+    looks at the slots whose time has come, so a thousand submits in flight
+    cost one loop timer, not a thousand. A request that times out is removed
+    at once, and its sequence number is remembered (the last LATE_MEMORY of
+    them) so a resp that turns up afterwards is reported as late instead of
+    vanishing. Nothing else is kept, so memory stays flat however many
+    resps the vendor loses.
+    """
+
+    def __init__(self, timeout, resolution=0.5, late_memory=LATE_MEMORY):
+        self.resolution = resolution
+        self.slots = [{} for _ in range(math.ceil(timeout / resolution) + 2)]
+        self.pending = {}  # sequence number -> PendingRequest
+        self.expired = OrderedDict()  # sequence number -> (cmd_id, context)
+        self.late_memory = late_memory
+        self.last_tick = self.tick_at(time.monotonic())
+        self.sent = 0
+        self.answered = 0
+        self.timed_out = 0
+        self.late = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def tick_at(self, now):
+        return math.floor(now / self.resolution)
+
+    def add(self, seq_num, timeout, cmd_id=None, context=None):
+        """Starts waiting for seq_num's resp; returns the future it resolves."""
+        # Never less than a tick away, never past the end of the wheel
+        ticks = min(
+            max(1, math.ceil(timeout / self.resolution)), len(self.slots) - 1
+        )
+        tick = max(self.tick_at(time.monotonic()) + ticks, self.last_tick + 1)
+        future = asyncio.get_running_loop().create_future()
+        request = PendingRequest(future, tick, cmd_id, context)
+        self.pending[seq_num] = request
+        self.slots[tick % len(self.slots)][seq_num] = request
+        self.sent += 1
+        return future
+
+    def discard(self, seq_num):
+        request = self.pending.pop(seq_num, None)
+        if request is not None:
+            self.slots[request.tick % len(self.slots)].pop(seq_num, None)
+        return request
+
+    def resolve(self, seq_num, result):
+        """A resp arrived; False if nothing on the wire has that number."""
+        request = self.discard(seq_num)
+        if request is None:
+            return False
+        self.answered += 1
+        if not request.future.done():
+            request.future.set_result(result)
+        return True
+
+    def pop_expired(self, seq_num):
+        """(cmd_id, context) of a request that timed out, if seq_num was one."""
+        entry = self.expired.pop(seq_num, None)
+        if entry is not None:
+            self.late += 1
+        return entry
+
+    def expire(self, now=None):
+        """Times out everything whose deadline has passed; returns how many."""
+        now_tick = self.tick_at(time.monotonic() if now is None else now)
+        expired = 0
+        # After a long stall, one lap of the wheel already covers every slot
+        first_tick = max(self.last_tick + 1, now_tick - len(self.slots) + 1)
+        for tick in range(first_tick, now_tick + 1):
+            slot = self.slots[tick % len(self.slots)]
+            for seq_num, request in list(slot.items()):
+                if request.tick > now_tick:
+                    continue
+                del slot[seq_num]
+                del self.pending[seq_num]
+                self.remember_expired(seq_num, request)
+                if not request.future.done():
+                    request.future.set_exception(asyncio.TimeoutError())
+                expired += 1
+        self.last_tick = max(self.last_tick, now_tick)
+        self.timed_out += expired
+        return expired
+
+    def remember_expired(self, seq_num, request):
+        self.expired[seq_num] = (request.cmd_id, request.context)
+        if len(self.expired) > self.late_memory:
+            self.expired.popitem(last=False)
+
+    def close(self, error):
+        """The bind is gone: everyone still waiting gets error."""
+        pending, self.pending = self.pending, {}
+        for slot in self.slots:
+            slot.clear()
+        self.expired.clear()
+        for request in pending.values():
+            if not request.future.done():
+                request.future.set_exception(error)
+
+    def stats(self):
+        return {
+            "in_flight": len(self.pending),
+            "sent": self.sent,
+            "answered": self.answered,
+            "timed_out": self.timed_out,
+            "late": self.late,
+        }
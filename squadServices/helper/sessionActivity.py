@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import os
+import uuid
+
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.utils import timezone
+
+from squadServices.helper.dbExecutor import db_sync_to_async
+from squadServices.models.clientModel.client import Client, ClientSession
+
+logger = logging.getLogger(__name__)
+
+# How often the buffered session/bind changes are written (seconds)
+SESSION_FLUSH_INTERVAL = float(os.environ.get("SMPP_SESSION_FLUSH_INTERVAL", 5))
+
+BIND_TYPES = {
+    0x00000001: "RECEIVER",
+    0x00000002: "TRANSMITTER",
+    0x00000009: "TRANSCEIVER",
+}
+
+
+class SessionActivityBuffer:
+    """
+    Keeps bind/unbind and enquire_link activity of one SMPP worker in memory
+    and writes it every SESSION_FLUSH_INTERVAL: one INSERT for the new
+    ClientSession rows, one UPDATE for the activity timestamps, one for the
+    closed sessions and one per bindStatus value. The dashboard gets a single
+    status_change per client with its latest status.
+
+    Everything but flush() runs on the event loop; flush() swaps the buffers
+    before it leaves the loop, so no locking is needed.
+    """
+
+    def __init__(self, interval=SESSION_FLUSH_INTERVAL):
+        self.interval = interval
+        self.opened = {}  # session id -> unsaved ClientSession
+        self.touched = set()  # session ids with activity since the last flush
+        self.closed = set()
+        self.bind_status = {}  # client id -> (username, "ONLINE"/"OFFLINE")
+
+    def open_session(self, client_obj, system_id, bind_cmd_id, ip, port):
+        """Returns the id of the ClientSession row the next flush creates."""
+        session = ClientSession(
+            sessionId=str(uuid.uuid4()),
+            client_id=client_obj.id,
+            systemId=system_id,
+            bindType=BIND_TYPES.get(bind_cmd_id, "UNKNOWN"),
+            remoteIp=ip,
+            remotePort=port,
+            status="ONLINE",
+        )
+        self.opened[session.sessionId] = session
+        return session.sessionId
+
+    def touch(self, session_id):
+        if session_id:
+            self.touched.add(session_id)
+
+    def close_session(self, session_id):
+        if not session_id:
+            return
+        session = self.opened.get(session_id)
+        if session is not None:
+            # Never written yet; insert it as it ends up
+            session.status = "OFFLINE"
+        else:
+            self.closed.add(session_id)
+        self.touched.discard(session_id)
+
+    def set_bind_status(self, client_obj, username, status):
+        # Only the latest status of a client is worth a write
+        self.bind_status[client_obj.id] = (username, status)
+
+    def take(self):
+        batch = (self.opened, self.touched, self.closed, self.bind_status)
+        self.opened, self.touched, self.closed, self.bind_status = {}, set(), set(), {}
+        return batch
+
+    def put_back(self, batch):
+        """A failed flush: merge its changes under anything newer."""
+        opened, touched, closed, bind_status = batch
+        self.opened = {**opened, **self.opened}
+        self.touched |= touched - self.closed
+        self.closed |= closed
+        self.bind_status = {**bind_status, **self.bind_status}
+
+    def write(self, batch):
+        opened, touched, closed, bind_status = batch
+        now = timezone.now()
+        with transaction.atomic():
+            if opened:
+                for session in opened.values():
+                    session.last_activityAt = now
+                ClientSession.objects.bulk_create(opened.values())
+            touched -= opened.keys()
+            if touched:
+                ClientSession.objects.filter(sessionId__in=touched).update(
+                    last_activityAt=now
+                )
+            if closed:
+                ClientSession.objects.filter(sessionId__in=closed).update(
+                    status="OFFLINE", last_activityAt=now
+                )
+            for status in ("ONLINE", "OFFLINE"):
+                client_ids = [
+                    client_id
+                    for client_id, (_, client_status) in bind_status.items()
+                    if client_status == status
+                ]
+                if client_ids:
+                    Client.objects.filter(id__in=client_ids).update(bindStatus=status)
+
+    async def flush(self):
+        batch = self.take()
+        opened, touched, closed, bind_status = batch
+        if not (opened or touched or closed or bind_status):
+            return
+        try:
+            await db_sync_to_async(self.write)(batch)
+        except Exception as e:
+            logger.error(f"Session activity flush failed, retrying next round: {e}")
+            self.put_back(batch)
+            return
+
+        # BROADCAST THE BIND STATUS TO THE FRONTEND (latest one per client)
+        channel_layer = get_channel_layer()
+        for username, status in bind_status.values():
+            await channel_layer.group_send(
+                "dashboard_updates",
+                {
+                    "type": "status_change",  # This triggers the status_change function in consumers.py!
+                    "username": username,
+                    "status": status,
+                },
+            )
+
+    async def run(self):
+        """Background task of the SMPP worker."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Session activity flush error: {e}")
@@ -0,0 +1,411 @@
+import os
+import struct
+from collections import deque
+
+# Pure PDU decoding (no Django), shared by smpp_server and puskarServer.
+# Fields are read straight out of the PDU with bytes.find(start) and
+# precompiled structs, so we never copy "the rest of the body" per field.
+
+TLV_SAR_MSG_REF_NUM = 0x020C
+TLV_SAR_TOTAL_SEGMENTS = 0x020E
+TLV_SAR_SEGMENT_SEQNUM = 0x020F
+TLV_MESSAGE_PAYLOAD = 0x0424
+
+_TON_NPI = struct.Struct(">BB")
+# esm_class, protocol_id, priority_flag
+_ESM_PID_PRIORITY = struct.Struct(">BBB")
+# registered_delivery, replace_if_present_flag, data_coding, sm_default_msg_id, sm_length
+_DELIVERY_CODING_LENGTH = struct.Struct(">BBBBB")
+_TLV_HEADER = struct.Struct(">HH")
+_UINT8 = struct.Struct(">B")
+_UINT16 = struct.Struct(">H")
+_UINT32 = struct.Struct(">I")
+# command_length, command_id, command_status, sequence_number
+PDU_HEADER = struct.Struct(">IIII")
+
+# Anything longer is garbage or an attack; a 64KB message_payload still fits
+MAX_PDU_LENGTH = int(os.environ.get("SMPP_MAX_PDU_LENGTH", 70000))
+# How much we ask the socket for at once
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class PduDecodeError(ValueError):
+    """The PDU body is truncated or its TLVs are malformed."""
+
+
+class PduFrameError(PduDecodeError):
+    """command_length is out of range, so the stream can't be framed any more."""
+
+    def __init__(self, message, seq_num=0):
+        super().__init__(message)
+        self.seq_num = seq_num
+
+
+_UNTERMINATED = "Unterminated C-string in SUBMIT_SM"
+
+# submit_multi dest_flag values
+DEST_FLAG_SME_ADDRESS = 1
+DEST_FLAG_DISTRIBUTION_LIST = 2
+
+
+class SubmitSm:
+    """One decoded SUBMIT_SM body."""
+
+    __slots__ = (
+        "service_type",
+        "source_addr_ton",
+        "source_addr_npi",
+        "source_addr",
+        "dest_addr_ton",
+        "dest_addr_npi",
+        "destination_addr",
+        "esm_class",
+        "protocol_id",
+        "priority_flag",
+        "schedule_delivery_time",
+        "validity_period",
+        "registered_delivery",
+        "replace_if_present_flag",
+        "data_coding",
+        "sm_default_msg_id",
+        "short_message",
+        "tlvs",
+        "sar_msg_ref_num",
+        "sar_total_segments",
+        "sar_segment_seqnum",
+    )
+
+    def __repr__(self):
+        return (
+            f"SubmitSm(source={self.source_addr!r}, destination={self.destination_addr!r}, "
+            f"data_coding={self.data_coding}, esm_class={self.esm_class:#x}, "
+            f"length={len(self.short_message)})"
+        )
+
+
+class SubmitMulti(SubmitSm):
+    """
+    One decoded SUBMIT_MULTI body: a SubmitSm whose single destination is
+    replaced by dest_addresses [(ton, npi, address)] and distribution_lists.
+    destination_addr holds the addresses comma-joined (for logs and buffers).
+    """
+
+    __slots__ = ("dest_addresses", "distribution_lists")
+
+    def __repr__(self):
+        return (
+            f"SubmitMulti(source={self.source_addr!r}, "
+            f"destinations={len(self.dest_addresses)}, data_coding={self.data_coding}, "
+            f"length={len(self.short_message)})"
+        )
+
+
+def read_c_string(data, offset):
+    """
+    Reads a NUL-terminated ASCII string starting at offset.
+    Returns (value, offset after the NUL). Without a NUL it takes the rest of data.
+    """
+    end = data.find(b"\0", offset)
+    if end == -1:
+        return data[offset:].decode("ascii", errors="ignore"), len(data)
+    return data[offset:end].decode("ascii", errors="ignore"), end + 1
+
+
+def decode_submit_sm(body):
+    """
+    Decodes a SUBMIT_SM body (bytes, without the 16-byte header) into a SubmitSm.
+    TLV values are kept as memoryview slices of body; a message_payload TLV
+    (0x0424) replaces short_message, like SMSCs do for long texts.
+    Raises PduDecodeError if the body is truncated or the TLVs are malformed.
+    """
+    pdu = SubmitSm()
+    find = body.find
+
+    try:
+        # C-strings are located with find(start) and only the field itself is sliced
+        end = find(b"\0")
+        if end < 0:
+            raise PduDecodeError(_UNTERMINATED)
+        pdu.service_type = body[:end].decode("ascii", "ignore")
+        pdu.source_addr_ton, pdu.source_addr_npi = _TON_NPI.unpack_from(body, end + 1)
+        offset = end + 3
+        end = find(b"\0", offset)
+        if end < 0:
+            raise PduDecodeError(_UNTERMINATED)
+        pdu.source_addr = body[offset:end].decode("ascii", "ignore")
+        pdu.dest_addr_ton, pdu.dest_addr_npi = _TON_NPI.unpack_from(body, end + 1)
+        offset = end + 3
+        end = find(b"\0", offset)
+        if end < 0:
+            raise PduDecodeError(_UNTERMINATED)
+        pdu.destination_addr = body[offset:end].decode("ascii", "ignore")
+    except struct.error as e:
+        raise PduDecodeError(f"Truncated SUBMIT_SM: {e}") from None
+
+    return decode_message_fields(pdu, body, end + 1)
+
+
+def decode_message_fields(pdu, body, offset):
+    """
+    Decodes everything from esm_class to the TLVs (identical in SUBMIT_SM and
+    SUBMIT_MULTI) into pdu, starting at offset. Returns pdu.
+    """
+    find = body.find
+    try:
+        (
+            pdu.esm_class,
+            pdu.protocol_id,
+            pdu.priority_flag,
+        ) = _ESM_PID_PRIORITY.unpack_from(body, offset)
+        offset += 3
+        end = find(b"\0", offset)
+        if end < 0:
+            raise PduDecodeError(_UNTERMINATED)
+        pdu.schedule_delivery_time = body[offset:end].decode("ascii", "ignore")
+        offset = end + 1
+        end = find(b"\0", offset)
+        if end < 0:
+            raise PduDecodeError(_UNTERMINATED)
+        pdu.validity_period = body[offset:end].decode("ascii", "ignore")
+        (
+            pdu.registered_delivery,
+            pdu.replace_if_present_flag,
+            pdu.data_coding,
+            pdu.sm_default_msg_id,
+            sm_length,
+        ) = _DELIVERY_CODING_LENGTH.unpack_from(body, end + 1)
+    except struct.error as e:
+        raise PduDecodeError(f"Truncated SUBMIT_SM: {e}") from None
+
+    offset = end + 6
+    body_len = len(body)
+    if offset + sm_length > body_len:
+        raise PduDecodeError("short_message runs past the end of the PDU")
+    pdu.short_message = body[offset : offset + sm_length]
+    offset += sm_length
+
+    pdu.tlvs = {}
+    pdu.sar_msg_ref_num = None
+    pdu.sar_total_segments = None
+    pdu.sar_segment_seqnum = None
+    if offset == body_len:
+        return pdu
+
+    view = memoryview(body)
+    while offset < body_len:
+        if body_len - offset < _TLV_HEADER.size:
+            raise PduDecodeError("INVALID_TLV")
+        tag, length = _TLV_HEADER.unpack_from(body, offset)
+        offset += _TLV_HEADER.size
+        if offset + length > body_len:
+            raise PduDecodeError("INVALID_TLV")
+        value = view[offset : offset + length]
+        offset += length
+        pdu.tlvs[tag] = value
+
+        try:
+            if tag == TLV_MESSAGE_PAYLOAD:
+                pdu.short_message = value.tobytes()
+            elif tag == TLV_SAR_MSG_REF_NUM:
+                pdu.sar_msg_ref_num = _UINT16.unpack(value)[0]
+            elif tag == TLV_SAR_TOTAL_SEGMENTS:
+                pdu.sar_total_segments = _UINT8.unpack(value)[0]
+            elif tag == TLV_SAR_SEGMENT_SEQNUM:
+                pdu.sar_segment_seqnum = _UINT8.unpack(value)[0]
+        except struct.error:
+            raise PduDecodeError("INVALID_TLV") from None
+
+    return pdu
+
+
+class PduFramer:
+    """
+    Cuts complete PDUs out of a StreamReader. Each socket read asks for a big
+    chunk, and every PDU in it is queued, so a burst of small SUBMIT_SMs is
+    handed out without waiting on the socket again.
+
+    Frames are (command_length, command_id, command_status, sequence_number, body).
+    """
+
+    def __init__(self, reader, max_pdu_length=MAX_PDU_LENGTH, chunk_size=READ_CHUNK_SIZE):
+        self.reader = reader
+        self.max_pdu_length = max_pdu_length
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()  # reused for the whole connection
+        self.frames = deque()
+        self.error = None
+
+    def next_buffered(self):
+        """Returns an already-read frame, or None if we have to wait for the socket."""
+        if self.frames:
+            return self.frames.popleft()
+        return None
+
+    async def read_frame(self):
+        """
+        Waits for the next complete PDU. Returns None at EOF and raises
+        PduFrameError once the frames before a bad command_length are used up.
+        """
+        while not self.frames:
+            if self.error is not None:
+                raise self.error
+            chunk = await self.reader.read(self.chunk_size)
+            if not chunk:
+                return None
+            self.buffer += chunk
+            self.cut_frames()
+        return self.frames.popleft()
+
+    def cut_frames(self):
+        buffer = self.buffer
+        size = len(buffer)
+        offset = 0
+        with memoryview(buffer) as view:
+            while size - offset >= PDU_HEADER.size:
+                cmd_len, cmd_id, cmd_status, seq_num = PDU_HEADER.unpack_from(
+                    view, offset
+                )
+                if cmd_len < PDU_HEADER.size or cmd_len > self.max_pdu_length:
+                    self.error = PduFrameError(
+                        f"command_length {cmd_len} out of range", seq_num
+                    )
+                    break
+                if size - offset < cmd_len:
+                    break  # the rest of this PDU is still on its way
+                body = view[offset + PDU_HEADER.size : offset + cmd_len].tobytes()
+                self.frames.append((cmd_len, cmd_id, cmd_status, seq_num, body))
+                offset += cmd_len
+        if offset:
+            del buffer[:offset]
+
+
+def decode_submit_multi(body):
+    """
+    Decodes a SUBMIT_MULTI body into a SubmitMulti (see decode_submit_sm).
+    Raises PduDecodeError if the body is truncated or malformed.
+    """
+    pdu = SubmitMulti()
+    pdu.dest_addr_ton = pdu.dest_addr_npi = None
+    find = body.find
+
+    try:
+        end = find(b"\0")
+        if end < 0:
+            raise PduDecodeError(_UNTERMINATED)
+        pdu.service_type = body[:end].decode("ascii", "ignore")
+        pdu.source_addr_ton, pdu.source_addr_npi = _TON_NPI.unpack_from(body, end + 1)
+        offset = end + 3
+        end = find(b"\0", offset)
+        if end < 0:
+            raise PduDecodeError(_UNTERMINATED)
+        pdu.source_addr = body[offset:end].decode("ascii", "ignore")
+        (number_of_dests,) = _UINT8.unpack_from(body, end + 1)
+        offset = end + 2
+
+        addresses = []
+        lists = []
+        for _ in range(number_of_dests):
+            (dest_flag,) = _UINT8.unpack_from(body, offset)
+            if dest_flag == DEST_FLAG_SME_ADDRESS:
+                ton, npi = _TON_NPI.unpack_from(body, offset + 1)
+                offset += 3
+                end = find(b"\0", offset)
+                if end < 0:
+                    raise PduDecodeError(_UNTERMINATED)
+                addresses.append((ton, npi, body[offset:end].decode("ascii", "ignore")))
+            elif dest_flag == DEST_FLAG_DISTRIBUTION_LIST:
+                offset += 1
+                end = find(b"\0", offset)
+                if end < 0:
+                    raise PduDecodeError(_UNTERMINATED)
+                lists.append(body[offset:end].decode("ascii", "ignore"))
+            else:
+                raise PduDecodeError(f"Unknown dest_flag {dest_flag} in SUBMIT_MULTI")
+            offset = end + 1
+    except struct.error as e:
+        raise PduDecodeError(f"Truncated SUBMIT_MULTI: {e}") from None
+
+    pdu.dest_addresses = addresses
+    pdu.distribution_lists = lists
+    pdu.destination_addr = ",".join(address for _, _, address in addresses)
+    return decode_message_fields(pdu, body, offset)
+
+
+def encode_submit_multi_resp(message_id, unsuccess_smes=()):
+    """
+    SUBMIT_MULTI_RESP body: message_id, no_unsuccess and one
+    (ton, npi, destination_addr, error_status_code) entry per failed destination.
+    """
+    parts = [message_id.encode("ascii") + b"\0", _UINT8.pack(len(unsuccess_smes))]
+    for ton, npi, address, error_status_code in unsuccess_smes:
+        parts.append(_TON_NPI.pack(ton, npi))
+        parts.append(address.encode("ascii", errors="ignore") + b"\0")
+        parts.append(_UINT32.pack(error_status_code))
+    return b"".join(parts)
+
+
+def c_string(value):
+    return (value or "").encode("ascii", errors="ignore") + b"\0"
+
+
+def encode_bind(
+    system_id,
+    password,
+    system_type="",
+    interface_version=0x34,
+    addr_ton=0,
+    addr_npi=0,
+    address_range="",
+):
+    """BIND_TRANSMITTER / RECEIVER / TRANSCEIVER body (all three are identical)."""
+    return b"".join(
+        (
+            c_string(system_id),
+            c_string(password),
+            c_string(system_type),
+            bytes((interface_version, addr_ton, addr_npi)),
+            c_string(address_range),
+        )
+    )
+
+
+def encode_submit_sm(
+    source_addr,
+    destination_addr,
+    short_message,
+    source_addr_ton=0,
+    source_addr_npi=0,
+    dest_addr_ton=0,
+    dest_addr_npi=0,
+    esm_class=0,
+    registered_delivery=1,
+    data_coding=0,
+    service_type="",
+):
+    """
+    SUBMIT_SM body for an outbound message. Anything over 254 octets goes in
+    a message_payload TLV with sm_length 0, as decode_submit_sm expects.
+    """
+    parts = [
+        c_string(service_type),
+        _TON_NPI.pack(source_addr_ton, source_addr_npi),
+        c_string(source_addr),
+        _TON_NPI.pack(dest_addr_ton, dest_addr_npi),
+        c_string(destination_addr),
+        _ESM_PID_PRIORITY.pack(esm_class, 0, 0),
+        b"\0\0",  # schedule_delivery_time, validity_period
+    ]
+    in_payload_tlv = len(short_message) > 254
+    parts.append(
+        _DELIVERY_CODING_LENGTH.pack(
+            registered_delivery,
+            0,  # replace_if_present_flag
+            data_coding,
+            0,  # sm_default_msg_id
+            0 if in_payload_tlv else len(short_message),
+        )
+    )
+    if in_payload_tlv:
+        parts.append(_TLV_HEADER.pack(TLV_MESSAGE_PAYLOAD, len(short_message)))
+    parts.append(short_message)
+    return b"".join(parts)
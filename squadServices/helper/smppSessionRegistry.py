@@ -0,0 +1,89 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A worker that stops refreshing its heartbeat for this long is considered dead
+# and its binds no longer count towards ClientPolicy.maxSessions.
+WORKER_HEARTBEAT_TTL = 30
+WORKER_HEARTBEAT_INTERVAL = 10
+
+# How long a worker owns a DLR it picked up (it is marked pushed long before)
+DLR_CLAIM_TTL = 60
+
+# Counts the live binds of one client (dropping binds of dead workers) and
+# registers a new one if the limit allows it.
+# KEYS[1] = bind hash, ARGV = bind token, worker token, max sessions (0 = unlimited)
+# Returns {1, count} if registered, {0, count} if the client is at its limit.
+ACQUIRE_BIND_SCRIPT = """
+local binds = redis.call('HGETALL', KEYS[1])
+local live = 0
+for i = 1, #binds, 2 do
+    if redis.call('EXISTS', 'smpp:worker:' .. binds[i + 1]) == 1 then
+        live = live + 1
+    else
+        redis.call('HDEL', KEYS[1], binds[i])
+    end
+end
+local max_sessions = tonumber(ARGV[3])
+if max_sessions > 0 and live >= max_sessions then
+    return {0, live}
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+return {1, live + 1}
+"""
+
+
+def worker_key(worker_token):
+    return f"smpp:worker:{worker_token}"
+
+
+def binds_key(client_id):
+    return f"smpp:binds:{client_id}"
+
+
+class SMPPSessionRegistry:
+    """
+    Bind bookkeeping shared by every SMPP worker process, so maxSessions holds
+    no matter which worker the kernel hands a connection to (SO_REUSEPORT).
+    """
+
+    def __init__(self, redis_client, worker_token):
+        self.redis_client = redis_client
+        self.worker_token = worker_token
+        self.acquire_script = redis_client.register_script(ACQUIRE_BIND_SCRIPT)
+
+    async def heartbeat(self):
+        await self.redis_client.set(
+            worker_key(self.worker_token), 1, ex=WORKER_HEARTBEAT_TTL
+        )
+
+    async def heartbeat_loop(self):
+        while True:
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                logger.error(f"SMPP worker heartbeat failed: {e}")
+            await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+
+    async def acquire(self, client_id, bind_token, max_sessions):
+        """Returns (allowed, live session count including this one if allowed)."""
+        allowed, count = await self.acquire_script(
+            keys=[binds_key(client_id)],
+            args=[bind_token, self.worker_token, max_sessions],
+        )
+        return bool(int(allowed)), int(count)
+
+    async def release(self, client_id, bind_token):
+        await self.redis_client.hdel(binds_key(client_id), bind_token)
+
+    async def claim_dlr(self, msg_id):
+        """Only one worker may push a given DLR, even if several hold a bind."""
+        return bool(
+            await self.redis_client.set(
+                f"smpp:dlr:claim:{msg_id}",
+                self.worker_token,
+                nx=True,
+                ex=DLR_CLAIM_TTL,
+            )
+        )
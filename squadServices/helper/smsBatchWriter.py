@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import os
+
+from django.db import transaction
+from django.utils import timezone
+
+from squadServices.helper.dbExecutor import db_sync_to_async
+from squadServices.helper.smsSplitter import build_message_parts
+from squadServices.models.clientModel.client import Client
+from squadServices.models.company import Company
+from squadServices.models.detailedReport.detailedReport import DetailedSMSReport
+from squadServices.models.smpp.smppSMS import SMSMessage, SMSMessagePart
+from squadServices.models.transaction.transaction import (
+    ClientTransaction,
+    TransactionType,
+    VendorTransaction,
+)
+
+logger = logging.getLogger(__name__)
+
+# Flush when this many messages are waiting...
+WRITE_BEHIND_MAX_ITEMS = int(os.environ.get("SMPP_WRITE_BEHIND_MAX_ITEMS", 200))
+# ...or when the oldest one has waited this long (seconds)
+WRITE_BEHIND_MAX_DELAY = float(os.environ.get("SMPP_WRITE_BEHIND_MAX_DELAY", 0.005))
+
+
+def persist_accepted_sms_batch(items):
+    """
+    Bills and saves a group of accepted messages in ONE transaction.
+
+    Each item is a dict with: client_obj, route_data, destination, text,
+    encoding, total_segments, total_chars, source_addr, unique_msg_id,
+    concat_ref, send_client_dlr.
+
+    Items whose route_data has "credit_balances" were already charged in the
+    Redis credit ledger, so only their rows are written. The rest (ledger was
+    unreachable) are billed here: 2 row-lock SELECTs and one UPDATE per account.
+    """
+    company_ids = set()
+    client_ids = set()
+    for item in items:
+        client_ids.add(item["client_obj"].id)
+        if item["route_data"].get("credit_balances"):
+            continue
+        company_ids.add(item["route_data"]["terminating_company_id"])
+        company_ids.add(item["client_obj"].company_id)
+
+    with transaction.atomic():
+        # 1. LOCK BALANCES FIRST (ordered by id so two batches can never deadlock)
+        locked_companies = {
+            c.id: c
+            for c in Company.objects.select_for_update()
+            .filter(id__in=company_ids)
+            .order_by("id")
+        }
+        # Ledger-billed clients are read without a lock; we only need their
+        # invoicePolicy/currency/username for the receipts.
+        clients_qs = Client.objects.select_related("company__currency").filter(
+            id__in=client_ids
+        )
+        if company_ids:
+            clients_qs = clients_qs.select_for_update(of=("self",))
+        locked_clients = {c.id: c for c in clients_qs.order_by("id")}
+        billed_client_ids = set()
+
+        # 2. DEDUCT MONEY (in memory, keeping a running balance for every receipt)
+        now = timezone.now()
+        messages = []
+        balances = []
+        for item in items:
+            route_data = item["route_data"]
+            client = locked_clients[item["client_obj"].id]
+
+            reserved = route_data.get("credit_balances")
+            if reserved:
+                vendor_balance, client_balance, _ = reserved
+                balances.append((vendor_balance, client_balance, client))
+            else:
+                terminating_company = locked_companies[
+                    route_data["terminating_company_id"]
+                ]
+                client_company = locked_companies[client.company_id]
+
+                terminating_company.usedVendorCredit += route_data["total_vendor_cost"]
+                client.usedCredit += route_data["total_client_cost"]
+                client_company.usedCustomerCredit += route_data["total_client_cost"]
+                billed_client_ids.add(client.id)
+                balances.append(
+                    (terminating_company.usedVendorCredit, client.usedCredit, client)
+                )
+
+            messages.append(
+                SMSMessage(
+                    destination=item["destination"],
+                    text=item["text"],
+                    encoding=item["encoding"],
+                    segmentNumber=item["total_segments"],
+                    characterCount=item["total_chars"],
+                    status="queued",
+                    systemId=item["source_addr"],
+                    smpp_id=route_data["smpp_id"],
+                    client=client,
+                    vendor_id=route_data["vendor_id"],
+                    message_id=item["unique_msg_id"],
+                    concatenated_reference=item["concat_ref"],
+                    sendClientDlr=item["send_client_dlr"],
+                    queued_at=now,
+                )
+            )
+
+        # One combined UPDATE per account instead of one per message
+        for company in locked_companies.values():
+            Company.objects.filter(id=company.id).update(
+                usedVendorCredit=company.usedVendorCredit,
+                usedCustomerCredit=company.usedCustomerCredit,
+            )
+        for client_id in billed_client_ids:
+            Client.objects.filter(id=client_id).update(
+                usedCredit=locked_clients[client_id].usedCredit
+            )
+
+        # 3. SAVE SMS (Postgres hands the new ids back, so the FKs below just work)
+        SMSMessage.objects.bulk_create(messages)
+
+        parts = []
+        for msg in messages:
+            parts.extend(build_message_parts(msg, msg.text))
+        SMSMessagePart.objects.bulk_create(parts)
+
+        # 4. WRITE RECEIPTS
+        vendor_receipts = []
+        client_receipts = []
+        reports = []
+        for item, msg, (vendor_balance, client_balance, client) in zip(
+            items, messages, balances
+        ):
+            route_data = item["route_data"]
+            unique_msg_id = item["unique_msg_id"]
+
+            vendor_receipts.append(
+                VendorTransaction(
+                    vendor_id=route_data["vendor_id"],
+                    message=msg,
+                    transactionType=TransactionType.DEDUCTION,
+                    segments=item["total_segments"],
+                    ratePerSegment=route_data["vendor_cost"],
+                    amount=route_data["total_vendor_cost"],
+                    balanceSpent=vendor_balance,
+                    description=f"Routing charge for SMS {unique_msg_id}",
+                )
+            )
+            client_receipts.append(
+                ClientTransaction(
+                    client=client,
+                    message=msg,
+                    transactionType=TransactionType.DEDUCTION,
+                    segments=item["total_segments"],
+                    ratePerSegment=route_data["client_cost"],
+                    amount=route_data["total_client_cost"],
+                    chargePolicy=client.invoicePolicy,
+                    currency=(
+                        client.company.currency.name
+                        if client.company.currency
+                        else "USD"
+                    ),
+                    balanceSpent=client_balance,
+                    description=f"Sent SMS {unique_msg_id}",
+                )
+            )
+            reports.append(
+                DetailedSMSReport(
+                    message=msg,
+                    text_message_id=unique_msg_id,
+                    senderId=item["source_addr"],
+                    text=msg.text,
+                    part_total=item["total_segments"],
+                    client=client.smppUsername,
+                    clientRate=route_data["client_cost"],
+                    client_charge=route_data["total_client_cost"],
+                    vendor=route_data["vendor_name"],
+                    vendorRate=route_data["vendor_cost"],
+                    vendor_charge=route_data["total_vendor_cost"],
+                    submitStatus="SUBMITTED",
+                    operatorMNC=route_data.get("mnc", "Unknown"),
+                    request_time=msg.createdAt,
+                    destination=msg.destination,
+                    countryMCC=route_data.get("country_code", "Unknown"),
+                )
+            )
+
+        VendorTransaction.objects.bulk_create(vendor_receipts)
+        ClientTransaction.objects.bulk_create(client_receipts)
+        DetailedSMSReport.objects.bulk_create(reports)
+
+    return messages
+
+
+class SMSWriteBehindQueue:
+    """
+    Collects accepted messages from every SMPP session for a few milliseconds
+    and persists them together with persist_accepted_sms_batch.
+
+    submit() only returns once the batch holding the message has committed,
+    so the caller can safely send SUBMIT_SM_RESP afterwards.
+    """
+
+    def __init__(
+        self,
+        max_items=WRITE_BEHIND_MAX_ITEMS,
+        max_delay=WRITE_BEHIND_MAX_DELAY,
+    ):
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self.queue = asyncio.Queue()
+        self.persist_batch = db_sync_to_async(persist_accepted_sms_batch)
+
+    async def submit(self, item):
+        """Queues one message and waits until it is safely in the database."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def run(self):
+        """Background loop: gather a batch, write it, wake up the waiting sessions."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+
+            while len(batch) < self.max_items:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            await self.flush(batch)
+
+    async def flush(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            messages = await self.persist_batch(items)
+        except Exception as e:
+            # One bad row must not fail everyone else's messages:
+            # fall back to writing them one by one.
+            logger.error(f"Write-behind batch of {len(batch)} failed, retrying singly: {e}")
+            for item, future in batch:
+                try:
+                    (msg,) = await self.persist_batch([item])
+                    self.resolve(future, result=msg)
+                except Exception as single_error:
+                    self.resolve(future, error=single_error)
+            return
+
+        for (_, future), msg in zip(batch, messages):
+            self.resolve(future, result=msg)
+
+    @staticmethod
+    def resolve(future, result=None, error=None):
+        if future.done():  # the session may have gone away
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
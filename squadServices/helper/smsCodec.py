@@ -0,0 +1,178 @@
+import re
+import struct
+
+# The one place that decides how a text goes on the wire: GSM-7 or UCS-2,
+# how many segments it takes and where those segments are cut. Pure Python,
+# no Django, so the SMPP server, the campaign tasks and the splitter all
+# agree on the numbers.
+#
+# Every check below is a single pass in C (a compiled character class,
+# str.translate or str.encode) instead of a Python loop over the characters.
+
+GSM7 = "GSM-7"
+UCS2 = "UCS-2"
+
+# SMPP data_coding of each encoding
+DATA_CODING = {GSM7: 0x00, UCS2: 0x08}
+
+# GSM 03.38 default alphabet, in code order (index == septet value).
+# 0x1B is the escape to the extension table, not a character of its own.
+GSM7_BASIC = (
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞ\x1bÆæßÉ !\"#¤%&'()*+,-./"
+    "0123456789:;<=>?¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§"
+    "¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM7_ESCAPE = 0x1B
+# Extension table: sent as ESC + code, so each of these costs two septets
+GSM7_EXTENSION = {
+    "\f": 0x0A,
+    "^": 0x14,
+    "{": 0x28,
+    "}": 0x29,
+    "\\": 0x2F,
+    "[": 0x3C,
+    "~": 0x3D,
+    "]": 0x3E,
+    "|": 0x40,
+    "€": 0x65,
+}
+
+GSM7_EXTENSION_CHARS = frozenset(GSM7_EXTENSION)
+GSM7_CHARS = frozenset(GSM7_BASIC.replace("\x1b", "")) | GSM7_EXTENSION_CHARS
+
+# Finds the first character GSM-7 can't carry / the first two-septet one;
+# both stop scanning as soon as they match
+NON_GSM7_RE = re.compile(f"[^{re.escape(''.join(sorted(GSM7_CHARS)))}]")
+GSM7_EXTENSION_RE = re.compile(f"[{re.escape(''.join(GSM7_EXTENSION))}]")
+
+# text -> one octet per septet (unpacked), decoded back through latin1
+GSM7_ENCODE_TABLE = str.maketrans(
+    {
+        **{
+            char: chr(code)
+            for code, char in enumerate(GSM7_BASIC)
+            if code != GSM7_ESCAPE
+        },
+        **{char: chr(GSM7_ESCAPE) + chr(code) for char, code in GSM7_EXTENSION.items()},
+    }
+)
+GSM7_DECODE_TABLE = str.maketrans(
+    {chr(code): char for code, char in enumerate(GSM7_BASIC)}
+)
+GSM7_EXTENSION_DECODE = {chr(code): char for char, code in GSM7_EXTENSION.items()}
+
+# Payload octets per part: (whole message in one part, each part of a long one).
+# Long messages lose 6 octets to the concatenation UDH.
+PART_LIMITS = {
+    GSM7: (160, 153),  # septets, one octet each
+    UCS2: (140, 134),  # 70 / 67 UTF-16 code units
+}
+
+UDH_CONCAT = struct.Struct("!BBBBBB")
+
+
+def detect_encoding(text):
+    """GSM-7 if every character is in the GSM 03.38 tables, else UCS-2."""
+    return UCS2 if NON_GSM7_RE.search(text) else GSM7
+
+
+def encode_text(text, encoding=None):
+    """
+    Returns (encoding, payload): GSM-7 as unpacked septets (extension
+    characters as ESC + code), UCS-2 as UTF-16BE (emoji take two code units).
+    """
+    encoding = encoding or detect_encoding(text)
+    if encoding == GSM7:
+        return encoding, text.translate(GSM7_ENCODE_TABLE).encode("latin1")
+    return encoding, text.encode("utf-16-be")
+
+
+def decode_payload(payload, encoding):
+    if encoding == UCS2:
+        return payload.decode("utf-16-be", errors="ignore")
+    text = payload.decode("latin1")
+    if "\x1b" not in text:
+        return text.translate(GSM7_DECODE_TABLE)
+    head, *escaped = text.split("\x1b")
+    chars = [head.translate(GSM7_DECODE_TABLE)]
+    for chunk in escaped:
+        if chunk:
+            chars.append(GSM7_EXTENSION_DECODE.get(chunk[0], " "))
+            chars.append(chunk[1:].translate(GSM7_DECODE_TABLE))
+    return "".join(chars)
+
+
+def part_bounds(payload, encoding):
+    """
+    End offsets of each part of the payload. Parts are cut so an ESC pair or
+    a UTF-16 surrogate pair never straddles two parts, which is why the count
+    can exceed a plain ceil(length / 153).
+    """
+    single, multi = PART_LIMITS[encoding]
+    length = len(payload)
+    if length <= single:
+        return [length]
+
+    bounds = []
+    start = 0
+    while start < length:
+        end = min(start + multi, length)
+        if end < length:
+            if encoding == GSM7:
+                if payload[end - 1] == GSM7_ESCAPE:
+                    end -= 1
+            elif 0xD8 <= payload[end - 2] <= 0xDB:  # high surrogate
+                end -= 2
+        bounds.append(end)
+        start = end
+    return bounds
+
+
+def count_segments(text, encoding):
+    """Same count as len(part_bounds(...)), without encoding when it can't differ."""
+    # No ESC pairs / no surrogate pairs: one octet per septet, two per
+    # character, so nothing can straddle a cut and plain division is exact
+    if encoding == GSM7:
+        if GSM7_EXTENSION_RE.search(text):
+            return len(part_bounds(encode_text(text, encoding)[1], encoding))
+        octets = len(text)
+    else:
+        payload = text.encode("utf-16-be")
+        octets = len(payload)
+        if octets != 2 * len(text):
+            return len(part_bounds(payload, encoding))
+
+    single, multi = PART_LIMITS[encoding]
+    return 1 if octets <= single else -(-octets // multi)
+
+
+def get_encoding_and_segments(text):
+    """(encoding, segments, characters) as stored on SMSMessage."""
+    encoding = detect_encoding(text)
+    return encoding, count_segments(text, encoding), len(text)
+
+
+def concat_udh(ref_num, total_parts, part_no):
+    """6-byte concatenation UDH: 05 00 03 <ref> <total> <seq>."""
+    return UDH_CONCAT.pack(0x05, 0x00, 0x03, ref_num, total_parts, part_no)
+
+
+def split_message(text, ref_num=0):
+    """
+    Returns (encoding, parts); each part is (text, short_message, udh).
+    A single part has no UDH (None); otherwise short_message already starts
+    with its UDH and must go out with esm_class 0x40.
+    """
+    encoding, payload = encode_text(text)
+    bounds = part_bounds(payload, encoding)
+    if len(bounds) == 1:
+        return encoding, [(text, payload, None)]
+
+    parts = []
+    start = 0
+    for part_no, end in enumerate(bounds, start=1):
+        chunk = payload[start:end]
+        udh = concat_udh(ref_num, len(bounds), part_no)
+        parts.append((decode_payload(chunk, encoding), udh + chunk, udh))
+        start = end
+    return encoding, parts
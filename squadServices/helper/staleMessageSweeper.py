@@ -0,0 +1,256 @@
+import logging
+import os
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from squadServices.helper.clientDlrStream import publish_client_dlrs
+from squadServices.models.detailedReport.detailedReport import DetailedSMSReport
+from squadServices.models.smpp.smppSMS import DLREvent, SMSMessage, SMSMessagePart
+from squadServices.models.transaction.transaction import (
+    ClientTransaction,
+    VendorTransaction,
+)
+
+logger = logging.getLogger(__name__)
+
+# How long a message may sit in 'queued' before the reaper fails it (seconds)
+QUEUE_TIMEOUT = int(os.environ.get("SMPP_QUEUE_TIMEOUT", 5))
+# How long we wait for a vendor DLR on a submitted part
+VENDOR_DLR_TIMEOUT_HOURS = int(os.environ.get("SMPP_VENDOR_DLR_TIMEOUT_HOURS", 24))
+# Rows locked and updated per statement; each chunk is its own transaction
+SWEEP_CHUNK_SIZE = int(os.environ.get("SMPP_SWEEP_CHUNK_SIZE", 1000))
+
+REAPER_REASON = "Reaper Timeout: Message was stuck in queue too long."
+VENDOR_TIMEOUT_REASON = (
+    f"Vendor Timeout: No DLR received within {VENDOR_DLR_TIMEOUT_HOURS} hours."
+)
+
+# Takes one chunk of stale queued messages (skipping rows someone else holds)
+# and fails them in the same statement.
+REAP_MESSAGES_SQL = """
+UPDATE {table} SET {status} = 'failed', {failure_reason} = %s,
+    {failed_at} = %s, {updated_at} = %s
+WHERE {pk} IN (
+    SELECT {pk} FROM {table}
+    WHERE {status} = 'queued' AND {queued_at} <= %s
+        AND {send_dlr} AND NOT {dlr_pushed}
+    ORDER BY {pk}
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING {pk}
+"""
+
+EXPIRE_PARTS_SQL = """
+UPDATE {table} SET {submit_status} = 'FAILED', {failure_reason} = %s,
+    {failed_at} = %s, {updated_at} = %s
+WHERE {pk} IN (
+    SELECT {pk} FROM {table}
+    WHERE {submit_status} = 'SUBMITTED' AND {submitted_at} <= %s
+    ORDER BY {pk}
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING {message}
+"""
+
+
+def format_sql(sql, model, **fields):
+    """Fills in the quoted table and column names of model."""
+    quote = connection.ops.quote_name
+    return sql.format(
+        table=quote(model._meta.db_table),
+        pk=quote(model._meta.pk.column),
+        **{
+            name: quote(model._meta.get_field(field).column)
+            for name, field in fields.items()
+        },
+    )
+
+
+def run_returning(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def sync_transactions(message_ids, status):
+    """What SMSMessage.save() does for one message, for a whole set."""
+    ClientTransaction.objects.filter(message_id__in=message_ids).update(status=status)
+    VendorTransaction.objects.filter(message_id__in=message_ids).update(status=status)
+
+
+def reap_stale_messages(chunk_size=SWEEP_CHUNK_SIZE):
+    """
+    Fails messages stuck in 'queued' beyond QUEUE_TIMEOUT (vendor unresponsive).
+    Per chunk: one UPDATE ... RETURNING for the messages, one UPDATE for their
+    parts, two for their transactions and one bulk insert of 408 DLR events.
+    """
+    sql = format_sql(
+        REAP_MESSAGES_SQL,
+        SMSMessage,
+        status="status",
+        failure_reason="failure_reason",
+        failed_at="failed_at",
+        updated_at="updatedAt",
+        queued_at="queued_at",
+        send_dlr="sendClientDlr",
+        dlr_pushed="clientDlrPushed",
+    )
+    reaped = 0
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            message_ids = run_returning(
+                sql,
+                [
+                    REAPER_REASON,
+                    now,
+                    now,
+                    now - timedelta(seconds=QUEUE_TIMEOUT),
+                    chunk_size,
+                ],
+            )
+            if message_ids:
+                # This prevents the background worker from ever picking them up
+                SMSMessagePart.objects.filter(message_id__in=message_ids).update(
+                    submit_status="FAILED", failed_at=now, failure_reason=REAPER_REASON
+                )
+                sync_transactions(message_ids, "failed")
+                # An official DLR event for the timeout (408 Request Timeout)
+                DLREvent.objects.bulk_create(
+                    [
+                        DLREvent(
+                            message_id=message_id,
+                            event_type="FAILED",
+                            status_code="408",
+                            status_description=REAPER_REASON,
+                        )
+                        for message_id in message_ids
+                    ]
+                )
+
+        if message_ids:
+            reaped += len(message_ids)
+            publish_client_dlrs(
+                SMSMessage.objects.select_related("client").filter(pk__in=message_ids),
+                "408",
+            )
+        if len(message_ids) < chunk_size:
+            break
+
+    if reaped:
+        # Log the failure professionally on the server
+        logger.error(
+            f"Gateway Timeout: {reaped} queued messages marked FAILED due to vendor unresponsiveness."
+        )
+    return reaped
+
+
+def fail_finished_messages(message_ids, now):
+    """
+    Set-based update_parent_message_status for parts that just failed: every
+    message whose parts are all final, with at least one failure, becomes
+    'failed'. Returns those messages and their delivered part counts.
+    """
+    counts = (
+        SMSMessagePart.objects.filter(message_id__in=message_ids)
+        .values("message_id")
+        .annotate(
+            total=Count("id"),
+            delivered=Count("id", filter=Q(submit_status="DELIVERED")),
+            failed=Count("id", filter=Q(submit_status="FAILED")),
+        )
+    )
+    finished = {
+        row["message_id"]: row
+        for row in counts
+        if row["failed"] and row["delivered"] + row["failed"] == row["total"]
+    }
+    if not finished:
+        return [], {}
+
+    reasons = {}
+    failed_parts = SMSMessagePart.objects.filter(
+        message_id__in=finished, submit_status="FAILED"
+    ).order_by("message_id", "part_no")
+    for message_id, part_no, failure_reason in failed_parts.values_list(
+        "message_id", "part_no", "failure_reason"
+    ):
+        total = finished[message_id]["total"]
+        reasons.setdefault(message_id, []).append(
+            f"Part {part_no}/{total}: {failure_reason or 'Unknown vendor error.'}"
+        )
+
+    messages = list(
+        SMSMessage.objects.select_related("client")
+        .filter(pk__in=finished)
+        .exclude(status="failed")
+    )
+    for msg in messages:
+        msg.status = "failed"
+        msg.failed_at = now
+        msg.updatedAt = now
+        msg.failure_reason = f"All segments failed. {' | '.join(reasons[msg.pk])}"
+    SMSMessage.objects.bulk_update(
+        messages, ["status", "failed_at", "failure_reason", "updatedAt"]
+    )
+    sync_transactions([msg.pk for msg in messages], "failed")
+    return messages, {
+        message_id: row["delivered"] for message_id, row in finished.items()
+    }
+
+
+def sweep_stale_submissions(chunk_size=SWEEP_CHUNK_SIZE):
+    """
+    Fails parts that were sent to the vendor but never got a DLR within
+    VENDOR_DLR_TIMEOUT_HOURS, then settles their parent messages, a chunk at a time.
+    """
+    sql = format_sql(
+        EXPIRE_PARTS_SQL,
+        SMSMessagePart,
+        submit_status="submit_status",
+        failure_reason="failure_reason",
+        failed_at="failed_at",
+        updated_at="updated_at",
+        submitted_at="submitted_at",
+        message="message",
+    )
+    expired = 0
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            message_ids = run_returning(
+                sql,
+                [
+                    VENDOR_TIMEOUT_REASON,
+                    now,
+                    now,
+                    now - timedelta(hours=VENDOR_DLR_TIMEOUT_HOURS),
+                    chunk_size,
+                ],
+            )
+            messages, delivered_parts = [], {}
+            if message_ids:
+                # Log it professionally in the Detailed Report
+                DetailedSMSReport.objects.filter(message_id__in=message_ids).update(
+                    submitStatus="FAILED"
+                )
+                messages, delivered_parts = fail_finished_messages(
+                    set(message_ids), now
+                )
+
+        if messages:
+            publish_client_dlrs(messages, delivered_parts=delivered_parts)
+        expired += len(message_ids)
+        if len(message_ids) < chunk_size:
+            break
+
+    if expired:
+        logger.error(
+            f"SYSTEM TIMEOUT: {expired} message parts were marked FAILED because the vendor never responded."
+        )
+    return expired
@@ -0,0 +1,257 @@
+import logging
+import os
+import queue
+import random
+import re
+import struct
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Packet tracing for the SMPP server. The event loop only drops the raw PDU
+# fields on a queue; a background thread builds the text/hex dump and writes it.
+
+TRAFFIC_LOG_FILE = os.environ.get("SMPP_TRAFFIC_LOG_FILE", "logs/smpp_traffic.log")
+
+# Fraction of PDUs that get traced (1 = all, 0.01 = one in a hundred)
+TRAFFIC_SAMPLE_RATE = float(os.environ.get("SMPP_TRAFFIC_SAMPLE_RATE", 1))
+
+# "off", "summary" (command/sequence/from/to) or "full" (+ raw bytes and hex dump)
+TRAFFIC_VERBOSITY = os.environ.get("SMPP_TRAFFIC_VERBOSITY", "full")
+
+# Per-client overrides, e.g. "yukesh:full,bulkclient:off"
+TRAFFIC_CLIENT_VERBOSITY = os.environ.get("SMPP_TRAFFIC_CLIENT_VERBOSITY", "")
+
+# Optional binary capture of the exact PDUs (see BinaryCaptureHandler)
+TRAFFIC_CAPTURE_FILE = os.environ.get("SMPP_TRAFFIC_CAPTURE_FILE", "")
+
+# Never let tracing eat the server's memory; past this we drop PDUs
+TRAFFIC_QUEUE_SIZE = 10000
+
+VERBOSITY_OFF = 0
+VERBOSITY_SUMMARY = 1
+VERBOSITY_FULL = 2
+VERBOSITY_LEVELS = {
+    "off": VERBOSITY_OFF,
+    "summary": VERBOSITY_SUMMARY,
+    "full": VERBOSITY_FULL,
+}
+
+_PDU_HEADER = struct.Struct(">IIII")
+# timestamp, direction (0 = received), length of the peer ip
+_CAPTURE_RECORD = struct.Struct(">dBB")
+CAPTURE_MAGIC = b"SQUADSMPPCAP1\n"
+
+_PRINTABLE_RUN = re.compile(b"[^\x00-\x1f\x7f-\xff]{3,}")
+
+traffic_logger = logging.getLogger("smpp_traffic")
+traffic_logger.setLevel(logging.INFO)
+traffic_logger.propagate = False  # Prevents these logs from spamming your main console
+
+
+def parse_client_verbosity(value):
+    overrides = {}
+    for entry in value.split(","):
+        username, _, level = entry.partition(":")
+        if username.strip() and level.strip() in VERBOSITY_LEVELS:
+            overrides[username.strip()] = VERBOSITY_LEVELS[level.strip()]
+    return overrides
+
+
+class PacketTrace:
+    """The raw PDU fields; turned into text only on the logging thread."""
+
+    __slots__ = ("client_ip", "cmd_id", "cmd_status", "seq_num", "body", "verbosity")
+
+    def __init__(self, client_ip, cmd_id, cmd_status, seq_num, body, verbosity):
+        self.client_ip = client_ip
+        self.cmd_id = cmd_id
+        self.cmd_status = cmd_status
+        self.seq_num = seq_num
+        self.body = body
+        self.verbosity = verbosity
+
+    def raw_pdu(self):
+        header = _PDU_HEADER.pack(
+            16 + len(self.body), self.cmd_id, self.cmd_status, self.seq_num
+        )
+        return header + self.body
+
+    def __str__(self):
+        cmd_id = self.cmd_id
+        log_entry = [
+            f"RAW SMPP PACKET FROM {self.client_ip}",
+            f"Command   : {hex(cmd_id)} ({'SUBMIT_SM' if cmd_id == 0x4 else 'BIND' if cmd_id == 0x9 else 'OTHER'})",
+            f"Sequence  : {self.seq_num}",
+        ]
+
+        if cmd_id == 0x00000004:  # If it's a SUBMIT_SM
+            # 1. Grab the basic strings (Phone numbers) just for quick reference
+            c_strings = _PRINTABLE_RUN.findall(self.body)
+            src = (
+                c_strings[0].decode("ascii", errors="ignore")
+                if len(c_strings) > 0
+                else "Unknown"
+            )
+            dest = (
+                c_strings[1].decode("ascii", errors="ignore")
+                if len(c_strings) > 1
+                else "Unknown"
+            )
+            log_entry.append(f"From      : {src}")
+            log_entry.append(f"To        : {dest}")
+
+            if self.verbosity >= VERBOSITY_FULL:
+                # 2. ⚡️ THE RAW BYTES, exactly as they arrived
+                log_entry.append(f"Raw Bytes : {self.body}")
+                # 3. ⚡️ THE HEX DUMP (Standard Telecom Debugging format)
+                log_entry.append(f"Raw Hex   : {self.body.hex(' ').upper()}")
+
+        return "\n" + "\n".join(log_entry) + "\n" + "-" * 50
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler.prepare() formats the message on the calling thread, which is
+    exactly the work we want off the event loop. PacketTrace holds only
+    immutable data, so the record can travel to the listener as it is.
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass  # Tracing is best effort; never block the SMPP server
+
+
+def worker_file_name(path, worker_index):
+    """logs/smpp_traffic.log -> logs/smpp_traffic.w2.log for worker 2."""
+    if worker_index is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.w{worker_index}{ext}"
+
+
+class BinaryCaptureHandler(logging.Handler):
+    """
+    Appends the exact PDU bytes of every traced packet to a capture file:
+    CAPTURE_MAGIC, then per packet a (timestamp, direction, ip length) record,
+    the peer ip and the PDU itself (its first 4 bytes are its own length).
+    """
+
+    def __init__(self, filename, max_bytes=50 * 1024 * 1024):
+        super().__init__()
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.stream = None
+
+    def open_stream(self):
+        stream = open(self.filename, "ab")
+        if stream.tell() == 0:
+            stream.write(CAPTURE_MAGIC)
+        return stream
+
+    def emit(self, record):
+        trace = record.msg
+        if not isinstance(trace, PacketTrace):
+            return
+        try:
+            if self.stream is None:
+                self.stream = self.open_stream()
+            elif self.stream.tell() >= self.max_bytes:
+                # Keep a single previous file around, like a tiny RotatingFileHandler
+                self.stream.close()
+                os.replace(self.filename, self.filename + ".1")
+                self.stream = self.open_stream()
+
+            ip = trace.client_ip.encode("ascii", errors="ignore")[:255]
+            self.stream.write(_CAPTURE_RECORD.pack(record.created, 0, len(ip)))
+            self.stream.write(ip)
+            self.stream.write(trace.raw_pdu())
+            self.stream.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        super().close()
+
+
+class SMPPTrafficLog:
+    """
+    trace() is the only part that runs on the event loop: a sampling check,
+    a verbosity lookup and a put_nowait. Everything else happens on the
+    QueueListener thread started by start().
+    """
+
+    def __init__(
+        self,
+        sample_rate=TRAFFIC_SAMPLE_RATE,
+        verbosity=TRAFFIC_VERBOSITY,
+        client_verbosity=TRAFFIC_CLIENT_VERBOSITY,
+        capture_file=TRAFFIC_CAPTURE_FILE,
+    ):
+        self.sample_rate = sample_rate
+        self.verbosity = VERBOSITY_LEVELS.get(verbosity, VERBOSITY_FULL)
+        self.client_verbosity = parse_client_verbosity(client_verbosity)
+        self.capture_file = capture_file
+        self.queue = queue.Queue(TRAFFIC_QUEUE_SIZE)
+        self.listener = None
+
+    def start(self, worker_index=None):
+        """
+        Call from the process that serves traffic (after any fork). With
+        several worker processes pass worker_index: each then writes its own
+        files, since file rotation isn't safe across processes.
+        """
+        if self.listener is not None:
+            return
+        log_file = worker_file_name(TRAFFIC_LOG_FILE, worker_index)
+        log_dir = os.path.dirname(log_file)
+        if log_dir and not os.path.exists(log_dir):
+            os.makedirs(log_dir, exist_ok=True)
+
+        # Max 5MB per file, keeps 5 backups
+        file_handler = RotatingFileHandler(
+            log_file, maxBytes=5 * 1024 * 1024, backupCount=5, encoding="utf-8"
+        )
+        # Adds Date and Time automatically!
+        file_handler.setFormatter(
+            logging.Formatter("%(asctime)s - [%(levelname)s] - %(message)s")
+        )
+        handlers = [file_handler]
+        if self.capture_file:
+            handlers.append(
+                BinaryCaptureHandler(worker_file_name(self.capture_file, worker_index))
+            )
+
+        traffic_logger.handlers = [DeferredQueueHandler(self.queue)]
+        self.listener = QueueListener(
+            self.queue, *handlers, respect_handler_level=True
+        )
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def verbosity_for(self, username):
+        if username is None:
+            return self.verbosity
+        return self.client_verbosity.get(username, self.verbosity)
+
+    def trace(self, client_ip, username, cmd_id, cmd_status, seq_num, body):
+        if self.listener is None:
+            return
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        verbosity = self.verbosity_for(username)
+        if verbosity == VERBOSITY_OFF:
+            return
+        traffic_logger.info(
+            PacketTrace(client_ip, cmd_id, cmd_status, seq_num, body, verbosity)
+        )
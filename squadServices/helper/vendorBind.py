@@ -0,0 +1,333 @@
+import asyncio
+import logging
+import os
+
+from squadServices.helper.smppPdu import (
+    PDU_HEADER,
+    PduDecodeError,
+    PduFramer,
+    decode_submit_sm,
+    encode_bind,
+    read_c_string,
+)
+from squadServices.helper.sequenceTracker import SequenceTracker
+
+logger = logging.getLogger(__name__)
+
+CMD_GENERIC_NACK = 0x80000000
+CMD_BIND_RECEIVER = 0x00000001
+CMD_BIND_TRANSMITTER = 0x00000002
+CMD_SUBMIT_SM = 0x00000004
+CMD_SUBMIT_SM_RESP = 0x80000004
+CMD_DELIVER_SM = 0x00000005
+CMD_DELIVER_SM_RESP = 0x80000005
+CMD_UNBIND = 0x00000006
+CMD_UNBIND_RESP = 0x80000006
+CMD_BIND_TRANSCEIVER = 0x00000009
+CMD_ENQUIRE_LINK = 0x00000015
+CMD_ENQUIRE_LINK_RESP = 0x80000015
+RESP_BIT = 0x80000000
+
+ESME_ROK = 0x00000000
+
+BIND_COMMANDS = {
+    "TRANSMITTER": CMD_BIND_TRANSMITTER,
+    "RECEIVER": CMD_BIND_RECEIVER,
+    "TRANSCEIVER": CMD_BIND_TRANSCEIVER,
+}
+
+# submit_sm a single bind may have waiting for submit_sm_resp
+VENDOR_SUBMIT_WINDOW = int(os.environ.get("SMPP_VENDOR_SUBMIT_WINDOW", 10))
+# Seconds to wait for a submit_sm_resp / enquire_link_resp
+VENDOR_RESP_TIMEOUT = float(os.environ.get("SMPP_VENDOR_RESP_TIMEOUT", 30))
+# Seconds between our enquire_links
+VENDOR_ENQUIRE_LINK_INTERVAL = float(
+    os.environ.get("SMPP_VENDOR_ENQUIRE_LINK_INTERVAL", 30)
+)
+VENDOR_CONNECT_TIMEOUT = float(os.environ.get("SMPP_VENDOR_CONNECT_TIMEOUT", 10))
+# Tick of the resp timer wheel (seconds): timeouts fire up to this much late
+VENDOR_TIMER_RESOLUTION = float(os.environ.get("SMPP_VENDOR_TIMER_RESOLUTION", 0.5))
+
+
+class BindError(ConnectionError):
+    """The vendor refused the bind, or the link died while we waited on it."""
+
+
+class BindClosed(ConnectionError):
+    """The bind closed before this submit_sm went out; safe to send elsewhere."""
+
+
+class VendorBind:
+    """
+    One asyncio SMPP bind (ESME side) to a vendor. Up to `window` submit_sm
+    are on the wire at once; each caller of submit() waits on its own
+    sequence number, which the read loop resolves when the submit_sm_resp
+    arrives, in whatever order the vendor answers.
+
+    Incoming deliver_sm (DLRs) are decoded and handed to on_deliver(pdu)
+    before the deliver_sm_resp goes back. With a pacer (vendorShaping.Pacer)
+    every submit_sm also waits for the vendor's TPS. A submit_sm_resp that
+    arrives after its submit timed out goes to on_late_resp(context,
+    command_status, message_id).
+    """
+
+    def __init__(
+        self,
+        config,
+        on_deliver=None,
+        window=VENDOR_SUBMIT_WINDOW,
+        resp_timeout=VENDOR_RESP_TIMEOUT,
+        enquire_link_interval=VENDOR_ENQUIRE_LINK_INTERVAL,
+        connect_timeout=VENDOR_CONNECT_TIMEOUT,
+        pacer=None,
+        on_late_resp=None,
+    ):
+        self.config = config
+        self.on_deliver = on_deliver
+        self.on_late_resp = on_late_resp
+        self.window = asyncio.Semaphore(max(1, window))
+        self.resp_timeout = resp_timeout
+        self.enquire_link_interval = enquire_link_interval
+        self.connect_timeout = connect_timeout
+        self.pacer = pacer
+        self.reader = None
+        self.writer = None
+        self.framer = None
+        self.read_task = None
+        self.timer_task = None
+        self.background_tasks = set()
+        self.write_lock = asyncio.Lock()
+        # sequence number -> future of (status, body), with its deadline
+        self.sequences = SequenceTracker(
+            max(resp_timeout, connect_timeout), VENDOR_TIMER_RESOLUTION
+        )
+        self.submitting = 0  # submit() calls in progress, queued ones included
+        self.next_seq = 1
+        self.closed = asyncio.Event()
+        self.bound = False
+
+    @property
+    def alive(self):
+        return self.bound and not self.closed.is_set()
+
+    @property
+    def in_flight(self):
+        return len(self.sequences)
+
+    @property
+    def load(self):
+        """What the dispatcher balances on: submits sent or waiting to be."""
+        return self.submitting
+
+    def stats(self):
+        """In flight now, plus what happened to the resps since the bind opened."""
+        stats = self.sequences.stats()
+        stats["queued"] = max(0, self.submitting - stats["in_flight"])
+        return stats
+
+    def allocate_seq(self):
+        seq_num = self.next_seq
+        self.next_seq = 1 if seq_num >= 0x7FFFFFFF else seq_num + 1
+        return seq_num
+
+    async def send_pdu(self, cmd_id, seq_num, body=b"", status=ESME_ROK):
+        async with self.write_lock:
+            self.writer.write(
+                PDU_HEADER.pack(16 + len(body), cmd_id, status, seq_num) + body
+            )
+            await self.writer.drain()
+
+    async def request(self, cmd_id, body=b"", timeout=None, context=None):
+        """Sends a PDU and waits for its resp; returns (command_status, resp body)."""
+        seq_num = self.allocate_seq()
+        future = self.sequences.add(
+            seq_num, timeout or self.resp_timeout, cmd_id, context
+        )
+        try:
+            await self.send_pdu(cmd_id, seq_num, body)
+            return await future
+        finally:
+            self.sequences.discard(seq_num)
+
+    async def connect(self):
+        """Opens the socket and binds; raises BindError if the vendor says no."""
+        config = self.config
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(config.smppHost, config.smppPort),
+            self.connect_timeout,
+        )
+        self.framer = PduFramer(self.reader)
+        self.read_task = asyncio.create_task(self.read_loop())
+        self.timer_task = asyncio.create_task(self.timer_loop())
+
+        mode = (config.bindMode or "").upper()
+        bind_cmd = BIND_COMMANDS.get(mode, CMD_BIND_TRANSCEIVER)
+        try:
+            status, _ = await self.request(
+                bind_cmd,
+                encode_bind(config.systemID, config.password),
+                timeout=self.connect_timeout,
+            )
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            await self.close()
+            raise BindError(f"No bind response from {config.smppHost}: {e}") from e
+        if status != ESME_ROK:
+            await self.close()
+            raise BindError(f"Bind rejected by {config.smppHost}: {hex(status)}")
+        self.bound = True
+
+    async def submit(self, body, context=None):
+        """
+        Sends one submit_sm once the window has room (and the pacer, if
+        any, lets it go). Returns
+        (command_status, vendor message_id); raises asyncio.TimeoutError
+        without a resp, BindClosed if the bind was gone before the submit_sm
+        was sent and ConnectionError if it dropped after. context (the
+        part id, say) comes back in on_late_resp if the resp is late.
+        """
+        self.submitting += 1
+        try:
+            async with self.window:
+                if self.pacer is not None:
+                    await self.pacer.acquire()
+                if not self.alive:
+                    raise BindClosed("Vendor bind is closed")
+                status, resp_body = await self.request(
+                    CMD_SUBMIT_SM, body, context=context
+                )
+        finally:
+            self.submitting -= 1
+        return status, self.resp_message_id(status, resp_body)
+
+    @staticmethod
+    def resp_message_id(status, resp_body):
+        message_id = ""
+        if status == ESME_ROK and resp_body:
+            message_id, _ = read_c_string(resp_body, 0)
+        return message_id
+
+    async def read_loop(self):
+        try:
+            while True:
+                frame = await self.framer.read_frame()
+                if frame is None:
+                    break
+                _, cmd_id, status, seq_num, body = frame
+                if cmd_id & RESP_BIT:
+                    if self.sequences.resolve(seq_num, (status, body)):
+                        continue
+                    late = self.sequences.pop_expired(seq_num)
+                    if late is not None:
+                        self.handle_late_resp(cmd_id, status, body, *late)
+                    elif cmd_id == CMD_GENERIC_NACK:
+                        logger.warning(
+                            f"generic_nack {hex(status)} from {self.config.smppHost}"
+                        )
+                elif cmd_id == CMD_DELIVER_SM:
+                    # DLR bookkeeping hits the DB; don't hold up the resps behind it
+                    # (the vendor's own window bounds how many run at once)
+                    self.background(self.handle_deliver_sm(seq_num, body))
+                elif cmd_id == CMD_ENQUIRE_LINK:
+                    await self.send_pdu(CMD_ENQUIRE_LINK_RESP, seq_num)
+                elif cmd_id == CMD_UNBIND:
+                    await self.send_pdu(CMD_UNBIND_RESP, seq_num)
+                    break
+                else:
+                    await self.send_pdu(CMD_GENERIC_NACK, seq_num, status=0x00000003)
+        except asyncio.CancelledError:
+            raise
+        except (ConnectionError, OSError, PduDecodeError) as e:
+            logger.warning(f"Lost connection to {self.config.smppHost}: {e}")
+        finally:
+            self.mark_closed()
+
+    def background(self, coro):
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    def handle_late_resp(self, cmd_id, status, body, request_cmd_id, context):
+        logger.warning(
+            f"Late resp {hex(cmd_id)} ({hex(status)}) from {self.config.smppHost} "
+            f"for a request that already timed out"
+        )
+        if request_cmd_id != CMD_SUBMIT_SM or self.on_late_resp is None:
+            return
+        message_id = self.resp_message_id(status, body)
+        self.background(self.report_late_resp(context, status, message_id))
+
+    async def report_late_resp(self, context, status, message_id):
+        try:
+            await self.on_late_resp(context, status, message_id)
+        except Exception as e:
+            logger.error(f"Late resp handler error: {e}")
+
+    async def timer_loop(self):
+        """Times out unanswered requests, one wheel tick at a time."""
+        while not self.closed.is_set():
+            await asyncio.sleep(self.sequences.resolution)
+            self.sequences.expire()
+
+    async def handle_deliver_sm(self, seq_num, body):
+        try:
+            pdu = decode_submit_sm(body)  # deliver_sm has the same layout
+        except PduDecodeError as e:
+            logger.warning(f"Bad deliver_sm from {self.config.smppHost}: {e}")
+        else:
+            if self.on_deliver is not None:
+                try:
+                    await self.on_deliver(pdu)
+                except Exception as e:
+                    logger.error(f"DLR handler error: {e}")
+        if self.alive:
+            try:
+                await self.send_pdu(CMD_DELIVER_SM_RESP, seq_num, b"\0")
+            except (ConnectionError, OSError):
+                pass  # the vendor resends it after we reconnect
+
+    async def heartbeat_loop(self):
+        """enquire_link every interval; a link that doesn't answer is closed."""
+        while self.alive:
+            await asyncio.sleep(self.enquire_link_interval)
+            if not self.alive:
+                break
+            try:
+                await self.request(CMD_ENQUIRE_LINK)
+            except (asyncio.TimeoutError, ConnectionError, OSError) as e:
+                logger.warning(
+                    f"{self.config.smppHost} stopped answering enquire_link: {e!r}"
+                )
+                await self.close()
+
+    async def run(self):
+        """Keeps the bind alive until it drops; returns when it is closed."""
+        heartbeat = asyncio.create_task(self.heartbeat_loop())
+        try:
+            await self.closed.wait()
+        finally:
+            heartbeat.cancel()
+
+    def mark_closed(self):
+        self.bound = False
+        self.closed.set()
+        # Wake everyone still waiting on a resp that will never come
+        self.sequences.close(ConnectionError("Vendor bind closed"))
+        if self.timer_task is not None:
+            self.timer_task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+
+    async def close(self, unbind=False):
+        if unbind and self.alive:
+            try:
+                await self.request(CMD_UNBIND, timeout=2)
+            except (asyncio.TimeoutError, ConnectionError, OSError):
+                pass
+        self.mark_closed()
+        task = self.read_task
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
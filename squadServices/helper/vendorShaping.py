@@ -0,0 +1,169 @@
+import asyncio
+import os
+import time
+
+from squadServices.helper.vendorBind import (
+    VENDOR_CONNECT_TIMEOUT,
+    VENDOR_ENQUIRE_LINK_INTERVAL,
+    VENDOR_RESP_TIMEOUT,
+    VENDOR_SUBMIT_WINDOW,
+)
+
+# Bucket size, in seconds of traffic at the vendor's TPS: how much may go out
+# back to back after an idle spell. Small, so a vendor counting per second
+# never sees more than its rateTps.
+VENDOR_BURST_SECONDS = float(os.environ.get("SMPP_VENDOR_BURST_SECONDS", 0.1))
+
+# Vendors without a VendorPolicy keep the old fixed behaviour
+DEFAULT_RECONNECT_DELAY = 30.0
+DEFAULT_THROTTLE_DELAY = 10.0
+
+# submit_sm_resp statuses that mean "slow down", not "this message is bad"
+ESME_RMSGQFUL = 0x00000014
+ESME_RTHROTTLED = 0x00000058
+THROTTLE_STATUSES = {ESME_RMSGQFUL, ESME_RTHROTTLED}
+
+
+def smallest(values, default):
+    """Lowest positive value; 0 / None in a policy means "not set"."""
+    return min((value for value in values if value and value > 0), default=default)
+
+
+def largest(values, default):
+    return max((value for value in values if value and value > 0), default=default)
+
+
+class VendorLimits:
+    """What the VendorPolicy allows on one SMPP config (per bind, and binds)."""
+
+    def __init__(
+        self,
+        tps=0,
+        window=VENDOR_SUBMIT_WINDOW,
+        max_sessions=1,
+        resp_timeout=VENDOR_RESP_TIMEOUT,
+        enquire_link_interval=VENDOR_ENQUIRE_LINK_INTERVAL,
+        connect_timeout=VENDOR_CONNECT_TIMEOUT,
+        throttle_delay=DEFAULT_THROTTLE_DELAY,
+        connect_retry_delay=DEFAULT_RECONNECT_DELAY,
+        connect_retry_count=0,
+        bind_retry_delay=DEFAULT_RECONNECT_DELAY,
+        bind_retry_count=0,
+        recovery_delay=DEFAULT_RECONNECT_DELAY,
+    ):
+        self.tps = tps  # 0 = unlimited
+        self.window = window
+        self.max_sessions = max_sessions
+        self.resp_timeout = resp_timeout
+        self.enquire_link_interval = enquire_link_interval
+        self.connect_timeout = connect_timeout
+        self.throttle_delay = throttle_delay
+        self.connect_retry_delay = connect_retry_delay
+        self.connect_retry_count = connect_retry_count
+        self.bind_retry_delay = bind_retry_delay
+        self.bind_retry_count = bind_retry_count
+        self.recovery_delay = recovery_delay
+
+    @classmethod
+    def from_policies(cls, policies):
+        """
+        Several vendors may share one SMPP config, and so its binds: the
+        strictest of their policies wins.
+        """
+        policies = [p for p in policies if p is not None and not p.isDeleted]
+        if not policies:
+            return cls()
+        return cls(
+            tps=smallest((p.rateTps for p in policies), 0),
+            window=smallest((p.sendQueueLimit for p in policies), VENDOR_SUBMIT_WINDOW),
+            max_sessions=smallest((p.maxSession for p in policies), 1),
+            resp_timeout=smallest(
+                (p.responseTimeout for p in policies), VENDOR_RESP_TIMEOUT
+            ),
+            enquire_link_interval=smallest(
+                (p.enquireLinkInterval for p in policies), VENDOR_ENQUIRE_LINK_INTERVAL
+            ),
+            connect_timeout=smallest(
+                (p.connectionTimeout for p in policies), VENDOR_CONNECT_TIMEOUT
+            ),
+            throttle_delay=largest(
+                (p.delayTime for p in policies), DEFAULT_THROTTLE_DELAY
+            ),
+            connect_retry_delay=largest((p.connectionRetryDelay for p in policies), 0),
+            connect_retry_count=min(p.connectionRetryCount for p in policies),
+            bind_retry_delay=largest((p.bindRetryDelay for p in policies), 0),
+            bind_retry_count=min(p.bindRetryCount for p in policies),
+            recovery_delay=largest(
+                (p.connectionRecoveryDelay for p in policies), DEFAULT_RECONNECT_DELAY
+            ),
+        )
+
+    def reconnect_delay(self, failures, bind_failed):
+        """
+        Seconds to wait before dialing again after `failures` failed attempts
+        in a row: the retry delay for the first retry-count attempts, then
+        the (longer) recovery delay.
+        """
+        if failures <= 0:
+            return 0
+        if bind_failed:
+            delay, count = self.bind_retry_delay, self.bind_retry_count
+        else:
+            delay, count = self.connect_retry_delay, self.connect_retry_count
+        return delay if failures <= count else self.recovery_delay
+
+
+class Pacer:
+    """
+    Token bucket for the submits of one vendor bind (vendors count TPS per
+    bind, so each of a vendor's binds gets its own). Unlike the inbound
+    TokenBucketLimiter, which refuses a client that is too fast, acquire()
+    waits until the vendor's TPS allows the next submit_sm, so we run right
+    at the limit instead of being throttled.
+    """
+
+    def __init__(self, rate=0):
+        self.rate = 0
+        self.burst = 1.0
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()  # FIFO: waiters go out in the order they came
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        """Follows policy edits without a rebind."""
+        rate = max(0, rate or 0)
+        if rate == self.rate:
+            return
+        self.refill()
+        self.rate = rate
+        self.burst = max(1.0, rate * VENDOR_BURST_SECONDS)
+        self.tokens = min(self.tokens, self.burst)
+
+    def refill(self):
+        now = time.monotonic()
+        if self.rate > 0:
+            elapsed = max(0.0, now - self.updated)
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated = max(self.updated, now)
+
+    def pause(self, seconds):
+        """The vendor said slow down: nothing goes out for a while, then we ramp up."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        self.updated = self.paused_until
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0:
+                    if self.rate <= 0:
+                        return
+                    self.refill()
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                await asyncio.sleep(wait)
@@ -1,47 +1,83 @@
-from datetime import timedelta
+import asyncio
+import os
 import time
 import logging
-import socket
 import re
-import smpplib.client
-import smpplib.consts
+import redis
 from django.core.management.base import BaseCommand
 from squadServices.models.connectivityModel.verdor import Vendor, VendorSession
 from squadServices.models.smpp.smppSMS import (
     DLREvent,
     MessageAttempt,
-    SMSMessage,
     SMSMessagePart,
 )
-from django.utils import timezone
-import smpplib.exceptions
 from squadServices.models.detailedReport.detailedReport import (
     DetailedSMSReport,
 )
-import smpplib.smpp
 from django.utils import timezone
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from django.db import transaction
+from squadServices.helper.bindOwnership import CLAIMED, HELD_ELSEWHERE, BindOwnership
+from squadServices.helper.clientDlrStream import publish_client_dlr
+from squadServices.helper.dbExecutor import db_sync_to_async
+from squadServices.helper.partClaim import (
+    CLAIM_LEASE_SECONDS,
+    DISPATCH_SMPP_IDS,
+    claim_parts,
+    dispatcher_token,
+    release_claims,
+    renew_claims,
+)
+from squadServices.helper.smppPdu import encode_submit_sm
+from squadServices.helper.smsCodec import DATA_CODING
+from squadServices.helper.vendorBind import BindClosed, BindError, VendorBind
+from squadServices.helper.vendorShaping import THROTTLE_STATUSES, Pacer, VendorLimits
 
 # Turn on X-Ray Vision for raw network packets
 # logging.basicConfig(level=logging.DEBUG)
 logging.basicConfig(level=logging.INFO)
-# logging.getLogger("smpplib").setLevel(logging.DEBUG)
-logging.getLogger("smpplib").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+# Parts taken from the queue per poll
+VENDOR_FETCH_BATCH = int(os.environ.get("SMPP_VENDOR_FETCH_BATCH", 500))
+# Parts this process may hold between "taken from the queue" and "resp recorded"
+VENDOR_MAX_PENDING = int(os.environ.get("SMPP_VENDOR_MAX_PENDING", 2000))
+# Times a part whose submit_sm_resp never came is put back in the queue
+# before it fails. The vendor may have taken it and lost only the resp, so
+# a retry can deliver it twice: off unless you'd rather risk that.
+VENDOR_TIMEOUT_RETRIES = int(os.environ.get("SMPP_VENDOR_TIMEOUT_RETRIES", 0))
+# How often each bind's in-flight count and resp timeouts are logged (seconds, 0 = never)
+VENDOR_STATS_INTERVAL = float(os.environ.get("SMPP_VENDOR_STATS_INTERVAL", 60))
+# A DLR can overtake the recording of its own submit_sm_resp; wait this
+# long (seconds, in steps) for the vendor id to be linked before giving up
+DLR_LINK_RETRY_DELAYS = (0.2, 1.0, 3.0)
+
 
 class Command(BaseCommand):
     help = "Runs a Multi-Gateway SMPP Client Manager (UDH Part Architecture)"
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # smpp config id -> its live VendorBinds, up to the policy's
+        # maxSession (one asyncio task owns each)
         self.sessions = {}
-        # This maps the SMPP Sequence Number to our Database PART ID
-        self.sequence_to_part_id = {}
-        self.last_sweep_time = 0
-        self.last_enquire_link = {}  # ⚡️ Tracks heartbeat
+        self.session_ids = {}  # VendorBind -> its VendorSession ids
+        self.connecting = {}  # smpp config id -> binds being dialed
+        # smpp config id -> VendorLimits from its vendors' VendorPolicy,
+        # re-read every poll
+        self.limits = {}
+        # smpp config id -> (failed attempts in a row, last one failed at bind)
+        self.connect_failures = {}
+        # Parts claimed by us and handed to a bind whose submit_sm_resp isn't
+        # recorded yet (their claim is renewed until it is)
+        self.dispatching = set()
+        self.tasks = set()
+        # Other dispatchers skip the parts we claimed under this token
+        self.worker_token = dispatcher_token()
+        # SMPP config ids whose binds this dispatcher owns (see bindOwnership)
+        self.owned = set()
+        self.ownership = BindOwnership(self.worker_token)
 
     def broadcast_vendor_status(self, vendor_id, host, status):
         """Helper to push live Vendor status to the React Dashboard"""
@@ -58,314 +94,508 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS("Starting Multi-Gateway SMPP Manager..."))
-        Vendor.objects.update(bindStatus="OFFLINE")
-        VendorSession.objects.update(status="OFFLINE")
+        if DISPATCH_SMPP_IDS:
+            self.stdout.write(
+                f"Dispatching for SMPP configs {sorted(DISPATCH_SMPP_IDS)} "
+                f"as {self.worker_token}"
+            )
+        # No blanket OFFLINE reset here: other dispatchers may hold binds.
+        # Each vendor is reset when we take it over (take_ownership).
 
         try:
-            while True:
-                try:
-                    active_vendors = Vendor.objects.filter(
-                        isDeleted=False
-                    ).select_related("smpp")
-
-                    # Starts a connection to the Vendor SMPP server
-                    # First it checks self.session if the vendor is already connected
-                    # if it is not connected then it will connect
-                    for vendor in active_vendors:
-                        if vendor.smpp:
-                            smpp_id = vendor.smpp.id
-                            # If we are not connected to this vendor's SMPP, try to connect!
-                            if smpp_id not in self.sessions:
-                                # 10-second cooldown so we don't spam the vendor's server if it's down
-                                last_attempt_ts = (
-                                    vendor.lastAttemptAt.timestamp()
-                                    if vendor.lastAttemptAt
-                                    else 0
-                                )
-                                manual_retry_requested = False
-                                if vendor.lastRetryAt:
-                                    if vendor.lastRetryAt.timestamp() > last_attempt_ts:
-                                        manual_retry_requested = True
-
-                                # 3. Determine if we should try connecting now
-                                cooldown_passed = time.time() - last_attempt_ts > 30
-
-                                if cooldown_passed or manual_retry_requested:
-                                    reason = (
-                                        "MANUAL RETRY"
-                                        if manual_retry_requested
-                                        else "AUTO RETRY"
-                                    )
-                                    self.stdout.write(
-                                        self.style.MIGRATE_LABEL(
-                                            f"[{reason}] Connecting to {vendor.smpp.smppHost}..."
-                                        )
-                                    )
-                                    vendor.lastAttemptAt = timezone.now()
-                                    vendor.save(update_fields=["lastAttemptAt"])
-                                    self.stdout.write(
-                                        f"Background: Connecting to {vendor.smpp.smppHost}..."
-                                    )
-                                    client = self.connect_to_gateway(vendor.smpp)
-                                    if client:
-                                        self.sessions[smpp_id] = client
-                    # ---> 1. Professionally clean up unresponsive vendor messages first
-                    # ONLY run the sweeper once every 60 seconds to save database performance
-                    if time.time() - self.last_sweep_time > 60:
-                        self.sweep_stale_submissions()
-                        self.last_sweep_time = time.time()  # Reset the clock
-                    # STEP 1: Process Outgoing Queue (NOW PULLING PARTS, NOT PARENT MESSAGES)
-                    # We use select_related to easily access the parent message's config
-                    queued_parts = (
-                        SMSMessagePart.objects.filter(submit_status="QUEUED")
-                        .select_related("message", "message__smpp")
-                        .order_by("message__createdAt", "part_no")[
-                            :10
-                        ]  # worker constantly polls the database for up to 10 SMSMessagePart rows where submit_status="QUEUED"
-                    )
-
-                    for part in queued_parts:
-                        parent_msg = part.message
-                        if parent_msg.status == "failed":
-                            part.submit_status = "FAILED"
-                            part.failed_at = timezone.now()
-                            part.failure_reason = (
-                                "Cancelled: Parent message already failed."
-                            )
-                            part.save(
-                                update_fields=[
-                                    "submit_status",
-                                    "failed_at",
-                                    "failure_reason",
-                                ]
-                            )
-                            continue
-                        # ------------------------------------------------
-                        if not parent_msg.smpp:
-                            part.submit_status = "FAILED"
-                            part.save()
-                            continue
-
-                        smpp_id = parent_msg.smpp.id
-                        # Instead of opening a brand new connection for every single text message
-                        # (which would be incredibly slow and get you blocked by the vendor),
-                        # this code uses a "Connection Pool" and a "Cooldown Timer."
-                        # Connection Management
-
-                        # Think of self.sessions as a dictionary of active phone calls.
-                        # If you already have an open line to "RouteMobile" (smpp_id = 1),
-                        # it skips this entire block and reuses the open line.
-
-                        # ⚡️ CLEANER LOGIC: Block 0 handles connecting. If it's missing, it's Offline.
-                        if smpp_id not in self.sessions:
-                            part.submit_status = "FAILED"
-                            part.failed_at = timezone.now()
-                            part.failure_reason = "Vendor Offline (System is attempting to reconnect in background)."
-                            part.save(
-                                update_fields=[
-                                    "submit_status",
-                                    "failed_at",
-                                    "failure_reason",
-                                ]
-                            )
-                            self.update_parent_message_status(parent_msg)
-                            continue
-
-                        # Send the specific part
-                        client = self.sessions[smpp_id]
-                        self.send_single_part(client, part, parent_msg.smpp)
-
-                    # ==============================================================================
-                    # STEP 2: Listen for DLRs on all active sessions
-                    # ==============================================================================
-
-                    current_time = time.time()
-                    for smpp_id, client in list(self.sessions.items()):
-                        try:
-                            client.read_once()
-                            # ⚡️ THE PULSE CHECK (Heartbeat)
-                            last_ping = self.last_enquire_link.get(smpp_id, 0)
-                            if current_time - last_ping > 30:
-                                pdu = smpplib.smpp.make_pdu(
-                                    "enquire_link", client=client
-                                )
-                                client.send_pdu(pdu)
-                                self.last_enquire_link[smpp_id] = current_time
-                        except socket.timeout:
-                            pass
-                        except (smpplib.exceptions.ConnectionError, OSError):
-                            self.stdout.write(
-                                self.style.ERROR(
-                                    f"Lost connection to Gateway {smpp_id}"
-                                )
-                            )
-                            del self.sessions[smpp_id]
-                            # ⚡️ DB UPDATE & WEBSOCKET BROADCAST (OFFLINE)
-                            vendors_offline = Vendor.objects.filter(smpp_id=smpp_id)
-                            vendors_offline.update(bindStatus="OFFLINE")
-                            # In your finally cleanup:
-                            if hasattr(client, "db_session_ids"):
-                                VendorSession.objects.filter(
-                                    sessionId__in=client.db_session_ids
-                                ).update(
-                                    status="OFFLINE", disconnectedAt=timezone.now()
-                                )
-                            channel_layer = get_channel_layer()
-                            for v in vendors_offline:
-                                async_to_sync(channel_layer.group_send)(
-                                    "dashboard_updates",
-                                    {
-                                        "type": "vendor_session_change",
-                                        "vendor_id": v.id,
-                                        "status": "OFFLINE",
-                                    },
-                                )
-                                host_name = v.smpp.smppHost if v.smpp else "Unknown"
-                                self.broadcast_vendor_status(v.id, host_name, "OFFLINE")
-
-                    if not queued_parts:
-                        time.sleep(1)
-
-                except KeyboardInterrupt:
-                    break
-                except Exception as e:
-                    logger.error(f"Global Loop Error: {e}")
-                    time.sleep(2)
+            asyncio.run(self.run())
         except KeyboardInterrupt:
             self.stdout.write(
                 self.style.WARNING("\nStopping Manager... Cleaning up binds.")
             )
-
         finally:
-            # ⚡️ THE FINAL CLEANUP (Runs on Ctrl+C)
-            self.stdout.write("Broadcasting OFFLINE status to all vendors...")
-            channel_layer = get_channel_layer()
-            # 1. Loop through active sessions to mark them OFFLINE in the DB
-            for smpp_id, cli in self.sessions.items():
-                if hasattr(cli, "db_session_ids"):
-                    VendorSession.objects.filter(
-                        sessionId__in=cli.db_session_ids
-                    ).update(status="OFFLINE", disconnectedAt=timezone.now())
-                associated_vendors = Vendor.objects.filter(smpp_id=smpp_id)
-                for v in associated_vendors:
-                    async_to_sync(channel_layer.group_send)(
-                        "dashboard_updates",
-                        {
-                            "type": "vendor_session_change",
-                            "vendor_id": v.id,
-                            "status": "OFFLINE",
-                        },
-                    )
-                try:
-                    cli.disconnect()
-                except:
-                    pass
+            self.cleanup()
 
-            # 2. Update the main Vendor Table
-            Vendor.objects.filter(isDeleted=False).update(bindStatus="OFFLINE")
+    def served_vendors(self):
+        vendors = Vendor.objects.filter(isDeleted=False)
+        if DISPATCH_SMPP_IDS:
+            vendors = vendors.filter(smpp_id__in=DISPATCH_SMPP_IDS)
+        return vendors
 
-            # 3. Final WebSocket Broadcast to update the React UI
-            all_vendors = Vendor.objects.filter(isDeleted=False).select_related("smpp")
-            for v in all_vendors:
+    def spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def run(self):
+        """
+        The dispatcher: one task per vendor bind keeps that link up, and every
+        queued part becomes a task that waits for a slot in its bind's submit
+        window. Nothing waits on a single vendor's resp any more, so every
+        vendor runs at its own pace at the same time.
+        """
+        renewed_at = time.monotonic()
+        self.spawn(self.report_binds())
+        try:
+            while True:
                 try:
-                    host_name = v.smpp.smppHost if v.smpp else "Unknown"
-                    self.broadcast_vendor_status(v.id, host_name, "OFFLINE")
-                except:
-                    pass
+                    # Keep our claims from expiring while their parts wait
+                    # for a window slot or a resp
+                    if time.monotonic() - renewed_at > CLAIM_LEASE_SECONDS / 3:
+                        renewed_at = time.monotonic()
+                        if self.dispatching:
+                            await db_sync_to_async(renew_claims)(self.worker_token)
+
+                    # Opens binds to the Vendor SMPP servers (and replaces
+                    # dead ones) until each has its maxSession
+                    busy = {
+                        smpp_id: len(self.sessions.get(smpp_id, ()))
+                        + self.connecting.get(smpp_id, 0)
+                        for smpp_id in set(self.sessions) | set(self.connecting)
+                    }
+                    configs, limits = await db_sync_to_async(
+                        self.vendors_to_connect
+                    )(busy)
+                    self.apply_limits(limits)
+                    # Lost a vendor to another dispatcher (our lease ran out
+                    # during a stall): its binds are theirs to open now
+                    for smpp_id in set(self.sessions) - self.owned:
+                        for bind in list(self.sessions.get(smpp_id, ())):
+                            await bind.close(unbind=True)
+                    for config, missing in configs:
+                        self.connecting[config.id] = (
+                            self.connecting.get(config.id, 0) + missing
+                        )
+                        for _ in range(missing):
+                            self.spawn(self.keep_bind(config))
+
+                    # (Unresponsive vendor messages are failed by the
+                    # sweep-stale-submissions beat job, see staleMessageSweeper)
+                    fetched = await self.dispatch_queued_parts()
+                    if not fetched:
+                        await asyncio.sleep(1)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Global Loop Error: {e}")
+                    await asyncio.sleep(2)
+        finally:
+            for binds in list(self.sessions.values()):
+                for bind in list(binds):
+                    await bind.close(unbind=True)
 
-            self.stdout.write(self.style.SUCCESS("Cleanup complete. Goodbye!"))
+    def vendors_to_connect(self, busy):
+        """
+        (SMPP config, binds to open) we should dial now: configs with fewer
+        binds (open or being opened, counted in busy) than their maxSession,
+        if their policy's retry delay passed or someone pressed Retry on the
+        vendor. Only configs this dispatcher owns are dialed. Also returns
+        the VendorLimits of every config we serve.
+        """
+        vendors_by_smpp = {}
+        active_vendors = self.served_vendors().select_related("smpp", "policy")
+        for vendor in active_vendors:
+            if vendor.smpp:
+                vendors_by_smpp.setdefault(vendor.smpp.id, []).append(vendor)
+        limits = {
+            smpp_id: VendorLimits.from_policies(
+                getattr(vendor, "policy", None) for vendor in vendors
+            )
+            for smpp_id, vendors in vendors_by_smpp.items()
+        }
+
+        configs = []
+        for smpp_id, vendors in vendors_by_smpp.items():
+            # Another dispatcher binds to this one: maxSession counts across
+            # all of us, so leave it alone
+            if not self.take_ownership(smpp_id):
+                continue
+            # If we have fewer binds to this vendor's SMPP than it allows, open more!
+            missing = limits[smpp_id].max_sessions - busy.get(smpp_id, 0)
+            if missing <= 0:
+                continue
+            vendor = vendors[0]
+            # Wait out the policy's retry / recovery delay so we don't spam the
+            # vendor's server if it's down
+            last_attempt_ts = (
+                vendor.lastAttemptAt.timestamp() if vendor.lastAttemptAt else 0
+            )
+            manual_retry_requested = False
+            if vendor.lastRetryAt:
+                if vendor.lastRetryAt.timestamp() > last_attempt_ts:
+                    manual_retry_requested = True
+
+            # 3. Determine if we should try connecting now
+            failures, bind_failed = self.connect_failures.get(smpp_id, (0, False))
+            delay = limits[smpp_id].reconnect_delay(failures, bind_failed)
+            cooldown_passed = time.time() - last_attempt_ts > delay
+
+            if cooldown_passed or manual_retry_requested:
+                reason = "MANUAL RETRY" if manual_retry_requested else "AUTO RETRY"
+                self.stdout.write(
+                    self.style.MIGRATE_LABEL(
+                        f"[{reason}] Connecting to {vendor.smpp.smppHost}..."
+                    )
+                )
+                vendor.lastAttemptAt = timezone.now()
+                vendor.save(update_fields=["lastAttemptAt"])
+                configs.append((vendor.smpp, missing))
+        return configs, limits
 
-    # This method establishes a connection to the SMPP gateway and binds as per the configuration
-    def connect_to_gateway(self, config):
-        client = None
+    def take_ownership(self, smpp_id):
+        """Claims (or renews) this SMPP config for us; False if someone else has it."""
         try:
-            # This opens the raw TCP socket to the vendor's IP address and Port (like dialing a phone number).
-            client = smpplib.client.Client(config.smppHost, config.smppPort, timeout=1)
-
-            # Register Handlers
-            # If the vendor ever randomly sends us a Delivery Receipt, instantly pass it to my handle_incoming function.
+            claim = self.ownership.claim(smpp_id)
+        except redis.RedisError as e:
+            logger.warning(f"Vendor ownership unavailable, keeping what we have: {e}")
+            return smpp_id in self.owned
+        if claim == HELD_ELSEWHERE:
+            self.owned.discard(smpp_id)
+            return False
+        if claim == CLAIMED:
+            # Fresh (or taken over from a dispatcher that died): whatever
+            # status its vendors show is stale until we bind
+            self.reset_vendor_status(smpp_id)
+        self.owned.add(smpp_id)
+        return True
+
+    def reset_vendor_status(self, smpp_id):
+        vendors = Vendor.objects.filter(smpp_id=smpp_id)
+        vendors.update(bindStatus="OFFLINE")
+        VendorSession.objects.filter(
+            vendor__in=vendors.values("id"), status="ONLINE"
+        ).update(status="OFFLINE", disconnectedAt=timezone.now())
+
+    def apply_limits(self, limits):
+        """TPS changes apply at once; window and timeouts on the next bind."""
+        self.limits = limits
+        for smpp_id, binds in self.sessions.items():
+            if smpp_id in limits:
+                for bind in binds:
+                    bind.pacer.set_rate(limits[smpp_id].tps)
+
+    def bind_stats(self):
+        """smpp config id -> the stats() of each of its live binds."""
+        return {
+            smpp_id: [bind.stats() for bind in binds]
+            for smpp_id, binds in self.sessions.items()
+        }
+
+    async def report_binds(self, interval=VENDOR_STATS_INTERVAL):
+        if interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(interval)
+            for smpp_id, binds in self.bind_stats().items():
+                for number, stats in enumerate(binds, 1):
+                    logger.info(
+                        f"Gateway {smpp_id} bind {number}: "
+                        "{in_flight} in flight, {queued} queued, {sent} sent, "
+                        "{answered} answered, {timed_out} timed out, "
+                        "{late} late resps".format(**stats)
+                    )
 
-            # this run only after the bind is completed
-            client.set_message_received_handler(
-                lambda pdu: self.handle_incoming(pdu, config)
+    def stop_connecting(self, smpp_id):
+        left = self.connecting.get(smpp_id, 0) - 1
+        if left > 0:
+            self.connecting[smpp_id] = left
+        else:
+            self.connecting.pop(smpp_id, None)
+
+    def pick_bind(self, smpp_id):
+        """The live bind of this vendor with the fewest submits on it."""
+        binds = [bind for bind in self.sessions.get(smpp_id, ()) if bind.alive]
+        return min(binds, key=lambda bind: bind.load, default=None)
+
+    async def keep_bind(self, config):
+        """Dials and binds one link to a vendor, then owns it until it drops."""
+        self.stdout.write(f"Background: Connecting to {config.smppHost}...")
+        limits = self.limits.get(config.id) or VendorLimits()
+        bind = VendorBind(
+            config,
+            on_deliver=lambda pdu: self.handle_deliver(pdu, config),
+            window=limits.window,
+            resp_timeout=limits.resp_timeout,
+            enquire_link_interval=limits.enquire_link_interval,
+            connect_timeout=limits.connect_timeout,
+            pacer=Pacer(limits.tps),
+            on_late_resp=self.handle_late_resp,
+        )
+        connecting = True
+        try:
+            try:
+                await bind.connect()
+            except (BindError, OSError, asyncio.TimeoutError) as e:
+                failures, _ = self.connect_failures.get(config.id, (0, False))
+                bind_failed = isinstance(e, BindError)
+                self.connect_failures[config.id] = (failures + 1, bind_failed)
+                delay = limits.reconnect_delay(failures + 1, bind_failed)
+                logger.error(f"Connect failed: {e!r} (next attempt in {delay:g}s)")
+                return
+            self.connect_failures.pop(config.id, None)
+            self.session_ids[bind] = await db_sync_to_async(self.mark_bind_online)(
+                config
             )
-            # When the vendor replies 'Yes, I accept this message', pass that response to my handle_sent_confirmation function.
-            # this run only after the bind is completed
-
-            client.set_message_sent_handler(
-                lambda pdu: self.handle_sent_confirmation(pdu)
+            connecting = False
+            self.stop_connecting(config.id)
+            binds = self.sessions.setdefault(config.id, [])
+            binds.append(bind)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Vendor BOUND: {config.smppHost} is now ONLINE "
+                    f"({len(binds)} bind(s))"
+                )
             )
-            # The Network Connection (Ringing the Phone)
-            # This line has nothing to do with SMS yet.
-            # This simply tells your server to open a raw TCP/IP network socket to the vendor's IP address and Port.
-            # This is you dialing the phone number and hearing the line connect on the other end.
-            # You are connected, but no one knows who you are yet.
-            client.connect()
-            mode = config.bindMode.upper()
-            # Once the network line is open, you have to speak the SMPP language to log in. This is called a "Bind".
-            if mode == "TRANSMITTER":
-                client.bind_transmitter(
-                    system_id=config.systemID, password=config.password
+            await bind.run()
+        finally:
+            if connecting:
+                self.stop_connecting(config.id)
+            binds = self.sessions.get(config.id, [])
+            if bind in binds:
+                # The other binds keep sending; the next poll dials a replacement
+                binds.remove(bind)
+                if not binds:
+                    del self.sessions[config.id]
+                self.stdout.write(
+                    self.style.ERROR(
+                        f"Lost connection to Gateway {config.id} "
+                        f"({len(binds)} bind(s) left)"
+                    )
                 )
-            elif mode == "RECEIVER":
-                client.bind_receiver(
-                    system_id=config.systemID, password=config.password
+                await bind.close()
+                await db_sync_to_async(self.mark_bind_offline)(
+                    config.id, self.session_ids.pop(bind, []), last_bind=not binds
                 )
             else:
-                client.bind_transceiver(
-                    system_id=config.systemID, password=config.password
+                await bind.close()
+
+    def mark_bind_online(self, config):
+        """Flags the vendors on this link ONLINE; returns the new VendorSession ids."""
+        # 1. Update all related vendors to ONLINE
+        with transaction.atomic():
+            vendors_qs = Vendor.objects.filter(smpp=config)
+            vendors_qs.update(bindStatus="ONLINE")
+
+            # 2. Track these session IDs in a list
+            session_ids = []
+            channel_layer = get_channel_layer()  # ⚡️ Get Layer
+            for v in vendors_qs:
+                # Notify the React Dashboard via WebSocket
+                self.broadcast_vendor_status(v.id, config.smppHost, "ONLINE")
+
+                # ⚡️ Create a session record for EVERY vendor sharing this line
+                session = VendorSession.objects.create(
+                    vendor=v,
+                    gatewayIp=config.smppHost,
+                    bindType=config.bindMode,
+                    status="ONLINE",
+                )
+                session_ids.append(session.sessionId)
+                # ⚡️ ADD THIS HERE: Notify Dashboard of the new SESSION
+                async_to_sync(channel_layer.group_send)(
+                    "dashboard_updates",
+                    {
+                        "type": "vendor_session_change",
+                        "vendor_id": v.id,
+                        "status": "ONLINE",
+                    },
                 )
+        # 3. This ensures that when the socket drops, ALL session records are closed.
+        return session_ids
+
+    def mark_bind_offline(self, smpp_id, session_ids, last_bind=True):
+        # ⚡️ DB UPDATE & WEBSOCKET BROADCAST (OFFLINE)
+        vendors_offline = Vendor.objects.filter(smpp_id=smpp_id)
+        if last_bind:
+            # The vendor stays ONLINE while any of its other binds is up
+            vendors_offline.update(bindStatus="OFFLINE")
+        if session_ids:
+            VendorSession.objects.filter(sessionId__in=session_ids).update(
+                status="OFFLINE", disconnectedAt=timezone.now()
+            )
+        channel_layer = get_channel_layer()
+        for v in vendors_offline.select_related("smpp"):
+            async_to_sync(channel_layer.group_send)(
+                "dashboard_updates",
+                {
+                    "type": "vendor_session_change",
+                    "vendor_id": v.id,
+                    "status": "OFFLINE",
+                },
+            )
+            if last_bind:
+                host_name = v.smpp.smppHost if v.smpp else "Unknown"
+                self.broadcast_vendor_status(v.id, host_name, "OFFLINE")
+
+    def cleanup(self):
+        # ⚡️ THE FINAL CLEANUP (Runs on Ctrl+C)
+        self.stdout.write("Broadcasting OFFLINE status to all vendors...")
+        channel_layer = get_channel_layer()
+        # 1. Loop through the binds we had to mark their sessions OFFLINE in the DB
+        for bind, session_ids in self.session_ids.items():
+            VendorSession.objects.filter(sessionId__in=session_ids).update(
+                status="OFFLINE", disconnectedAt=timezone.now()
+            )
+            associated_vendors = Vendor.objects.filter(smpp_id=bind.config.id)
+            for v in associated_vendors:
+                async_to_sync(channel_layer.group_send)(
+                    "dashboard_updates",
+                    {
+                        "type": "vendor_session_change",
+                        "vendor_id": v.id,
+                        "status": "OFFLINE",
+                    },
+                )
+
+        # 2. Give back the parts we claimed but never got a resp for
+        released = release_claims(self.worker_token)
+        if released:
+            self.stdout.write(f"Returned {released} claimed parts to the queue.")
+
+        # 3. Update the main Vendor Table (only the vendors we owned; the
+        # other dispatchers' binds are still up)
+        owned_vendors = Vendor.objects.filter(isDeleted=False, smpp_id__in=self.owned)
+        owned_vendors.update(bindStatus="OFFLINE")
+        self.ownership.release(self.owned)
 
-            # 1. Update all related vendors to ONLINE
-            with transaction.atomic():
-                vendors_qs = Vendor.objects.filter(smpp=config)
-                vendors_qs.update(bindStatus="ONLINE")
-
-                # 2. Track these session IDs in a list
-                session_ids = []
-                channel_layer = get_channel_layer()  # ⚡️ Get Layer
-                for v in vendors_qs:
-                    print("~~~~~~~~~~~~~~~", v)
-                    # Notify the React Dashboard via WebSocket
-                    self.broadcast_vendor_status(v.id, config.smppHost, "ONLINE")
-
-                    # ⚡️ Create a session record for EVERY vendor sharing this line
-                    session = VendorSession.objects.create(
-                        vendor=v,
-                        gatewayIp=config.smppHost,
-                        bindType=config.bindMode,
-                        status="ONLINE",
+        # 4. Final WebSocket Broadcast to update the React UI
+        all_vendors = owned_vendors.select_related("smpp")
+        for v in all_vendors:
+            try:
+                host_name = v.smpp.smppHost if v.smpp else "Unknown"
+                self.broadcast_vendor_status(v.id, host_name, "OFFLINE")
+            except:
+                pass
+
+        self.stdout.write(self.style.SUCCESS("Cleanup complete. Goodbye!"))
+
+    # ==============================================================================
+    # OUTGOING: queued parts -> vendor binds
+    # ==============================================================================
+
+    async def dispatch_queued_parts(self):
+        """Hands the next queued parts to their binds; returns how many were taken."""
+        room = VENDOR_MAX_PENDING - len(self.dispatching)
+        if room <= 0:
+            return 0
+        parts, fetched = await db_sync_to_async(self.take_queued_parts)(
+            min(room, VENDOR_FETCH_BATCH),
+            set(self.sessions),
+            set(self.connecting),
+            set(self.owned),
+        )
+        for part in parts:
+            self.dispatching.add(part.id)
+            self.spawn(self.send_part(part))
+        return fetched
+
+    def take_queued_parts(
+        self, limit, live_smpp_ids, connecting_smpp_ids=(), owned_smpp_ids=()
+    ):
+        """
+        Claims the next QUEUED parts of the vendors we own: bound ones to
+        send, offline ones to fail here, like before, instead of leaving
+        them in the queue. Vendors other dispatchers own are theirs. Vendors
+        we are still dialing (and have no live bind to) keep their parts
+        QUEUED until the bind is up or has failed. Parts that can't be sent (parent
+        already failed, no SMPP config, vendor offline) are failed on the spot.
+        Returns (sendable parts, number of parts claimed).
+        """
+        still_connecting = set(connecting_smpp_ids) - live_smpp_ids
+        queued_parts = claim_parts(
+            self.worker_token,
+            limit,
+            (set(owned_smpp_ids) | live_smpp_ids) - still_connecting,
+            # Only a dispatcher serving everything takes the unrouted parts
+            include_unrouted=not DISPATCH_SMPP_IDS,
+        )
+
+        sendable = []
+        for part in queued_parts:
+            parent_msg = part.message
+            if parent_msg.status == "failed":
+                part.submit_status = "FAILED"
+                part.failed_at = timezone.now()
+                part.failure_reason = "Cancelled: Parent message already failed."
+                part.save(update_fields=["submit_status", "failed_at", "failure_reason"])
+                continue
+            # ------------------------------------------------
+            if not parent_msg.smpp:
+                part.submit_status = "FAILED"
+                part.save()
+                continue
+
+            # ⚡️ CLEANER LOGIC: keep_bind handles connecting (those aren't claimed).
+            # If it's neither live nor connecting, it's Offline.
+            if parent_msg.smpp.id not in live_smpp_ids:
+                self.fail_part_offline(part)
+                continue
+            sendable.append(part)
+        return sendable, len(queued_parts)
+
+    def fail_part_offline(self, part):
+        part.submit_status = "FAILED"
+        part.failed_at = timezone.now()
+        part.failure_reason = (
+            "Vendor Offline (System is attempting to reconnect in background)."
+        )
+        part.save(update_fields=["submit_status", "failed_at", "failure_reason"])
+        self.update_parent_message_status(part.message)
+
+    async def send_part(self, part):
+        smpp_id = part.message.smpp.id
+        try:
+            bind = self.pick_bind(smpp_id)
+            if bind is None:
+                await db_sync_to_async(self.fail_part_offline)(part)
+                return
+            body, attempt_log = await db_sync_to_async(self.prepare_submit)(
+                part, bind.config
+            )
+            try:
+                # Pick again now: submit() counts towards the bind's load
+                # before it yields, so the parts of one poll spread evenly
+                bind = self.pick_bind(smpp_id)
+                if bind is None:
+                    raise BindClosed("No live bind left")
+                # Waits for a free slot in the window, then for our own resp
+                status, vendor_id = await bind.submit(body, context=part.id)
+            except BindClosed as e:
+                # Never reached the vendor: the next poll hands it to a live bind
+                await db_sync_to_async(self.requeue_part)(
+                    part, attempt_log, f"Not sent, {e}"
+                )
+            except asyncio.TimeoutError:
+                error = f"No submit_sm_resp within {bind.resp_timeout:g}s"
+                if part.submit_attempts <= VENDOR_TIMEOUT_RETRIES:
+                    await db_sync_to_async(self.requeue_part)(part, attempt_log, error)
+                else:
+                    await db_sync_to_async(self.record_submit_error)(
+                        part, attempt_log, error
                     )
-                    session_ids.append(session.sessionId)
-                    # ⚡️ ADD THIS HERE: Notify Dashboard of the new SESSION
-                    async_to_sync(channel_layer.group_send)(
-                        "dashboard_updates",
-                        {
-                            "type": "vendor_session_change",
-                            "vendor_id": v.id,
-                            "status": "ONLINE",
-                        },
+            except (ConnectionError, OSError) as e:
+                await db_sync_to_async(self.record_submit_error)(
+                    part, attempt_log, f"Connection lost: {e}"
+                )
+            else:
+                if status in THROTTLE_STATUSES:
+                    # Sent faster than the vendor takes: hold this bind for
+                    # the policy's delay and send the part again later
+                    limits = self.limits.get(bind.config.id) or VendorLimits()
+                    if bind.pacer is not None:
+                        bind.pacer.pause(limits.throttle_delay)
+                    await db_sync_to_async(self.requeue_part)(
+                        part,
+                        attempt_log,
+                        f"Throttled by vendor (SMPP Error Code: {status})",
                     )
-                # 3. Attach the list of session IDs to the client
-                # This ensures that when the socket drops, ALL session records are closed.
-                client.db_session_ids = session_ids
-            self.stdout.write(
-                self.style.SUCCESS(f"Vendor BOUND: {config.smppHost} is now ONLINE")
-            )
-            return client
+                    return
+                await db_sync_to_async(self.record_submit_resp)(
+                    part, attempt_log, status, vendor_id
+                )
         except Exception as e:
-            logger.error(f"Connect failed: {e}")
-            # ⚡️ THE FIX: Professionally close the socket to prevent memory leaks
-            if client:
-                try:
-                    # Silently close raw socket to avoid the yellow warning
-                    if hasattr(client, "sock") and client.sock:
-                        client.sock.close()
-                except:
-                    pass
-            return None
-
-    def send_single_part(self, client, part, config):
+            logger.error(f"Error sending part #{part.id}: {e}")
+        finally:
+            self.dispatching.discard(part.id)
+
+    def prepare_submit(self, part, config):
+        """Counts the attempt, logs it and builds the submit_sm body."""
         parent_msg = part.message
         part.submit_attempts += 1
         part.last_submit_at = timezone.now()
@@ -379,11 +609,6 @@ class Command(BaseCommand):
             else str(msg_content).encode("utf-8")
         )
 
-        # Generate a unique sequence number for this message and map it to our PART ID
-        next_seq = client.next_sequence()
-        # Think of this as a notebook where your system temporarily writes down tracking information
-        self.sequence_to_part_id[next_seq] = part.id
-
         # 1. CREATE THE LOG (Record the 'request_payload' here)
         # started_at is automatically added by Django!
         attempt_log = MessageAttempt.objects.create(
@@ -395,67 +620,40 @@ class Command(BaseCommand):
             request_payload={
                 "source_addr": source,
                 "destination_addr": parent_msg.destination,
-                "sequence_number": next_seq,
                 "esm_class": part.esm_class,
                 # Convert the raw bytes to hex so it saves safely in the JSON database field
                 "hex_payload": final_msg.hex(),
             },
         )
 
-        try:
-
-            client.send_message(
-                source_addr=source,
-                destination_addr=parent_msg.destination,
-                source_addr_ton=config.sourceTON,
-                source_addr_npi=config.sourceNPI,
-                dest_addr_ton=config.destTON,
-                dest_addr_npi=config.destNPI,
-                data_coding=0,  # Try 0 for standard GSM text
-                esm_class=part.esm_class,
-                short_message=final_msg,  # it contains the UDH + text chunk for multipart, or just text for single part
-                registered_delivery=True,
-                sequence=next_seq,  # Use our pre-generated sequence
-            )
-
-            # Wait a tiny bit for the response to be processed by read_once
-            time.sleep(0.2)
-            try:
-                client.read_once()
-            except:
-                pass
-            # 2. SUCCESS UPDATE (Record 'response_payload' and 'completed_at')
-            attempt_log.status = "SUBMITTED"
-            attempt_log.response_payload = {
-                "status": "accepted_by_gateway",
-                "sequence_number": next_seq,
-            }
-            attempt_log.completed_at = timezone.now()
-            attempt_log.save()
-            part.vendor_submit_status = 0
-            part.submit_status = "SUBMITTED"
-            part.submitted_at = timezone.now()
-            part.save(
-                update_fields=["vendor_submit_status", "submit_status", "submitted_at"]
-            )
-
-            if parent_msg.status == "queued":
-                parent_msg.status = "submitted"
-                parent_msg.submitted_at = timezone.now()
-                parent_msg.save(update_fields=["status", "submitted_at"])
+        body = encode_submit_sm(
+            source_addr=source,
+            destination_addr=parent_msg.destination,
+            # it contains the UDH + text chunk for multipart, or just text for single part
+            short_message=final_msg,
+            source_addr_ton=config.sourceTON,
+            source_addr_npi=config.sourceNPI,
+            dest_addr_ton=config.destTON,
+            dest_addr_npi=config.destNPI,
+            esm_class=part.esm_class,
+            registered_delivery=1,
+            # GSM-7 parts carry unpacked septets, UCS-2 parts UTF-16BE
+            data_coding=DATA_CODING.get(parent_msg.encoding, 0),
+        )
+        return body, attempt_log
 
-            self.stdout.write(self.style.SUCCESS(f"Processed Msg #{parent_msg.id}"))
-        # ---> 1. CATCH IMMEDIATE VENDOR REJECTIONS (The Bouncer) <---
-        except smpplib.exceptions.PDUError as pdu_err:
-            now = timezone.now()
+    def record_submit_resp(self, part, attempt_log, status, vendor_id):
+        """submit_sm_resp arrived: link the vendor's tracking ID, or record the rejection."""
+        parent_msg = part.message
+        now = timezone.now()
 
+        # ---> 1. IMMEDIATE VENDOR REJECTIONS (The Bouncer) <---
+        if status != 0:
             # 1. Update Part with the exact integer status
-            part.vendor_submit_status = pdu_err.status
+            part.vendor_submit_status = status
             part.submit_status = "FAILED"
             part.failed_at = now
-            part.failure_reason = (
-                f"Rejected at submission. SMPP Error Code: {pdu_err.status}"
-            )
+            part.failure_reason = f"Rejected at submission. SMPP Error Code: {status}"
             part.save(
                 update_fields=[
                     "vendor_submit_status",
@@ -466,158 +664,152 @@ class Command(BaseCommand):
             )
 
             # 2. Update Parent Message
-            parent_msg = part.message
             parent_msg.status = "failed"
             parent_msg.failed_at = now
-            parent_msg.failure_reason = (
-                f"Vendor Submission Error: SMPP Code {pdu_err.status}"
-            )
+            parent_msg.failure_reason = f"Vendor Submission Error: SMPP Code {status}"
             parent_msg.save(update_fields=["status", "failed_at", "failure_reason"])
+            # ⚡️ Hand the failure to the SMPP server now, not the recovery poll
+            transaction.on_commit(lambda: publish_client_dlr(parent_msg))
 
             # 3. Update Attempt Log
             attempt_log.status = "FAILED"
-            attempt_log.error_message = f"SMPP PDU Error: {pdu_err.status}"
+            attempt_log.error_message = f"SMPP PDU Error: {status}"
             attempt_log.completed_at = now
             attempt_log.save()
 
             self.stdout.write(
-                self.style.ERROR(
-                    f"Vendor Rejected Msg #{parent_msg.id}: Code {pdu_err.status}"
-                )
+                self.style.ERROR(f"Vendor Rejected Msg #{parent_msg.id}: Code {status}")
             )
-        # ---> 2. CATCH EVERYTHING ELSE (Network drops, timeouts, crashes) <---
-        except Exception as e:
-            now = timezone.now()
-            # 1. Update the specific Segment (Part)
-            part.submit_status = "FAILED"
-            part.failed_at = now  # <--- NEW: Track when it died
-            part.failure_reason = str(e)  # <--- NEW: Store why it died
-            part.save(update_fields=["submit_status", "failed_at", "failure_reason"])
-            # 2. Update the Parent Message
-            # If a submission fails at this stage, we mark the whole parent as failed
-            parent_msg = part.message
-            parent_msg.status = "failed"
-            parent_msg.failed_at = now
-            parent_msg.failure_reason = f"Submission Error: {str(e)}"
-            parent_msg.save(update_fields=["status", "failed_at", "failure_reason"])
-
-            # 3. Update the Attempt Log (Your existing code)
-            attempt_log.status = "FAILED"
-            attempt_log.error_message = str(e)
-            attempt_log.completed_at = timezone.now()
-            attempt_log.save()
+            return
 
-            self.stdout.write(self.style.ERROR(f"Error: {e}"))
+        # 2. SUCCESS UPDATE (Record 'response_payload' and 'completed_at')
+        attempt_log.status = "SUBMITTED"
+        attempt_log.response_payload = {"status": "accepted_by_gateway"}
+        if vendor_id:
+            attempt_log.provider_message_id = vendor_id
+            attempt_log.response_payload["vendor_msg_id"] = vendor_id
+        attempt_log.completed_at = now
+        attempt_log.save()
+
+        # Link the vendor's tracking ID to our PART row
+        part.vendor_submit_status = 0
+        part.submit_status = "SUBMITTED"
+        part.submitted_at = now
+        part.vendor_msg_id = vendor_id or None
+        part.sent_at = now
+        part.save(
+            update_fields=[
+                "vendor_submit_status",
+                "submit_status",
+                "submitted_at",
+                "vendor_msg_id",
+                "sent_at",
+            ]
+        )
 
-    def handle_sent_confirmation(self, pdu):
-        """When the vendor accepts the msg, they give us their Tracking ID"""
-        try:
-            print(
-                f"\n--- DEBUG: Received Response! Sequence: {pdu.sequence}, Status: {pdu.status} ---"
+        update_fields = []
+        if parent_msg.status == "queued":
+            parent_msg.status = "submitted"
+            parent_msg.submitted_at = now
+            update_fields += ["status", "submitted_at"]
+        if not parent_msg.sent_at:
+            parent_msg.sent_at = now
+            update_fields.append("sent_at")
+        if update_fields:
+            parent_msg.save(update_fields=update_fields)
+
+        if vendor_id:
+            # UPDATE THE DETAILED REPORT (Master Record)
+            DetailedSMSReport.objects.filter(message=parent_msg).update(
+                vendor_msg_id=vendor_id  # Sync vendor ID to report for easy searching
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed Msg #{parent_msg.id}, Part #{part.id} -> Vendor ID: {vendor_id}"
             )
+        )
 
-            # 1. Safely extract the raw ID
-            raw_id = getattr(pdu, "message_id", None)
-            print(f"--- DEBUG: Raw Vendor ID is: {raw_id} ---")
+    def requeue_part(self, part, attempt_log, reason):
+        """Throttled or never sent: the part goes back to the queue, unclaimed."""
+        part.submit_status = "QUEUED"
+        part.claimed_by = None
+        part.claim_expires_at = None
+        part.save(update_fields=["submit_status", "claimed_by", "claim_expires_at"])
 
-            if not raw_id:
-                print("--- DEBUG: Vendor accepted it, but returned NO ID! ---")
-                return
+        attempt_log.status = "FAILED"
+        attempt_log.error_message = reason
+        attempt_log.completed_at = timezone.now()
+        attempt_log.save()
 
-            # 2. Safely decode it whether it is bytes or a regular string
-            if isinstance(raw_id, bytes):
-                vendor_id = raw_id.decode("ascii", errors="ignore").strip("\x00")
-            else:
-                vendor_id = str(raw_id).strip("\x00")
+        self.stdout.write(
+            self.style.WARNING(f"Part #{part.id} re-queued: {reason}")
+        )
 
-            # 3. Match it to our database
-            part_id = self.sequence_to_part_id.get(pdu.sequence)
+    def record_submit_error(self, part, attempt_log, error):
+        """No usable resp (timeout, link dropped): the part and its message fail."""
+        now = timezone.now()
+        # 1. Update the specific Segment (Part)
+        part.submit_status = "FAILED"
+        part.failed_at = now  # <--- NEW: Track when it died
+        part.failure_reason = error  # <--- NEW: Store why it died
+        part.save(update_fields=["submit_status", "failed_at", "failure_reason"])
+        # 2. Update the Parent Message
+        # If a submission fails at this stage, we mark the whole parent as failed
+        parent_msg = part.message
+        parent_msg.status = "failed"
+        parent_msg.failed_at = now
+        parent_msg.failure_reason = f"Submission Error: {error}"
+        parent_msg.save(update_fields=["status", "failed_at", "failure_reason"])
+        transaction.on_commit(lambda: publish_client_dlr(parent_msg))
 
-            if part_id:
-                # Link the vendor's tracking ID to our PART row
+        # 3. Update the Attempt Log
+        attempt_log.status = "FAILED"
+        attempt_log.error_message = error
+        attempt_log.completed_at = now
+        attempt_log.save()
 
-                part = (
-                    SMSMessagePart.objects.filter(id=part_id)
-                    .select_related("message")
-                    .first()
-                )
-                if part:
-                    part.vendor_msg_id = vendor_id
-                    part.sent_at = timezone.now()
-                    part.save(update_fields=["vendor_msg_id", "sent_at"])
-                    parent = part.message
-                    if not parent.sent_at:
-                        parent.sent_at = timezone.now()
-                        parent.save(update_fields=["sent_at"])
-                    attempt = (
-                        MessageAttempt.objects.filter(segment=part)
-                        .order_by("-started_at")
-                        .first()
-                    )
-                    if attempt:
-                        attempt.provider_message_id = vendor_id
-                        attempt.response_payload = {
-                            "status": "accepted_by_gateway",
-                            "vendor_msg_id": vendor_id,
-                            "sequence_number": pdu.sequence,
-                        }
-                        attempt.save(
-                            update_fields=["provider_message_id", "response_payload"]
-                        )
-                    # 2. UPDATE THE DETAILED REPORT (Master Record)
-                    DetailedSMSReport.objects.filter(message=part.message).update(
-                        vendor_msg_id=vendor_id  # Sync vendor ID to report for easy searching
-                    )
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f"Linked Part #{part_id} to Vendor ID: {vendor_id}"
-                    )
-                )
-                del self.sequence_to_part_id[pdu.sequence]
-            else:
-                print(
-                    f"--- DEBUG: Found sequence {pdu.sequence}, but no matching part ID in dictionary! ---"
-                )
+        self.stdout.write(self.style.ERROR(f"Error: {error}"))
 
-        except Exception as e:
-            print(f"--- DEBUG: Error inside handle_sent_confirmation: {e} ---")
+    async def handle_late_resp(self, part_id, status, vendor_id):
+        await db_sync_to_async(self.record_late_resp)(part_id, status, vendor_id)
 
-    def sweep_stale_submissions(self):
+    def record_late_resp(self, part_id, status, vendor_id):
         """
-        Scans for messages that were sent to the vendor but never received a DLR
-        within the acceptable timeout window (e.g., 24 hours).
+        The vendor accepted a part after we had given up on its resp. If the
+        part was failed (not re-queued), link the vendor's id anyway so its
+        DLR still finds it and settles the real outcome.
         """
-        # Define how long you are willing to wait for a vendor DLR (e.g., 24 hours)
-        timeout_threshold = timezone.now() - timedelta(hours=24)
-
-        stale_parts = SMSMessagePart.objects.filter(
-            submit_status="SUBMITTED", submitted_at__lte=timeout_threshold
-        ).select_related("message")
-
-        count = stale_parts.count()
-        if count == 0:
+        if status != 0 or not vendor_id:
             return
-
-        for part in stale_parts:
-            # 1. Fail the specific part
-            part.submit_status = "FAILED"
-            part.failed_at = timezone.now()
-            part.failure_reason = "Vendor Timeout: No DLR received within 24 hours."
-            part.save(update_fields=["submit_status", "failed_at", "failure_reason"])
-
-            # 2. Log it professionally in the Detailed Report
-            DetailedSMSReport.objects.filter(message=part.message).update(
-                submitStatus="FAILED"
+        linked = SMSMessagePart.objects.filter(
+            id=part_id, submit_status="FAILED", vendor_msg_id__isnull=True
+        ).update(vendor_msg_id=vendor_id)
+        if linked:
+            attempt_log = (
+                MessageAttempt.objects.filter(segment_id=part_id)
+                .order_by("-attempt_number")
+                .first()
+            )
+            if attempt_log:
+                attempt_log.provider_message_id = vendor_id
+                attempt_log.save(update_fields=["provider_message_id"])
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Late submit_sm_resp: Part #{part_id} -> Vendor ID: {vendor_id}"
+                )
             )
 
-            # 3. Recalculate parent message status
-            self.update_parent_message_status(part.message)
+    # ==============================================================================
+    # INCOMING: DLRs (deliver_sm) from the vendor binds
+    # ==============================================================================
 
-        logger.error(
-            f"SYSTEM TIMEOUT: {count} messages were marked FAILED because the vendor never responded."
-        )
+    async def handle_deliver(self, pdu, config):
+        for delay in DLR_LINK_RETRY_DELAYS + (None,):
+            handled = await db_sync_to_async(self.handle_incoming)(pdu, config)
+            if handled is not False or delay is None:
+                return
+            await asyncio.sleep(delay)
 
-    # it talks to the telecom vendor
     # it talks to the telecom vendor
     def handle_incoming(self, pdu, config):
         try:
@@ -685,9 +877,12 @@ class Command(BaseCommand):
 
                 part = (
                     SMSMessagePart.objects.filter(vendor_msg_id=v_id)
-                    .select_related("message")
+                    .select_related("message__client")
                     .first()
                 )
+                if part is None:
+                    # Its submit_sm_resp may still be being recorded; handle_deliver retries
+                    return False
 
                 if part:
                     part.submit_status = new_status
@@ -734,7 +929,9 @@ class Command(BaseCommand):
                         status_description=human_description,  # This is where the fix is applied!
                     )
 
-                    self.update_parent_message_status(part.message)
+                    self.update_parent_message_status(
+                        part.message, status_code=extracted_err_code
+                    )
                     print(
                         f"--- Updated Part with Vendor ID {v_id} to status {new_status} ---"
                     )
@@ -757,7 +954,7 @@ class Command(BaseCommand):
         except Exception as e:
             logger.error(f"DLR Error: {e}")
 
-    def update_parent_message_status(self, parent_msg):
+    def update_parent_message_status(self, parent_msg, status_code=None):
         """Calculates the overall status of a message based on its parts."""
 
         # Get all parts for this parent message
@@ -810,6 +1007,8 @@ class Command(BaseCommand):
             parent_msg.save(
                 update_fields=["status", "delivered_at", "failed_at", "failure_reason"]
             )
+            # ⚡️ Hand the final status to the SMPP server right now (no DB polling)
+            publish_client_dlr(parent_msg, status_code, delivered_count)
             self.stdout.write(
                 self.style.SUCCESS(
                     f"Parent Msg #{parent_msg.id} is now {new_parent_status}"
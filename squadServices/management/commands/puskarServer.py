@@ -3,7 +3,6 @@ import struct
 import logging
 import datetime
 import time
-import uuid
 import aiohttp
 from django.core.management.base import BaseCommand
 from asgiref.sync import sync_to_async
@@ -11,6 +10,8 @@ from django.db.models import Q
 
 # Replace this with your actual app import
 from squadServices.models.clientModel.client import PuskarClient
+from squadServices.helper.messageId import new_message_id
+from squadServices.helper.smppPdu import PduFramer, decode_submit_sm, read_c_string
 
 # --- Configuration ---
 HOST = "0.0.0.0"
@@ -79,7 +80,7 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING("\nServer stopped gracefully."))
 
     async def generate_message_id(self):
-        return str(uuid.uuid4())
+        return new_message_id()
 
     async def run_server(self):
         # ⚡️ OPTIMIZATION: High-concurrency pool for the slow API (1.27s latency)
@@ -196,18 +197,18 @@ class Command(BaseCommand):
         is_authenticated = False
         client_obj = None
 
+        framer = PduFramer(reader)
+
         try:
             while True:
-                # ⚡️ SOCKET TIMEOUT: 120s idle limit
-                header_data = await asyncio.wait_for(reader.read(16), timeout=120.0)
-                if not header_data or len(header_data) < 16:
+                frame = framer.next_buffered()
+                if frame is None:
+                    # ⚡️ SOCKET TIMEOUT: 120s idle limit
+                    frame = await asyncio.wait_for(framer.read_frame(), timeout=120.0)
+                if frame is None:
                     break
 
-                cmd_len, cmd_id, cmd_status, seq_num = struct.unpack(
-                    ">IIII", header_data
-                )
-                body_len = cmd_len - 16
-                body_data = await reader.read(body_len) if body_len > 0 else b""
+                cmd_len, cmd_id, cmd_status, seq_num, body_data = frame
 
                 if cmd_id == CMD_BIND_TRANSCEIVER:
                     sys_id, offset = self.read_c_string(body_data, 0)
@@ -329,22 +330,12 @@ class Command(BaseCommand):
                 pass  # F
 
     def parse_submit_sm(self, body):
-        offset = 0
-        _, offset = self.read_c_string(body, offset)
-        offset += 2
-        src, offset = self.read_c_string(body, offset)
-        offset += 2
-        dst, offset = self.read_c_string(body, offset)
-        esm_class = body[offset]
-        offset += 3
-        _, offset = self.read_c_string(body, offset)
-        _, offset = self.read_c_string(body, offset)
-        offset += 2
-        data_coding = body[offset]
-        offset += 2
-        sm_len = body[offset]
-        offset += 1
-        msg_bytes = body[offset : offset + sm_len]
+        pdu = decode_submit_sm(body)
+        src = pdu.source_addr
+        dst = pdu.destination_addr
+        esm_class = pdu.esm_class
+        data_coding = pdu.data_coding
+        msg_bytes = pdu.short_message
         res = {"source": src, "dest": dst, "is_segmented": False, "text": ""}
 
         # this means that sms is is segmented and has udh header
@@ -395,7 +386,4 @@ class Command(BaseCommand):
             await writer.drain()
 
     def read_c_string(self, data, offset):
-        end = data.find(b"\0", offset)
-        if end == -1:
-            return "", len(data)
-        return data[offset:end].decode("ascii", errors="ignore"), end + 1
+        return read_c_string(data, offset)
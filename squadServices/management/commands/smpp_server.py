@@ -3,41 +3,69 @@ from ast import If
 import asyncio
 from csv import writer
 import hashlib
-import math
 import os
 import struct
 import logging
 from django.core.management.base import BaseCommand
-from asgiref.sync import sync_to_async
 from django.utils import timezone
+from squadServices.helper.bindAuthCache import MISS, BindAuthCache
 from squadServices.helper.checkNumber import clean_phone_number
+from squadServices.helper.clientDlrStream import (
+    CLIENT_DLR_GROUP,
+    build_client_dlr_event,
+    client_dlr_stream_key,
+    publish_client_dlrs,
+)
+from squadServices.helper.countryPrefixHelper import (
+    get_country_prefix_index,
+    resolve_destination_country,
+)
 from squadServices.helper.routeAndCostHelper import get_route_and_cost
-from squadServices.helper.smsSplitter import (
-    create_message_parts,
-    create_message_parts_when_failed,
+from squadServices.helper.routeCache import RouteCache, route_facts
+from squadServices.helper.dbExecutor import db_executor, db_sync_to_async
+from squadServices.helper.dlrOutbox import DeliverSmOutbox
+from squadServices.helper.creditLedger import (
+    CREDIT_ERRORS,
+    CreditLedger,
+    load_account_snapshot,
+    to_units,
+)
+from squadServices.helper.messageId import new_message_id, snowflake_ids
+from squadServices.helper.multipartAssembler import (
+    MULTIPART_BACKEND,
+    MultipartAssembler,
+    buffer_key,
 )
+from squadServices.helper.rateLimiter import RATE_LIMIT_BACKEND, TokenBucketLimiter
+from squadServices.helper.sessionActivity import SessionActivityBuffer
+from squadServices.helper.smppSessionRegistry import SMPPSessionRegistry
+from squadServices.helper.smppPdu import (
+    TLV_MESSAGE_PAYLOAD,
+    PduDecodeError,
+    PduFrameError,
+    PduFramer,
+    decode_submit_multi,
+    decode_submit_sm,
+    encode_submit_multi_resp,
+    read_c_string,
+)
+from squadServices.helper.smsCodec import get_encoding_and_segments
+from squadServices.helper.smsBatchWriter import SMSWriteBehindQueue
+from squadServices.helper.trafficLogger import SMPPTrafficLog
+from squadServices.helper.smsSplitter import build_message_parts
 from squadServices.models.clientModel.client import Client, ClientSession, IpWhitelist
 from squadServices.models.connectivityModel.smpp import SMPP
 import secrets
 from squadServices.models.connectivityModel.verdor import Vendor
-from squadServices.models.country import Country
-from squadServices.models.detailedReport.detailedReport import DetailedSMSReport
 from squadServices.models.operators.operators import Operators
 from squadServices.models.routeManager.customRoute import CustomRoute
 from squadServices.models.smpp.smppSMS import SMSMessage, SMSMessagePart
-import re
 from django.db import transaction
-from datetime import timedelta
-from squadServices.models.transaction.transaction import (
-    ClientTransaction,
-    TransactionType,
-    VendorTransaction,
-)
-import uuid
 import redis.asyncio as redis
-from channels.layers import get_channel_layer
-from logging.handlers import RotatingFileHandler
 import time
+import multiprocessing
+import socket
+from django.db import connections
 
 # from squadServices.models.transaction import transaction
 
@@ -53,6 +81,7 @@ CMD_BIND_TRANSCEIVER = 0x00000009
 CMD_SUBMIT_SM = 0x00000004  # this is the command that the client sends to your server when they want to send an SMS. It contains all the details of the message, including the destination number, the text, and whether they want a DLR or not.
 CMD_ENQUIRE_LINK = 0x00000015
 CMD_DELIVER_SM = 0x00000005
+CMD_SUBMIT_MULTI = 0x00000021  # one message, up to 255 destinations
 # Response IDs (Request ID + 0x80000000)
 CMD_BIND_RECEIVER_RESP = 0x80000001
 CMD_BIND_TRANSMITTER_RESP = 0x80000002
@@ -60,36 +89,25 @@ CMD_BIND_TRANSCEIVER_RESP = 0x80000009
 CMD_SUBMIT_SM_RESP = 0x80000004
 CMD_ENQUIRE_LINK_RESP = 0x80000015
 CMD_DELIVER_SM_RESP = 0x80000005  # <--- ADD THIS LINE
+CMD_SUBMIT_MULTI_RESP = 0x80000021
 CMD_GENERIC_NACK = 0x80000000
 
 # SMPP Status
 ESME_ROK = 0x00000000
+ESME_RINVCMDLEN = 0x00000002
+ESME_RSYSERR = 0x00000008
+ESME_RINVDSTADR = 0x0000000B  # invalid destination address
+ESME_RINVDLNAME = 0x00000034  # invalid distribution list name
+ESME_RSUBMITFAIL = 0x00000045
+
+# DLRs normally arrive on the client DLR streams; the DB poll only catches
+# what was missed (Redis down, no worker bound at the time, crash mid-push).
+DLR_RECOVERY_INTERVAL = int(os.environ.get("SMPP_DLR_RECOVERY_INTERVAL", 30))
+# Rows per recovery query; a pass keeps going until a batch comes back short
+DLR_RECOVERY_BATCH = int(os.environ.get("SMPP_DLR_RECOVERY_BATCH", 50))
 
 logger = logging.getLogger(__name__)
 
-# --- CREATE A DEDICATED FILE LOGGER FOR SMPP TRAFFIC ---
-# 1. Create a logs folder if it doesn't exist
-if not os.path.exists("logs"):
-    os.makedirs("logs")
-
-# 2. Set up the specific logger
-traffic_logger = logging.getLogger("smpp_traffic")
-traffic_logger.setLevel(logging.INFO)
-traffic_logger.propagate = False  # Prevents these logs from spamming your main console
-
-# 3. Create the Rotating File Handler (Max 5MB per file, keeps 5 backups)
-file_handler = RotatingFileHandler(
-    "logs/smpp_traffic.log", maxBytes=5 * 1024 * 1024, backupCount=5, encoding="utf-8"
-)
-
-# 4. Set the exact format for the file (adds Date and Time automatically!)
-formatter = logging.Formatter("%(asctime)s - [%(levelname)s] - %(message)s")
-file_handler.setFormatter(formatter)
-
-if not traffic_logger.handlers:
-    traffic_logger.addHandler(file_handler)
-
-
 # --------------------------------------------------------
 class Command(BaseCommand):
     help = "Runs a lightweight SMPP Server to receive SMS"
@@ -97,175 +115,290 @@ class Command(BaseCommand):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.active_clients = {}  # Dictionary to hold open TCP connections
-        self.route_cache = {}  # ⚡️ ADD THIS
-        self.client_tps_trackers = {}
-
-    # check_rate_limit is run every time a message is received annd from it it calculate the tps by using count to count how man msg came in a second.
-    # it only put count result of 1 second and if the second changes it reset the count to 0 and start counting for the new second,
-    # so if the count exceed the max tps in that second it return false and if not it return true and allow the message to be processed
-    def check_rate_limit(self, username, max_tps):
-        """Returns True if allowed, False if limit exceeded"""
-        if max_tps == 0:  # 0 means unlimited
-            return True
-
-        current_second = int(time.time())
-        tracker = self.client_tps_trackers.setdefault(
-            username, {"second": current_second, "count": 0}
-        )
-
-        # If we moved to a new second, reset the counter
-        if tracker["second"] != current_second:
-            tracker["second"] = current_second
-            tracker["count"] = 0
-
-        if tracker["count"] >= max_tps:
-            return False
-
-        tracker["count"] += 1
-        return True
+        # ⚡️ Bounded, versioned (client, country) -> route facts cache
+        self.route_cache = RouteCache()
+        # ⚡️ Bind credentials/policies and compiled IP whitelists
+        self.auth_cache = BindAuthCache()
+        self.rate_limiter = None  # TokenBucketLimiter, created in run_server
+        self.multipart = None  # MultipartAssembler, created in run_server
+        self.traffic_log = SMPPTrafficLog()  # packet tracing, started in run_server
+        # ⚡️ Session rows, enquire_link activity and bindStatus, written in batches
+        self.session_activity = SessionActivityBuffer()
+        self.workers = 1  # --workers; > 1 runs a supervisor with SO_REUSEPORT workers
+        self.worker_index = 0
+        # client.id -> (maxWindowGlobal, Semaphore) shared by every bind of that client
+        self.client_global_windows = {}
+
+    def get_client_global_window(self, client_obj, policy):
+        """One semaphore per client caps outstanding SUBMIT_SMs across all its binds."""
+        limit = policy.maxWindowGlobal if policy else 100
+        if limit <= 0:  # 0 means unlimited
+            return None
 
-    async def generate_message_id(self):  # If it has 'async'
-        return str(uuid.uuid4())
-
-    def detect_encoding(self, text):
-        """Detect if text is GSM-7 compatible or requires UCS-2"""
-        gsm7_basic = (
-            "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞ\x1bÆæßÉ !\"#¤%&'()*+,-./"
-            "0123456789:;<=>?¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§"
-            "¿abcdefghijklmnopqrstuvwxyzäöñüà"
-        )
-        gsm7_ext = "^{}\\[~]|€"
+        entry = self.client_global_windows.get(client_obj.id)
+        # If the policy was edited, new binds get a fresh semaphore. In-flight tasks
+        # keep releasing the one they acquired, so nothing leaks.
+        if entry is None or entry[0] != limit:
+            entry = (limit, asyncio.Semaphore(limit))
+            self.client_global_windows[client_obj.id] = entry
+        return entry[1]
+
+    async def register_bind(self, writer, client_obj, max_sessions):
+        """Returns (allowed, live binds of this client) across all worker processes."""
+        bind_token = secrets.token_hex(8)
+        try:
+            allowed, count = await self.session_registry.acquire(
+                client_obj.id, bind_token, max_sessions
+            )
+        except redis.RedisError as e:
+            # Redis is down: fall back to counting the binds of this process only
+            logger.error(f"Session registry unavailable, counting locally: {e}")
+            count = sum(
+                1
+                for w in self.active_clients.values()
+                if getattr(w, "client_obj", None) == client_obj
+            )
+            return max_sessions == 0 or count < max_sessions, count
 
-        for char in text:
-            if char not in gsm7_basic and char not in gsm7_ext:
-                return "UCS-2"
-        return "GSM-7"
+        if allowed:
+            writer.bind_token = (client_obj.id, bind_token)
+        return allowed, count
 
-    def calculate_segments(self, text, encoding):
-        length = len(text)
+    async def unregister_bind(self, writer):
+        if not getattr(writer, "bind_token", None):
+            return
+        client_id, bind_token = writer.bind_token
+        try:
+            await self.session_registry.release(client_id, bind_token)
+        except redis.RedisError as e:
+            # The entry dies with this worker's heartbeat anyway
+            logger.error(f"Could not unregister bind {bind_token}: {e}")
 
-        if encoding == "GSM-7":
-            if length <= 160:
-                return 1, length
-            else:
-                return math.ceil(length / 153), length
-        else:  # UCS-2
-            if length <= 70:
-                return 1, length
-            else:
-                return math.ceil(length / 67), length
-
-    @sync_to_async
-    def save_failed_routing_attempt(
-        self,
-        client_obj,
-        destination_addr,
-        short_message,
-        encoding_type,
-        total_segments,
-        total_chars,
-        source_addr,
-        unique_msg_id,
-        error_reason,
-        want_dlr,
+    async def acquire_submit_windows(self, writer):
+        """
+        Waits for a free slot in the session window and the client's global window.
+        While we wait we stop reading the socket, so TCP pushes back on the client.
+        """
+        acquired = []
+        for window in (
+            getattr(writer, "session_window", None),
+            getattr(writer, "global_window", None),
+        ):
+            if window is not None:
+                await window.acquire()
+                acquired.append(window)
+        return acquired
+
+    async def run_windowed_submit(
+        self, body_data, seq_num, writer, windows, cmd_id=CMD_SUBMIT_SM
     ):
-        now = timezone.now()
-        print("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
-        print("!!!!!!22323232ppppp!!!!!!!!!!!!!!!!!!!!!!!!!!!!", client_obj)
-
-        # 1. Create the parent message as FAILED (Same as before)
-        msg = SMSMessage.objects.create(
-            client=client_obj,
-            systemId=client_obj.smppUsername,
-            message_id=unique_msg_id,
-            characterCount=total_chars,
-            destination=destination_addr,
-            text=short_message,
-            encoding=encoding_type,
-            segmentNumber=total_segments,
-            status="failed",  # ⚡️ Starts and ends as failed
-            failure_reason=error_reason,
-            failed_at=now,
-            queued_at=now,
-            sendClientDlr=want_dlr,
-        )
-        print("!!!!!222!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
-
-        print("!!!!3333!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
+        """Processes one SUBMIT_SM/SUBMIT_MULTI in the background and frees its window slots."""
+        try:
+            await self.handle_submit_sm(body_data, seq_num, writer, cmd_id)
+        except Exception as e:
+            logger.error(f"SUBMIT_SM seq {seq_num} crashed: {e}")
+            try:
+                # 0x08 = ESME_RSYSERR so the client doesn't wait on this seq forever
+                await self.send_pdu(
+                    writer,
+                    cmd_id | 0x80000000,
+                    ESME_RSYSERR,
+                    seq_num,
+                    self.submit_resp_body(cmd_id, ""),
+                )
+            except Exception:
+                pass
+        finally:
+            for window in windows:
+                window.release()
 
-        # 3. ⚡️ CALL YOUR MAGIC FUNCTION ⚡️
-        create_message_parts_when_failed(
-            sms_message_obj=msg,
-            text=short_message,
-            initial_status="FAILED",
-            fail_reason=error_reason,
-        )
+    async def generate_message_id(self):  # If it has 'async'
+        # ⚡️ 13-char time-ordered ids: index inserts stay append-only
+        return new_message_id()
 
-    @sync_to_async
-    def check_ip_whitelist(self, ip_address, client_obj=None):
+    @db_sync_to_async
+    def save_failed_routing_attempts(self, client_obj, attempts, message):
         """
-        If client_obj is provided, check if the IP belongs to that specific client.
-        Otherwise, check if the IP is whitelisted at all.
+        Saves the destinations we could not route or bill as FAILED messages
+        (no billing): one INSERT for the messages and one for their parts.
+        attempts is a list of (destination, unique_msg_id, error_reason, want_dlr).
         """
-        if client_obj:
-            return IpWhitelist.objects.filter(
-                ip=ip_address, client=client_obj, isDeleted=False
-            ).exists()
-        return IpWhitelist.objects.filter(ip=ip_address, isDeleted=False).exists()
+        now = timezone.now()
+        with transaction.atomic():
+            # 1. Create the parent messages as FAILED
+            messages = SMSMessage.objects.bulk_create(
+                [
+                    SMSMessage(
+                        client=client_obj,
+                        systemId=client_obj.smppUsername,
+                        message_id=unique_msg_id,
+                        characterCount=message["total_chars"],
+                        destination=destination_addr,
+                        text=message["text"],
+                        encoding=message["encoding"],
+                        segmentNumber=message["total_segments"],
+                        status="failed",  # ⚡️ Starts and ends as failed
+                        failure_reason=error_reason,
+                        failed_at=now,
+                        queued_at=now,
+                        sendClientDlr=want_dlr,
+                    )
+                    for destination_addr, unique_msg_id, error_reason, want_dlr in attempts
+                ]
+            )
+            # 2. And their parts, all in one go
+            parts = []
+            for msg, (_, _, error_reason, _) in zip(messages, attempts):
+                parts.extend(
+                    build_message_parts(
+                        msg,
+                        message["text"],
+                        initial_status="FAILED",
+                        fail_reason=error_reason,
+                    )
+                )
+            SMSMessagePart.objects.bulk_create(parts)
+            # ⚡️ Their DLRs go out on the stream once the rows are committed
+            transaction.on_commit(lambda: publish_client_dlrs(messages))
 
-    @sync_to_async
-    def reap_stale_messages(self):
+    async def route_and_bill_destinations(
+        self, client_obj, raw_numbers, message, shared_msg_id=None
+    ):
         """
-        Production Reaper: Sweeps messages stuck in 'queued' beyond the timeout threshold
-        and marks them as failed due to vendor unresponsiveness.
+        Routes, bills and queues one message for many destinations: numbers are
+        grouped by destination country, each group gets one route lookup and one
+        credit reservation, and every accepted message goes into the same
+        write-behind batch. message holds the text/encoding/segment fields of
+        the batch items.
+
+        Returns (processed message ids, unsuccess entries). Unsuccess entries
+        are (ton, npi, number, SMPP error) for numbers we refused outright; with
+        shared_msg_id (SUBMIT_MULTI) routing/billing failures are reported there
+        too instead of through a client DLR.
         """
-        # Define the maximum time a message is allowed to wait for a vendor (e.g., 5 minutes)
-        timeout_threshold = timezone.now() - timedelta(seconds=5)
-        stale_msgs = SMSMessage.objects.filter(
-            status="queued",
-            queued_at__lte=timeout_threshold,
-            sendClientDlr=True,
-            clientDlrPushed=False,
-        )
+        processed_ids = []
+        unsuccess_smes = []
+        failed_attempts = []
 
-        reaped_count = stale_msgs.count()
-        if reaped_count == 0:
-            return  # Exit cleanly if nothing is stuck
-
-        for msg in stale_msgs:
-            msg.status = "failed"
-            msg.failure_reason = "Reaper Timeout: Message was stuck in queue too long."  # Update failure_reason
-            msg.save(update_fields=["status", "failure_reason"])
-            # 2. ---> NEW: Instantly fail all associated parts <---
-            # This prevents the background worker from ever picking them up
-            SMSMessagePart.objects.filter(message=msg).update(
-                submit_status="FAILED",
-                failed_at=timezone.now(),
-                failure_reason="Reaper Timeout: Message was stuck in queue too long.",
+        # 1. Clean the numbers and group them by country
+        groups = {}
+        for current_raw_num in raw_numbers:
+            validated_number = clean_phone_number(current_raw_num)
+            if not validated_number:
+                logger.warning(f"Skipping invalid bulk number: {current_raw_num}")
+                unsuccess_smes.append((1, 1, current_raw_num, ESME_RINVDSTADR))
+                continue
+            destination_addr = validated_number.replace("+", "")
+            country = resolve_destination_country(destination_addr)
+            # Unknown countries stay one per group so each gets its own error
+            group_key = country.countryCode if country else destination_addr
+            groups.setdefault(group_key, []).append((current_raw_num, destination_addr))
+
+        # 2. One route lookup and one credit reservation per country
+        accepted = []
+        for members in groups.values():
+            route_data, routing_error = await self.get_route_and_potential_cost(
+                client_obj, members[0][1], message["total_segments"]
             )
+            if not routing_error:
+                routing_error = await self.reserve_credit(
+                    client_obj, route_data, len(members)
+                )
 
-            # Create an official DLR event for the timeout (408 Request Timeout)
-            msg.dlrevent_set.create(
-                status_code="408",
+            if routing_error:
+                for current_raw_num, destination_addr in members:
+                    logger.warning(
+                        f"Routing/Billing Failed for {destination_addr}: {routing_error}"
+                    )
+                    unique_msg_id = shared_msg_id or await self.generate_message_id()
+                    if shared_msg_id:
+                        unsuccess_smes.append(
+                            (1, 1, current_raw_num, ESME_RSUBMITFAIL)
+                        )
+                    else:
+                        # We still answer with the ID so the client gets a "success" response
+                        # (meaning "we accepted your request, but it failed immediately")
+                        processed_ids.append(unique_msg_id)
+                    failed_attempts.append(
+                        (
+                            destination_addr,
+                            unique_msg_id,
+                            routing_error,
+                            message["send_client_dlr"] and not shared_msg_id,
+                        )
+                    )
+                continue
+
+            for (current_raw_num, destination_addr), message_route in zip(
+                members, self.split_reservation(route_data, len(members))
+            ):
+                accepted.append(
+                    {
+                        **message,
+                        "client_obj": client_obj,
+                        "route_data": message_route,
+                        "destination": destination_addr,
+                        "unique_msg_id": shared_msg_id
+                        or await self.generate_message_id(),
+                        "raw_number": current_raw_num,
+                    }
+                )
+
+        # ⚡️ NEW: Save the failures to the DB as FAILED. Do not bill the user.
+        if failed_attempts:
+            await self.save_failed_routing_attempts(
+                client_obj, failed_attempts, message
             )
 
-        # Log the failure professionally on the server
-        logger.error(
-            f"Gateway Timeout: {reaped_count} queued messages marked FAILED due to vendor unresponsiveness."
+        # 3. All destinations land in the same write-behind batch; we only
+        # answer the client once that batch has committed.
+        results = await asyncio.gather(
+            *(self.sms_writer.submit(item) for item in accepted),
+            return_exceptions=True,
         )
+        for item, result in zip(accepted, results):
+            if isinstance(result, Exception):
+                logger.error(
+                    f"Failed to process SMS/Billing for {item['destination']}: {result}"
+                )
+                await self.release_credit(client_obj, item["route_data"])
+                unsuccess_smes.append((1, 1, item["raw_number"], ESME_RSYSERR))
+                continue
+            processed_ids.append(item["unique_msg_id"])
+            logger.info(
+                f"Queued SMS to {item['destination']} | ID: {item['unique_msg_id']}"
+            )
+
+        return processed_ids, unsuccess_smes
+
+    async def check_ip_whitelist(self, ip_address, client_obj=None):
+        """
+        If client_obj is provided, check if the IP belongs to that specific client.
+        Otherwise, check if the IP is whitelisted at all.
+        """
+        if client_obj:
+            # ⚡️ Compiled per-client network index; no query once it is cached
+            whitelist = self.auth_cache.get_whitelist(client_obj.id)
+            if whitelist is MISS:
+                whitelist = await db_sync_to_async(self.auth_cache.load_whitelist)(
+                    client_obj.id
+                )
+            return ip_address in whitelist
+        return await db_sync_to_async(
+            IpWhitelist.objects.filter(ip=ip_address, isDeleted=False).exists
+        )()
 
-    @sync_to_async
-    def authenticate_client(self, username, password):
+    async def authenticate_client(self, username, password):
         """
         Strictly handles authentication. We don't route yet because
         we don't know the destination number until the SUBMIT_SM command!
         """
         try:
-            client = (
-                Client.objects.select_related("clientPolicy")
-                .filter(smppUsername=username, smppPassword=password, isDeleted=False)
-                .first()
-            )
+            # ⚡️ Credentials (+ clientPolicy) come from the bind cache when warm
+            client = self.auth_cache.get_client(username, password)
+            if client is MISS:
+                accounts = await db_sync_to_async(self.auth_cache.load_client)(username)
+                client = self.auth_cache.match_password(accounts, password)
 
             if not client:
                 logger.warning(
@@ -285,55 +418,84 @@ class Command(BaseCommand):
             logger.error(f"Auth Lookup Error for '{username}': {e}")
             return None
 
-    @sync_to_async
-    def register_client_session(self, client_obj, system_id, bind_cmd_id, ip, port):
-        """Creates a new session row when a client successfully binds."""
-        bind_map = {
-            0x00000001: "RECEIVER",
-            0x00000002: "TRANSMITTER",
-            0x00000009: "TRANSCEIVER",
-        }
-        bind_type = bind_map.get(bind_cmd_id, "UNKNOWN")
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=int(os.environ.get("SMPP_WORKERS", 1)),
+            help="Number of SMPP worker processes sharing the port (SO_REUSEPORT)",
+        )
 
-        session = ClientSession.objects.create(
-            client=client_obj,
-            systemId=system_id,
-            bindType=bind_type,
-            remoteIp=ip,
-            remotePort=port,
-            status="ONLINE",
+    def handle(self, *args, **kwargs):
+        self.workers = max(1, kwargs.get("workers") or 1)
+        self.worker_index = 0
+        self.stdout.write(
+            f"Starting SMPP Server on {HOST}:{PORT} with {self.workers} worker(s)..."
         )
-        return session.sessionId
 
-    @sync_to_async
-    def update_session_activity(self, session_id):
-        """Updates the last_activityAt timestamp when a heartbeat is received."""
-        if session_id:
-            ClientSession.objects.filter(sessionId=session_id).update(status="ONLINE")
+        # 🧹 Reset everyone to OFFLINE on server boot to prevent Zombies
+        # (once, here, so a restarting worker can't knock its siblings' binds offline)
+        Client.objects.all().update(bindStatus="OFFLINE")
+        ClientSession.objects.filter(status="ONLINE").update(status="OFFLINE")
+
+        try:
+            if self.workers == 1:
+                asyncio.run(self.run_server())
+            else:
+                self.run_supervisor()
+        except KeyboardInterrupt:
+            self.stdout.write("Server stopped.")
 
-    @sync_to_async
-    def close_client_session(self, session_id):
-        """Marks the session as OFFLINE when the socket closes."""
-        if session_id:
-            ClientSession.objects.filter(sessionId=session_id).update(status="OFFLINE")
+    def run_supervisor(self):
+        """
+        Forks one asyncio server per worker, all listening on PORT with
+        SO_REUSEPORT so the kernel spreads new connections between them.
+        A worker that dies is started again.
+        """
+        # Forked children must not share the parent's DB sockets
+        connections.close_all()
+        ctx = multiprocessing.get_context("fork")
 
-    def handle(self, *args, **kwargs):
-        self.stdout.write(f"Starting SMPP Server on {HOST}:{PORT}...")
+        def spawn(index):
+            process = ctx.Process(
+                target=self.run_worker, args=(index,), name=f"smpp-worker-{index}"
+            )
+            process.start()
+            logger.info(f"Started SMPP worker {index} (pid {process.pid})")
+            return process
+
+        processes = {index: spawn(index) for index in range(self.workers)}
+        try:
+            while True:
+                for index, process in list(processes.items()):
+                    if not process.is_alive():
+                        logger.error(
+                            f"SMPP worker {index} (pid {process.pid}) exited with "
+                            f"{process.exitcode}, restarting"
+                        )
+                        processes[index] = spawn(index)
+                time.sleep(1)
+        finally:
+            for process in processes.values():
+                process.terminate()
+            for process in processes.values():
+                process.join(timeout=5)
+
+    def run_worker(self, index):
+        self.worker_index = index
         try:
             asyncio.run(self.run_server())
         except KeyboardInterrupt:
-            self.stdout.write("Server stopped.")
+            pass
 
     # Once the server is running, it just waits.
     # The moment an external client (like another SMPP server or SMS gateway) connects to your port
 
     async def run_server(self):
-
-        # 🧹 Reset everyone to OFFLINE on server boot to prevent Zombies
-        await sync_to_async(Client.objects.all().update)(bindStatus="OFFLINE")
-        await sync_to_async(ClientSession.objects.filter(status="ONLINE").update)(
-            status="OFFLINE"
-        )
+        # Packet tracing thread (per worker process, each with its own files)
+        self.traffic_log.start(self.worker_index if self.workers > 1 else None)
+        # Warm the country prefix trie so the first SUBMIT_SM doesn't pay for it
+        await db_sync_to_async(get_country_prefix_index)()
         redis_host = os.environ.get("REDIS_HOST", "redis")
         # ⚡️ Using DB=1 keeps our SMPP buffer strictly separated from Celery (DB=0)
         self.redis_client = redis.Redis(
@@ -344,8 +506,41 @@ class Command(BaseCommand):
         # of a StreamWriter just for that specific socket.
         # Client A connects The server runs handle_client and gives it writer_A.
         # Client B connects The server runs a separate instance of handle_client and gives it writer_B
-        server = await asyncio.start_server(self.handle_client, HOST, PORT)
+        # ⚡️ WRITE-BEHIND: accepted messages from all sessions are billed and saved
+        # together every few milliseconds instead of one transaction per message
+        self.sms_writer = SMSWriteBehindQueue()
+        # ⚡️ TOKEN BUCKET TPS: SMPP_RATE_LIMIT_BACKEND=redis shares it across processes
+        # (always on with several workers, otherwise each would allow the full TPS)
+        self.rate_limiter = TokenBucketLimiter(
+            self.redis_client,
+            backend="redis" if self.workers > 1 else RATE_LIMIT_BACKEND,
+        )
+        # ⚡️ SHARED SESSIONS: maxSessions and DLR ownership across worker processes
+        self.worker_token = f"{socket.gethostname()}:{os.getpid()}"
+        self.session_registry = SMPPSessionRegistry(
+            self.redis_client, self.worker_token
+        )
+        await self.session_registry.heartbeat()
+        # ⚡️ CREDIT LEDGER: atomic Redis reservations instead of locking 3 hot rows
+        self.credit_ledger = CreditLedger(self.redis_client)
+        # Claim this worker's message id node now, not on the first SUBMIT_SM
+        await db_sync_to_async(snowflake_ids.ensure_node)()
+        # ⚡️ MULTIPART: raw part bytes, so this client must not decode responses
+        self.multipart = MultipartAssembler(
+            redis.Redis(host=redis_host, port=6379, db=1),
+            backend="redis" if self.workers > 1 else MULTIPART_BACKEND,
+        )
+        server = await asyncio.start_server(
+            self.handle_client, HOST, PORT, reuse_port=self.workers > 1
+        )
         # --- 2. START THE BACKGROUND LOOP HERE ---
+        asyncio.create_task(self.sms_writer.run())
+        asyncio.create_task(self.session_registry.heartbeat_loop())
+        asyncio.create_task(self.route_cache.listen())
+        asyncio.create_task(self.auth_cache.listen())
+        asyncio.create_task(self.session_activity.run())
+        asyncio.create_task(db_executor.report_loop())
+        asyncio.create_task(self.client_dlr_stream_loop())
         asyncio.create_task(self.dlr_dispatcher_loop())
         async with server:
             await server.serve_forever()
@@ -386,6 +581,11 @@ class Command(BaseCommand):
         # --- 3. TRACK THE SYSTEM ID ---
         system_id_logged_in = None
         # ------------------------------
+        # Several SUBMIT_SMs can now be in flight on one bind, so every write to
+        # this socket goes through the lock to keep whole PDUs together.
+        writer.write_lock = asyncio.Lock()
+        writer.inflight_submits = set()
+        framer = PduFramer(reader)
         try:
             while True:
                 idle_timeout = 60
@@ -397,68 +597,47 @@ class Command(BaseCommand):
                 # 1. Read SMPP Header
                 # and also checks policy.idleTimeoutSec if it exceeds that time it is kicked out
                 # of the server to save RAM
-                try:
-                    # ⚡️ ENFORCE IDLE TIMEOUT
-                    header_data = await asyncio.wait_for(
-                        reader.readexactly(16), timeout=idle_timeout
-                    )
-                except asyncio.TimeoutError:
-                    identifier = system_id_logged_in or client_ip
-                    logger.warning(
-                        f"Removing {identifier}: Idle for over {idle_timeout} seconds."
-                    )
-                    break  # This breaks the loop, triggering your finally: block to disconnect them!
-                if not header_data or len(header_data) < 16:
-
+                # ⚡️ FRAMING: one socket read can carry many PDUs. Only when none
+                # are buffered do we wait on the socket (with the idle timeout).
+                frame = framer.next_buffered()
+                if frame is None:
+                    try:
+                        # ⚡️ ENFORCE IDLE TIMEOUT
+                        frame = await asyncio.wait_for(
+                            framer.read_frame(), timeout=idle_timeout
+                        )
+                    except asyncio.TimeoutError:
+                        identifier = system_id_logged_in or client_ip
+                        logger.warning(
+                            f"Removing {identifier}: Idle for over {idle_timeout} seconds."
+                        )
+                        break  # This breaks the loop, triggering your finally: block to disconnect them!
+                    except PduFrameError as e:
+                        # We can't find the next PDU boundary any more, so hang up
+                        logger.warning(f"Dropping {client_ip}: {e}")
+                        await self.send_pdu(
+                            writer, CMD_GENERIC_NACK, ESME_RINVCMDLEN, e.seq_num, b""
+                        )
+                        break
+                if frame is None:
                     # it then goes to finally
                     break
 
-                cmd_len, cmd_id, cmd_status, seq_num = struct.unpack(
-                    ">IIII", header_data
-                )
-
-                # 2. Read Body
-                body_len = cmd_len - 16
-                body_data = await reader.read(body_len) if body_len > 0 else b""
+                cmd_len, cmd_id, cmd_status, seq_num, body_data = frame
 
                 # =========================================================
                 # ⚡️ THE RAW PACKET LOGS (EXACTLY AS IT HIT THE SERVER)
                 # =========================================================
+                # Formatting + file writes happen on the traffic log thread
                 if cmd_id not in [0x00000015, 0x80000015]:  # Ignore Enquire Links
-                    log_entry = [
-                        f"RAW SMPP PACKET FROM {client_ip}",
-                        f"Command   : {hex(cmd_id)} ({'SUBMIT_SM' if cmd_id == 0x4 else 'BIND' if cmd_id == 0x9 else 'OTHER'})",
-                        f"Sequence  : {seq_num}",
-                    ]
-
-                    if cmd_id == 0x00000004:  # If it's a SUBMIT_SM
-                        # 1. Grab the basic strings (Phone numbers) just for quick reference
-                        c_strings = re.findall(b"[^\x00-\x1f\x7f-\xff]{3,}", body_data)
-                        src = (
-                            c_strings[0].decode("ascii", errors="ignore")
-                            if len(c_strings) > 0
-                            else "Unknown"
-                        )
-                        dest = (
-                            c_strings[1].decode("ascii", errors="ignore")
-                            if len(c_strings) > 1
-                            else "Unknown"
-                        )
-
-                        log_entry.append(f"From      : {src}")
-                        log_entry.append(f"To        : {dest}")
-
-                        # 2. ⚡️ THE RAW BYTES
-                        # This prints the pure Python byte string exactly as it arrived
-                        log_entry.append(f"Raw Bytes : {body_data}")
-
-                        # 3. ⚡️ THE HEX DUMP (Standard Telecom Debugging format)
-                        # This formats the bytes into a clean, readable hex string (e.g. 00 05 53 51 55...)
-                        readable_hex = " ".join(f"{b:02X}" for b in body_data)
-                        log_entry.append(f"Raw Hex   : {readable_hex}")
-
-                    # ⚡️ Write the entire block to the logs/smpp_traffic.log file!
-                    traffic_logger.info("\n" + "\n".join(log_entry) + "\n" + "-" * 50)
+                    self.traffic_log.trace(
+                        client_ip,
+                        system_id_logged_in,
+                        cmd_id,
+                        cmd_status,
+                        seq_num,
+                        body_data,
+                    )
                 # ==============================================================================
 
                 # 3. Handle BIND Commands
@@ -488,18 +667,15 @@ class Command(BaseCommand):
                         writer.policy = policy
 
                         max_allowed_sessions = policy.maxSessions if policy else 2
-                        # get the total session of a particular client
-                        # # it count how many times the client is currently connected by looking at the active_clients dictionary,
-                        # # Every time it finds the client from that specific client_obj, it counts 1 2 3....
-                        current_sessions = sum(
-                            1
-                            for w in self.active_clients.values()
-                            if getattr(w, "client_obj", None) == client_obj
+                        # The binds of a client can sit on any worker process, so they
+                        # are counted (and this one registered) in Redis
+                        bind_allowed, current_sessions = await self.register_bind(
+                            writer, client_obj, max_allowed_sessions
                         )
 
                         # Checking if the client have crossed the maxAllocatedSessions
                         if max_allowed_sessions != 0:
-                            if current_sessions >= max_allowed_sessions:
+                            if not bind_allowed:
                                 logger.warning(
                                     f"Blocking {system_id}: Too many active sessions ({current_sessions}/{max_allowed_sessions})"
                                 )
@@ -555,15 +731,30 @@ class Command(BaseCommand):
                         # SUCCESS
                         writer.is_authenticated = True
                         writer.client_obj = client_obj
+                        # ⚡️ WINDOWING: how many SUBMIT_SMs this bind may have unacked
+                        session_window_size = policy.maxWindowPerSession if policy else 10
+                        writer.session_window = (
+                            asyncio.Semaphore(session_window_size)
+                            if session_window_size > 0
+                            else None
+                        )
+                        writer.global_window = self.get_client_global_window(
+                            client_obj, policy
+                        )
                         # writer.vendor_obj = vendor_obj
                         # writer.smpp_obj = smpp_obj
                         system_id_logged_in = system_id
-                        current_session_id = await self.register_client_session(
+                        current_session_id = self.session_activity.open_session(
                             client_obj, system_id, cmd_id, client_ip, client_port
                         )
                         # when you run this db_session_id it is not saving in the global variable it is saving it in a isolated writer created specifically
                         # for that client connection, so when the next client connects it new writer
                         writer.db_session_id = current_session_id
+                        # ⚡️ Windowed deliver_sm sender, committed on deliver_sm_resp
+                        writer.dlr_outbox = DeliverSmOutbox(
+                            writer, self.mark_dlrs_pushed, self.mark_dlrs_pushed
+                        )
+                        writer.dlr_outbox.start()
                         self.active_clients[system_id] = writer
 
                         # 🚀 FIRE THE WEBSOCKET (Session Table Update)
@@ -577,20 +768,10 @@ class Command(BaseCommand):
                         )
                         client_port = addr[1]
 
-                        # ADD THIS: Flip the database switch to ONLINE
-                        client_obj.bindStatus = "ONLINE"
-                        await sync_to_async(client_obj.save)(
-                            update_fields=["bindStatus"]
-                        )
-                        # BROADCAST ONLINE STATUS TO FRONTEND THAT A SESSION IS CREATED
-                        channel_layer = get_channel_layer()
-                        await channel_layer.group_send(
-                            "dashboard_updates",
-                            {
-                                "type": "status_change",  # This triggers the status_change function in consumers.py!
-                                "username": system_id_logged_in,
-                                "status": "ONLINE",
-                            },
+                        # Flip the database switch to ONLINE (and tell the dashboard)
+                        # on the next session activity flush
+                        self.session_activity.set_bind_status(
+                            client_obj, system_id_logged_in, "ONLINE"
                         )
                         resp_body = system_id.encode("ascii") + b"\0"
                         await self.send_pdu(
@@ -615,7 +796,7 @@ class Command(BaseCommand):
                         writer.close()
                         return
                 elif (  # (Sending a Message)Here is a text message. Please route it and send it to this specific phone number.
-                    cmd_id == CMD_SUBMIT_SM
+                    cmd_id in (CMD_SUBMIT_SM, CMD_SUBMIT_MULTI)
                 ):
                     # --- THE GUARD ---
                     if not getattr(writer, "is_authenticated", False):
@@ -623,7 +804,7 @@ class Command(BaseCommand):
                         await self.send_pdu(
                             # CMD_SUBMIT_SM_RESP sends back the response to the client that sent the SUBMIT_SM command. We use it here to tell the client that their attempt was rejected due to lack of authentication.
                             writer,
-                            CMD_SUBMIT_SM_RESP,
+                            cmd_id | 0x80000000,
                             0x0000000F,
                             seq_num,
                             b"",
@@ -631,10 +812,17 @@ class Command(BaseCommand):
                         continue  # Changed from 'return' to 'continue' to keep connection open!
                     # -----------------
 
-                    # 1. Handle the message and get the ID back
-                    msg_id_to_return = await self.handle_submit_sm(
-                        body_data, seq_num, writer
+                    # 1. Wait for a free window slot, then handle the message in the
+                    # background so the next PDU can be read straight away.
+                    # handle_submit_sm writes its own SUBMIT_SM_RESP when it finishes.
+                    windows = await self.acquire_submit_windows(writer)
+                    task = asyncio.create_task(
+                        self.run_windowed_submit(
+                            body_data, seq_num, writer, windows, cmd_id
+                        )
                     )
+                    writer.inflight_submits.add(task)
+                    task.add_done_callback(writer.inflight_submits.discard)
 
                     # # --- THE MISSING REJECTION LOGIC ---
                     # if not msg_id_to_return:
@@ -649,12 +837,9 @@ class Command(BaseCommand):
                     await self.send_pdu(
                         writer, CMD_ENQUIRE_LINK_RESP, ESME_ROK, seq_num, b""
                     )
-                    db_sess_id = getattr(writer, "db_session_id", None)
-
-                    # UPDATE THE SESSION ACTIVITY TIMESTAMP IN THE DATABASE WHENEVER AN ENQUIRE_LINK IS RECEIVED.
-                    # THIS HELPS YOU TRACK ACTIVE SESSIONS AND IMPLEMENT IDLE TIMEOUTS IF NEEDED.
-                    if db_sess_id:
-                        await self.update_session_activity(db_sess_id)
+                    # UPDATE THE SESSION ACTIVITY TIMESTAMP WHENEVER AN ENQUIRE_LINK IS RECEIVED.
+                    # Kept in memory; the flush writes all touched sessions in one UPDATE.
+                    self.session_activity.touch(getattr(writer, "db_session_id", None))
 
                 # i commented Because your script is acting as the SMPP Server, it should never accept a Delivery Receipt from a client. If they send one, it will now fall into the else: block and your server will correctly reject it with a Generic NACK error.
                 # he DELIVER_SM command only flows in one direction: From the Server to the Client.
@@ -662,9 +847,10 @@ class Command(BaseCommand):
                     cmd_id == CMD_DELIVER_SM_RESP
                 ):  # (Incoming Messages & Receipts) (This is a DLR)
 
-                    pass
-
-                    # 4. Respond to the carrier that you received the DLR
+                    # The client acknowledged (or refused) one of our receipts
+                    dlr_outbox = getattr(writer, "dlr_outbox", None)
+                    if dlr_outbox:
+                        dlr_outbox.handle_resp(seq_num, cmd_status)
 
                 else:
                     # Unknown command, send Generic NACK
@@ -675,14 +861,23 @@ class Command(BaseCommand):
         except Exception as e:
             logger.error(f"Error handling client: {e}")
         finally:
+            # Let accepted submits finish billing before we tear the session down
+            if writer.inflight_submits:
+                await asyncio.wait(list(writer.inflight_submits), timeout=10)
+
             # --- 5. REMOVE THEM WHEN THEY DISCONNECT ---
             if system_id_logged_in and system_id_logged_in in self.active_clients:
                 del self.active_clients[system_id_logged_in]
+            # Receipts still waiting for a deliver_sm_resp are resent by the recovery poll
+            dlr_outbox = getattr(writer, "dlr_outbox", None)
+            if dlr_outbox:
+                await dlr_outbox.close()
+            await self.unregister_bind(writer)
 
             # offline the client session in the database when they disconnect
             db_sess_id = getattr(writer, "db_session_id", None)
             if db_sess_id:
-                await self.close_client_session(db_sess_id)
+                self.session_activity.close_session(db_sess_id)
                 # 🚀 FIRE THE WEBSOCKET (Session Table Update)
                 old_cmd_id = getattr(
                     writer, "bind_cmd_id", 0
@@ -698,17 +893,8 @@ class Command(BaseCommand):
             # 🔴 ADD THIS: Flip the database switch back to OFFLINE
             client_obj = getattr(writer, "client_obj", None)
             if client_obj:
-                client_obj.bindStatus = "OFFLINE"
-                # Use sync_to_async to safely hit the database when they drop
-                await sync_to_async(client_obj.save)(update_fields=["bindStatus"])
-                channel_layer = get_channel_layer()
-                await channel_layer.group_send(
-                    "dashboard_updates",
-                    {
-                        "type": "status_change",
-                        "username": system_id_logged_in,
-                        "status": "OFFLINE",
-                    },
+                self.session_activity.set_bind_status(
+                    client_obj, system_id_logged_in, "OFFLINE"
                 )
                 logger.info(f"{system_id_logged_in} went OFFLINE.")
             try:
@@ -723,187 +909,132 @@ class Command(BaseCommand):
             except Exception as e:
                 logger.debug(f"Quietly handled closing error: {e}")
 
-    @sync_to_async
+    @db_sync_to_async
     def get_route_and_potential_cost(
         self, client_obj, destination_number, total_segments
     ):
-        destination_country = None
-        for i in range(4, 0, -1):
-            possible_code = destination_number[:i]
-            destination_country = Country.objects.filter(
-                countryCode=possible_code, isDeleted=False
-            ).first()
-            if destination_country:
-                break
+        # ⚡️ Longest dial-code match from the in-memory trie (no DB round trip)
+        destination_country = resolve_destination_country(destination_number)
         if not destination_country:
             return None, f"Unrecognized Country Code in {destination_number}"
         # --- 2. CHECK THE CACHE (Using the TRUE Country Code) ---
         # e.g., "client_5_44" or "client_5_57"
-        cache_key = f"{client_obj.id}_{destination_country.countryCode}"
-        if cache_key in self.route_cache:
-            route_data = self.route_cache[cache_key].copy()  # Use cached data!
-        else:
+        cache_key = (client_obj.id, destination_country.countryCode)
+        route_data, version = self.route_cache.get(cache_key)  # a copy we may extend
+        if route_data is None:
 
             # --- 2. CALL THE ROUTING ENGINE (No Operator Needed!) ---
-            route_data, error = get_route_and_cost(client_obj, destination_country)
+            full_route, error = get_route_and_cost(client_obj, destination_country)
 
             if error:
                 return None, error
             # Save it to RAM so the next 999 messages to Colombia are instant!
-            self.route_cache[cache_key] = route_data
+            # (only ids and prices; a route/rate edit anywhere clears it)
+            facts = route_facts(full_route)
+            self.route_cache.put(cache_key, facts, version)
+            route_data = dict(facts)
 
         # Multiply by segments to get true costs!
-        total_vendor_cost = route_data["vendor_cost"] * total_segments
-        total_client_cost = route_data["client_cost"] * total_segments
-
-        terminating_company = route_data["terminatingCompany"]
-        client_company = client_obj.company  # Get the Parent Company of the Client
-
-        # 1. Check Vendor Limit (Does this push our debt to the vendor over the limit?)
-        if (
-            terminating_company.usedVendorCredit + total_vendor_cost
-        ) > terminating_company.vendorCreditLimit:
-            return None, "Insufficient Vendor Credit Line for multi-part message."
-
-        # 2. Check Client Limit (Does this push the specific SMPP account over its limit?)
-        if (client_obj.usedCredit + total_client_cost) > client_obj.creditLimit:
-            return None, "Insufficient Client SMPP Credit Line for multi-part message."
-
-        # 3. Check Global Company Limit (Does this push the Parent Company over its total limit?)
-        if (
-            client_company.usedCustomerCredit + total_client_cost
-        ) > client_company.customerCreditLimit:
-            return (
-                None,
-                "Insufficient Global Company Credit Line for multi-part message.",
-            )
-
-        route_data["total_vendor_cost"] = total_vendor_cost
-        route_data["total_client_cost"] = total_client_cost
+        # (Credit limits are checked afterwards by reserve_credit)
+        route_data["total_vendor_cost"] = route_data["vendor_cost"] * total_segments
+        route_data["total_client_cost"] = route_data["client_cost"] * total_segments
 
         return route_data, None
 
-    # Switching back and forth between the async loop and synchronous DB threads is expensive.
-    # You should combine these into a single transaction block inside one @sync_to_async function.
-    # combined save_sms and perform_actual_deduction into one atomic function to improve TPS
-
-    @sync_to_async
-    def save_and_bill_sms_transaction(
-        self,
-        client_obj,
-        route_data,
-        destination,
-        text,
-        encodingType,
-        total_segments,
-        total_chars,
-        source_addr,
-        smpp,
-        vendor,
-        unique_msg_id,
-        concat_ref,
-        sendClientDlr,
-    ):
-        """Does EVERYTHING in a single, hyper-fast database lock."""
-        raw_terminating_company = route_data["terminatingCompany"]
-        raw_client_company = client_obj.company
-
-        with transaction.atomic():
-            # 1. LOCK BALANCES FIRST
-            locked_terminating_company = (
-                type(raw_terminating_company)
-                .objects.select_for_update()
-                .get(id=raw_terminating_company.id)
-            )
-            locked_client = Client.objects.select_for_update().get(id=client_obj.id)
-            locked_client_company = (
-                type(raw_client_company)
-                .objects.select_for_update()
-                .get(id=raw_client_company.id)
-            )
-
-            # 2. DEDUCT MONEY
-            locked_terminating_company.usedVendorCredit += route_data[
-                "total_vendor_cost"
-            ]
-            locked_terminating_company.save(update_fields=["usedVendorCredit"])
-
-            locked_client.usedCredit += route_data["total_client_cost"]
-            locked_client.save(update_fields=["usedCredit"])
-
-            locked_client_company.usedCustomerCredit += route_data["total_client_cost"]
-            locked_client_company.save(update_fields=["usedCustomerCredit"])
-
-            # 3. SAVE SMS
-            parent_msg = SMSMessage.objects.create(
-                destination=destination,
-                text=text,
-                encoding=encodingType,
-                segmentNumber=total_segments,
-                characterCount=total_chars,
-                status="queued",
-                systemId=source_addr,
-                smpp=smpp,
-                client=locked_client,
-                vendor=vendor,
-                message_id=unique_msg_id,
-                concatenated_reference=concat_ref,
-                sendClientDlr=sendClientDlr,
-                queued_at=timezone.now(),
-            )
-            create_message_parts(parent_msg, text)
-
-            # 4. WRITE RECEIPTS
-            VendorTransaction.objects.create(
-                vendor=vendor,
-                message=parent_msg,
-                transactionType=TransactionType.DEDUCTION,
-                segments=total_segments,
-                ratePerSegment=route_data["vendor_cost"],
-                amount=route_data["total_vendor_cost"],
-                balanceSpent=locked_terminating_company.usedVendorCredit,
-                description=f"Routing charge for SMS {unique_msg_id}",
-            )
+    def credit_accounts(self, client_obj, route_data):
+        """(vendor company id, client id, client company id) charged for this route."""
+        return (
+            route_data["terminating_company_id"],
+            client_obj.id,
+            client_obj.company_id,
+        )
 
-            ClientTransaction.objects.create(
-                client=locked_client,
-                message=parent_msg,
-                transactionType=TransactionType.DEDUCTION,
-                segments=total_segments,
-                ratePerSegment=route_data["client_cost"],
-                amount=route_data["total_client_cost"],
-                chargePolicy=locked_client.invoicePolicy,
-                currency=(
-                    locked_client.company.currency.name
-                    if locked_client.company.currency
-                    else "USD"
-                ),
-                balanceSpent=locked_client.usedCredit,
-                description=f"Sent SMS {unique_msg_id}",
+    async def reserve_credit(self, client_obj, route_data, count=1):
+        """
+        Reserves the cost of count messages on this route against all three
+        credit lines in one Redis call (split_reservation hands it out per message).
+        Returns an error string, or None if the messages may be sent.
+        """
+        vendor_company_id, client_id, client_company_id = self.credit_accounts(
+            client_obj, route_data
+        )
+        try:
+            balances, error = await self.credit_ledger.reserve(
+                vendor_company_id,
+                client_id,
+                client_company_id,
+                route_data["total_vendor_cost"] * count,
+                route_data["total_client_cost"] * count,
+                load_snapshot=db_sync_to_async(load_account_snapshot),
             )
+        except redis.RedisError as e:
+            # Ledger unreachable: check fresh Postgres values and let the
+            # write-behind queue bill this message with row locks as before.
+            logger.error(f"Credit ledger unavailable, using Postgres: {e}")
+            return await self.check_credit_in_db(client_obj, route_data, count)
+
+        if error:
+            return error
+        route_data["credit_balances"] = balances
+        return None
+
+    def split_reservation(self, route_data, count):
+        """
+        One route_data per message of a group reserved with reserve_credit(count),
+        each with the running credit balances its receipts should show.
+        """
+        reserved = route_data.get("credit_balances")
+        costs = (
+            route_data["total_vendor_cost"],
+            route_data["total_client_cost"],
+            route_data["total_client_cost"],
+        )
+        per_message = []
+        for index in range(count):
+            message_route = dict(route_data)
+            if reserved:
+                still_to_charge = count - 1 - index
+                message_route["credit_balances"] = tuple(
+                    balance - cost * still_to_charge
+                    for balance, cost in zip(reserved, costs)
+                )
+            per_message.append(message_route)
+        return per_message
 
-            DetailedSMSReport.objects.create(
-                message=parent_msg,
-                text_message_id=unique_msg_id,
-                senderId=source_addr,
-                text=text,
-                part_total=total_segments,
-                client=locked_client.smppUsername,
-                clientRate=route_data["client_cost"],
-                client_charge=route_data["total_client_cost"],
-                vendor=vendor.profileName,
-                vendorRate=route_data["vendor_cost"],
-                vendor_charge=route_data["total_vendor_cost"],
-                submitStatus="SUBMITTED",
-                operatorMNC=route_data.get("mnc", "Unknown"),
-                request_time=parent_msg.createdAt,
-                destination=destination,
-                countryMCC=route_data.get("country_code", "Unknown"),
+    async def release_credit(self, client_obj, route_data):
+        """Gives back a reservation for a message we failed to save."""
+        if not route_data.get("credit_balances"):
+            return
+        try:
+            await self.credit_ledger.release(
+                *self.credit_accounts(client_obj, route_data),
+                route_data["total_vendor_cost"],
+                route_data["total_client_cost"],
             )
-
-        return parent_msg
-
-    # @sync_to_async
+        except redis.RedisError as e:
+            logger.error(f"Could not release credit reservation: {e}")
+
+    @db_sync_to_async
+    def check_credit_in_db(self, client_obj, route_data, count=1):
+        charges = zip(
+            ("vendor", "client", "customer"),
+            self.credit_accounts(client_obj, route_data),
+            (
+                route_data["total_vendor_cost"] * count,
+                route_data["total_client_cost"] * count,
+                route_data["total_client_cost"] * count,
+            ),
+        )
+        for index, (kind, obj_id, amount) in enumerate(charges, start=1):
+            snapshot = load_account_snapshot(kind, obj_id)
+            if snapshot is None:
+                return "Billing account not found."
+            used, limit = snapshot
+            if used + to_units(amount) > limit:
+                return CREDIT_ERRORS[index]
+        return None
+
+    # @db_sync_to_async
     # def perform_actual_deduction(
     #     self, client_obj, route_data, total_segments, sms_message_obj
     # ):
@@ -1009,52 +1140,7 @@ class Command(BaseCommand):
 
     #     logger.info(f"Ledger updated for Msg {sms_message_obj.message_id}")
 
-    async def save_to_buffer(
-        self, system_id, destination, ref_num, total_parts, part_num, text_chunk
-    ):
-        """Saves chunks to server RAM at lightning speed."""
-        key = f"smpp:buffer:{system_id}:{destination}:{ref_num}"
-
-        # Use a pipeline to send multiple commands to Redis in a single atomic transaction
-        async with self.redis_client.pipeline(transaction=True) as pipe:
-            pipe.hset(key, f"part_{part_num}", text_chunk)
-            pipe.hset(key, "total_parts", total_parts)
-            # ⚡️ 5-MINUTE AUTO KILL SWITCH (Solves Frankenstein Collisions!)
-            pipe.expire(key, 300)
-            await pipe.execute()
-
-    async def get_buffered_parts(self, system_id, destination, ref_num):
-        """Fetches and sorts the chunks from RAM."""
-        key = f"smpp:buffer:{system_id}:{destination}:{ref_num}"
-        data = await self.redis_client.hgetall(key)
-
-        if not data:
-            return []
-
-        # Extract only the parts and sort them
-        parts = []
-        for field, value in data.items():
-            if field.startswith("part_"):
-                p_num = int(field.split("_")[1])
-                parts.append((p_num, value))
-
-        parts.sort(
-            key=lambda x: x[0]
-        )  # Sort by part_num to ensure the sentence is in order!
-
-        # Create a tiny mock object so we don't have to change your Reassembler code!
-        class BufferedPart:
-            def __init__(self, text):
-                self.text_chunk = text
-
-        return [BufferedPart(text) for _, text in parts]
-
-    async def clear_buffer(self, system_id, destination, ref_num):
-        """Wipes the chunks from RAM once stitched."""
-        key = f"smpp:buffer:{system_id}:{destination}:{ref_num}"
-        await self.redis_client.delete(key)
-
-    # @sync_to_async
+    # @db_sync_to_async
     # def save_to_buffer(
     #     self, system_id, destination, ref_num, total_parts, part_num, text_chunk
     # ):
@@ -1069,7 +1155,7 @@ class Command(BaseCommand):
     #     )
     #     return obj
 
-    # @sync_to_async
+    # @db_sync_to_async
     # def get_buffered_parts(self, system_id, destination, ref_num):
     #     from squadServices.models.smpp.smppSMS import MultipartBuffer
 
@@ -1086,7 +1172,7 @@ class Command(BaseCommand):
     #         ).order_by("part_num")
     #     )
 
-    # @sync_to_async
+    # @db_sync_to_async
     # def clear_buffer(self, system_id, destination, ref_num):
     #     from squadServices.models.smpp.smppSMS import MultipartBuffer
 
@@ -1094,103 +1180,63 @@ class Command(BaseCommand):
     #         system_id=system_id, destination=destination, ref_num=ref_num
     #     ).delete()
 
-    async def handle_submit_sm(self, body, seq_num, writer):
+    async def handle_submit_sm(self, body, seq_num, writer, cmd_id=CMD_SUBMIT_SM):
         """
-        Parses SUBMIT_SM, reassembles multipart messages, and loops through
-        comma-separated destination numbers for routing and billing.
+        Parses SUBMIT_SM (or SUBMIT_MULTI), reassembles multipart messages, and
+        routes and bills all destination numbers as one batch.
         """
-        offset = 0
-
+        is_submit_multi = cmd_id == CMD_SUBMIT_MULTI
+        resp_cmd_id = cmd_id | 0x80000000
         # ==========================================
-        # 1. PARSE MANDATORY PARAMETERS (HEADER)
+        # 1. PARSE MANDATORY PARAMETERS + 2. TLVs (OPTIONAL PARAMETERS)
         # ==========================================
-        service_type, offset = self.read_c_string(body, offset)
-        source_addr_ton = body[offset]
-        offset += 1
-        source_addr_npi = body[offset]
-        offset += 1
-        source_addr, offset = self.read_c_string(body, offset)
-
-        dest_addr_ton = body[offset]
-        offset += 1
-        dest_addr_npi = body[offset]
-        offset += 1
-        raw_destination_addr, offset = self.read_c_string(body, offset)
+        try:
+            pdu = (
+                decode_submit_multi(body) if is_submit_multi else decode_submit_sm(body)
+            )
+        except PduDecodeError as e:
+            logger.warning(f"Rejected: Malformed SUBMIT_SM ({e}).")
+            await self.send_error_with_tlv(
+                writer, seq_num, "INVALID_TLV", cmd_id=resp_cmd_id
+            )
+            return None
+
+        source_addr = pdu.source_addr
+        raw_destination_addr = pdu.destination_addr
         print(f"📞 Parsed destination numbers: {raw_destination_addr}")
 
-        # ⚡️ SPLIT COMMA-SEPARATED NUMBERS
-        raw_numbers = [n.strip() for n in raw_destination_addr.split(",") if n.strip()]
+        if is_submit_multi:
+            raw_numbers = [address for _, _, address in pdu.dest_addresses]
+        else:
+            # ⚡️ SPLIT COMMA-SEPARATED NUMBERS
+            raw_numbers = [
+                n.strip() for n in raw_destination_addr.split(",") if n.strip()
+            ]
         print(f"📞 Parsed destination numbers: {raw_numbers}")
-        esm_class = body[offset]
-        offset += 1
-        protocol_id = body[offset]
-        offset += 1
-        priority_flag = body[offset]
-        offset += 1
-        schedule_delivery_time, offset = self.read_c_string(body, offset)
-        validity_period, offset = self.read_c_string(body, offset)
-        registered_delivery = body[
-            offset
-        ]  # this value came for the  client when they send the SUBMIT_SM command. It indicates whether the client wants a DLR for this message or not.
-        offset += 1
+        esm_class = pdu.esm_class
+        data_coding = pdu.data_coding
 
         # Determine DLR requirements
         client_obj = getattr(writer, "client_obj", None)
         client_wants_dlr = (
-            registered_delivery == 1
+            pdu.registered_delivery == 1
         )  # compare with 1 because in SMPP, a value of 1 means "Yes, I want a DLR", while 0 means "No, I don't want a DLR".
         client_allowed_dlr = (
             getattr(client_obj, "enableDlr", False) if client_obj else False
         )
         final_send_dlr_decision = client_wants_dlr and client_allowed_dlr
 
-        replace_if_present_flag = body[offset]
-        offset += 1
-        data_coding = body[offset]
-        offset += 1
-        sm_default_msg_id = body[offset]
-        offset += 1
-        sm_length = body[offset]
-        offset += 1
-
-        # Extract Raw Message Bytes
-        raw_short_message = body[offset : offset + sm_length]
-        offset += sm_length
-
-        # ==========================================
-        # 2. PARSE TLV (OPTIONAL PARAMETERS)
-        # ==========================================
-        sar_ref_num = None
-        sar_total_parts = None
-        sar_part_num = None
-        # --- UPGRADED TLV PARSING LOOP (Catches SAR) ---
-        while offset < len(body):
-            if len(body) - offset < 4:
-                logger.warning("Rejected: Malformed TLV structure.")
-                await self.send_error_with_tlv(writer, seq_num, "INVALID_TLV")
-                return None
-            # Opening the Box
-            tlv_tag, tlv_len = struct.unpack(">HH", body[offset : offset + 4])
-            offset += 4
-            tlv_value = body[offset : offset + tlv_len]
-            offset += tlv_len
-
-            # Normally, SMPP puts the text message in the short_message field.
-            # But if the text is massive, clients leave short_message blank and
-            # stuff the entire text into this optional TLV tag instead.
-            if tlv_tag == 0x0424:
-                print("==========", raw_short_message)
-                print("📦 Detected TLV 0x0424: This message is using the giant message")
-                raw_short_message = tlv_value
-                logger.info(
-                    f"📦 Found giant message in TLV! Size: {len(raw_short_message)} bytes"
-                )
-            elif tlv_tag == 0x020C:  # sar_msg_ref_num(SAR Reference Number)
-                sar_ref_num = struct.unpack(">H", tlv_value)[0]
-            elif tlv_tag == 0x020E:  # sar_total_segments(SAR Total Segments)
-                sar_total_parts = struct.unpack(">B", tlv_value)[0]
-            elif tlv_tag == 0x020F:  # sar_segment_seqnum(SAR Part Number)
-                sar_part_num = struct.unpack(">B", tlv_value)[0]
+        # Raw message bytes. Normally, SMPP puts the text message in the short_message field.
+        # But if the text is massive, clients leave short_message blank and
+        # stuff the entire text into TLV 0x0424 instead (the decoder already swapped it in).
+        raw_short_message = pdu.short_message
+        if TLV_MESSAGE_PAYLOAD in pdu.tlvs:
+            logger.info(
+                f"📦 Found giant message in TLV! Size: {len(raw_short_message)} bytes"
+            )
+        sar_ref_num = pdu.sar_msg_ref_num
+        sar_total_parts = pdu.sar_total_segments
+        sar_part_num = pdu.sar_segment_seqnum
         # ---------------------------------- if message is coming in as a multi-part message ---------------------------------------------
 
         # -------------------------------------------------------------------------
@@ -1225,7 +1271,9 @@ class Command(BaseCommand):
                 logger.warning(
                     f"Rejected: Invalid UDH (Part {part_num} of {total_parts})"
                 )
-                await self.send_error_with_tlv(writer, seq_num, "INVALID_UDH")
+                await self.send_error_with_tlv(
+                    writer, seq_num, "INVALID_UDH", cmd_id=resp_cmd_id
+                )
                 return None
 
             # UDH / SAR Conflict Guard
@@ -1239,7 +1287,10 @@ class Command(BaseCommand):
                     f"Rejected: Client sent conflicting UDH and SAR instructions."
                 )
                 await self.send_error_with_tlv(
-                    writer, seq_num, "Protocol Error: UDH and SAR mismatch."
+                    writer,
+                    seq_num,
+                    "Protocol Error: UDH and SAR mismatch.",
+                    cmd_id=resp_cmd_id,
                 )
                 return None
             is_multipart = True
@@ -1252,65 +1303,44 @@ class Command(BaseCommand):
 
         # Handle Multipart Buffering
         if is_multipart:
-            # Note: We use the raw_destination_addr as the key to group the parts
-            # Decode the text
-            if data_coding == 8:
-                chunk_text = raw_short_message.decode(
-                    "utf-16-be", errors="ignore"
-                ).replace("\x00", "")
-            else:
-                chunk_text = raw_short_message.decode("utf-8", errors="ignore").replace(
-                    "\x00", ""
-                )
-
-            # 2. Park it in the Waiting Room
-            await self.save_to_buffer(
-                client_obj.smppUsername,
-                raw_destination_addr,
-                ref_num,
+            # Note: We use the raw_destination_addr as the key to group the parts.
+            # Park the raw bytes in the Waiting Room; one Redis round trip stores
+            # the part and, for the last one, returns them all and clears the buffer
+            # (with several PDUs in flight only one call can ever get them).
+            buffered_parts = await self.multipart.add_part(
+                buffer_key(client_obj.smppUsername, raw_destination_addr, ref_num),
                 total_parts,
                 part_num,
-                chunk_text,
-            )
-            print(
-                f"📦 Parked Part {part_num} of {total_parts} in Waiting Room (Ref: {ref_num})"
-            )
-
-            # 3. Check if we have all the pieces
-            buffered_parts = await self.get_buffered_parts(
-                client_obj.smppUsername, raw_destination_addr, ref_num
+                raw_short_message,
             )
 
-            if len(buffered_parts) < total_parts:
+            if buffered_parts is None:
+                print(
+                    f"📦 Parked Part {part_num} of {total_parts} in Waiting Room (Ref: {ref_num})"
+                )
                 # Still waiting for parts. Return a temp ID and exit early.
                 temp_msg_id = await self.generate_message_id()
-                resp_body = temp_msg_id.encode("ascii") + b"\0"
-                await self.send_pdu(
-                    writer, CMD_SUBMIT_SM_RESP, ESME_ROK, seq_num, resp_body
-                )
+                resp_body = self.submit_resp_body(cmd_id, temp_msg_id)
+                await self.send_pdu(writer, resp_cmd_id, ESME_ROK, seq_num, resp_body)
                 return temp_msg_id
 
             # 🎉 GRAND FINALE: ALL PARTS HAVE ARRIVED!
             print(f"✅ All {total_parts} parts received! Stitching message together...")
 
-            # 4. Clean out the waiting room
-            await self.clear_buffer(
-                client_obj.smppUsername, raw_destination_addr, ref_num
-            )
-            short_message = "".join([p.text_chunk for p in buffered_parts])
+            raw_short_message = b"".join(buffered_parts)
             is_multipart = False  # Turn this off so it behaves like a normal message
             ref_num = None  # Wipe the client's reference number!
 
+        # Decode the text once (for multipart, the stitched bytes of all parts,
+        # so a UCS-2 character split across two parts still decodes)
+        if data_coding == 8:
+            short_message = raw_short_message.decode(
+                "utf-16-be", errors="ignore"
+            ).replace("\x00", "")
         else:
-            # If it's a normal, single-part message, handle it normally
-            if data_coding == 8:
-                short_message = raw_short_message.decode(
-                    "utf-16-be", errors="ignore"
-                ).replace("\x00", "")
-            else:
-                short_message = raw_short_message.decode(
-                    "utf-8", errors="ignore"
-                ).replace("\x00", "")
+            short_message = raw_short_message.decode(
+                "utf-8", errors="ignore"
+            ).replace("\x00", "")
 
         # ==========================================
         # 4. PRE-FLIGHT CHECKS & GUARDS
@@ -1319,7 +1349,7 @@ class Command(BaseCommand):
             account_name = client_obj.smppUsername if client_obj else "UnknownClient"
             logger.warning(f"Rejected: Empty message payload from {account_name}")
             await self.send_error_with_tlv(
-                writer, seq_num, "Message text cannot be empty."
+                writer, seq_num, "Message text cannot be empty.", cmd_id=resp_cmd_id
             )
             return None
 
@@ -1327,13 +1357,15 @@ class Command(BaseCommand):
         if len(source_addr) > 15:
             logger.warning(f"Rejected: Sender ID '{source_addr}' too long.")
             await self.send_error_with_tlv(
-                writer, seq_num, "Invalid Sender ID: Exceeds 15 chars."
+                writer,
+                seq_num,
+                "Invalid Sender ID: Exceeds 15 chars.",
+                cmd_id=resp_cmd_id,
             )
             return None
 
-        encoding_type = self.detect_encoding(short_message)
-        total_segments, total_chars = self.calculate_segments(
-            short_message, encoding_type
+        encoding_type, total_segments, total_chars = get_encoding_and_segments(
+            short_message
         )
         # ------------------------------------------------------------------
         # ⚡️ GUARD 3: Segment Count Limit (Protect against massive messages)
@@ -1351,6 +1383,7 @@ class Command(BaseCommand):
                 writer,
                 seq_num,
                 f"Message too long. Max segments allowed: {MAX_ALLOWED_SEGMENTS}.",
+                cmd_id=resp_cmd_id,
             )
             return None
         final_concat_ref = secrets.randbelow(256) if total_segments > 1 else None
@@ -1361,13 +1394,27 @@ class Command(BaseCommand):
         policy = getattr(writer, "policy", None)
 
         max_tps = policy.maxTps if policy else 50
-        if not self.check_rate_limit(client_obj.smppUsername, max_tps):
+        max_burst = policy.maxBurst if policy else 0
+        bucket_key = self.rate_limiter.build_key(
+            client_obj,
+            session_id=getattr(writer, "db_session_id", None),
+            destination=raw_destination_addr,
+        )
+        # A SUBMIT_MULTI costs one token per destination
+        tokens = len(raw_numbers) if is_submit_multi else 1
+        if not await self.rate_limiter.allow(bucket_key, max_tps, max_burst, tokens):
             logger.warning(
                 f"🚦 Throttled: {client_obj.smppUsername} exceeded {max_tps} TPS limit."
             )
             # 0x00000058 is the official SMPP "Throttling Error"
             # Throttling Error= You are sending messages too fast. Slow down and try again later
-            await self.send_pdu(writer, CMD_SUBMIT_SM_RESP, 0x00000058, seq_num, b"\0")
+            await self.send_pdu(
+                writer,
+                resp_cmd_id,
+                0x00000058,
+                seq_num,
+                self.submit_resp_body(cmd_id, ""),
+            )
             return None
         # # 2. SENDER ID POLICY CHECK
         # sender_policy = policy.senderIdPolicy if policy else "approvedOnly"
@@ -1382,76 +1429,50 @@ class Command(BaseCommand):
         #         )
         #         return None
         # ==========================================
-        # 5. THE BULK ROUTING & BILLING LOOP
+        # 5. BATCHED ROUTING & BILLING (one route lookup and one credit
+        # reservation per destination country, one write-behind batch)
         # ==========================================
-        processed_ids = []
-        print("-----------", raw_numbers)
-
-        for current_raw_num in raw_numbers:
-            # 1. Clean the specific number
-            validated_number = clean_phone_number(current_raw_num)
-            if not validated_number:
-                logger.warning(f"Skipping invalid bulk number: {current_raw_num}")
-                continue
-            unique_msg_id = await self.generate_message_id()
-
-            destination_addr = validated_number.replace("+", "")
-
-            # 2. Find Route and Check Cost Constraints
-            route_data, routing_error = await self.get_route_and_potential_cost(
-                client_obj, destination_addr, total_segments
-            )
-
-            if routing_error:
-                logger.warning(
-                    f"Routing/Billing Failed for {destination_addr}: {routing_error}"
-                )
-                # ⚡️ NEW: Save it to the DB as FAILED. Do not bill the user.
-                await self.save_failed_routing_attempt(
-                    client_obj,
-                    destination_addr,
-                    short_message,
-                    encoding_type,
-                    total_segments,
-                    total_chars,
-                    source_addr,
-                    unique_msg_id,
-                    routing_error,
-                    final_send_dlr_decision,
-                )
-                # We still append the ID so the client gets a "success" response
-                # (meaning "we accepted your request, but it failed immediately")
-                processed_ids.append(unique_msg_id)
-                continue
-
-            # 3. Process Valid Message
-
-            try:
-                await self.save_and_bill_sms_transaction(
-                    client_obj,
-                    route_data,
-                    destination_addr,
-                    short_message,
-                    encoding_type,
-                    total_segments,
-                    total_chars,
-                    source_addr,
-                    route_data["smpp"],
-                    route_data["vendor"],
-                    unique_msg_id,
-                    final_concat_ref,
-                    final_send_dlr_decision,
-                )
-                processed_ids.append(unique_msg_id)
-                logger.info(f"Queued SMS to {destination_addr} | ID: {unique_msg_id}")
-            except Exception as e:
-                logger.error(
-                    f"Failed to process SMS/Billing for {destination_addr}: {e}"
-                )
+        # Every destination of a SUBMIT_MULTI shares one message_id, like SMSCs do
+        shared_msg_id = await self.generate_message_id() if is_submit_multi else None
+        processed_ids, unsuccess_smes = await self.route_and_bill_destinations(
+            client_obj,
+            raw_numbers,
+            {
+                "text": short_message,
+                "encoding": encoding_type,
+                "total_segments": total_segments,
+                "total_chars": total_chars,
+                "source_addr": source_addr,
+                "concat_ref": final_concat_ref,
+                "send_client_dlr": final_send_dlr_decision,
+            },
+            shared_msg_id=shared_msg_id,
+        )
 
         # ==========================================
         # 6. FINAL CLIENT RESPONSE
         # ==========================================
+        if is_submit_multi:
+            # Distribution lists aren't supported; report them as failed destinations
+            unsuccess_smes += [
+                (0, 0, name, ESME_RINVDLNAME) for name in pdu.distribution_lists
+            ]
+            ton_npi = {address: (ton, npi) for ton, npi, address in pdu.dest_addresses}
+            unsuccess_smes = [
+                (*ton_npi.get(address, (ton, npi)), address, error_status)
+                for ton, npi, address, error_status in unsuccess_smes
+            ]
+            await self.send_pdu(
+                writer,
+                resp_cmd_id,
+                ESME_ROK if processed_ids else ESME_RSUBMITFAIL,
+                seq_num,
+                self.submit_resp_body(
+                    cmd_id, shared_msg_id if processed_ids else "", unsuccess_smes
+                ),
+            )
+            return shared_msg_id if processed_ids else None
+
         if processed_ids:
             # Send back the ID of the last successfully processed message
             last_msg_id = processed_ids[-1]
@@ -1470,7 +1491,7 @@ class Command(BaseCommand):
             )
             return None
 
-    # @sync_to_async
+    # @db_sync_to_async
     # def save_sms(
     #     self,
     #     destination,
@@ -1487,7 +1508,7 @@ class Command(BaseCommand):
     #     sendClientDlr=False,
     # ):
     #     """
-    #     Django ORM is synchronous, so we wrap it in sync_to_async
+    #     Django ORM is synchronous, so we wrap it in db_sync_to_async
     #     """
     #     parent_msg = SMSMessage.objects.create(
     #         destination=destination,
@@ -1512,9 +1533,10 @@ class Command(BaseCommand):
     # TLV = Type-Length-Value
 
     # This function is used after the client is already logged in
-    async def send_error_with_tlv(self, writer, seq, error_msg="Low Balance"):
+    async def send_error_with_tlv(
+        self, writer, seq, error_msg="Low Balance", cmd_id=CMD_SUBMIT_SM_RESP
+    ):
         """Bypasses strict SMPP rules by faking a success to deliver the text."""
-        cmd_id = CMD_SUBMIT_SM_RESP  # submit_sm_resp
         print("=========send_error_with_tlv==========cmd_id:", cmd_id)
 
         # The server pretends the message was a Success (Status 0), but hides the real error text inside the mandatory message_id field.
@@ -1522,13 +1544,23 @@ class Command(BaseCommand):
         status = 0x00
 
         # Add 'ERR:' so the client knows this is actually a rejection
-        safe_msg = f"ERR:{error_msg}"[:64].encode("ascii", errors="ignore") + b"\0"
+        safe_msg = self.submit_resp_body(
+            cmd_id & ~0x80000000,
+            f"ERR:{error_msg}"[:64].encode("ascii", errors="ignore").decode("ascii"),
+        )
         # Construct the header and send the packet
         length_header = 16 + len(safe_msg)
         header = struct.pack(">IIII", length_header, cmd_id, status, seq)
 
-        writer.write(header + safe_msg)
-        await writer.drain()
+        async with writer.write_lock:
+            writer.write(header + safe_msg)
+            await writer.drain()
+
+    def submit_resp_body(self, cmd_id, message_id, unsuccess_smes=()):
+        """Body of the SUBMIT_SM_RESP / SUBMIT_MULTI_RESP answering cmd_id."""
+        if cmd_id == CMD_SUBMIT_MULTI:
+            return encode_submit_multi_resp(message_id, unsuccess_smes)
+        return message_id.encode("ascii") + b"\0"
 
     # This function is used during the handshake/login phase
     async def send_bind_error_with_tlv(
@@ -1545,40 +1577,35 @@ class Command(BaseCommand):
         length_header = 16 + len(body_system_id)
         header = struct.pack(">IIII", length_header, cmd_id | 0x80000000, status, seq)
 
-        writer.write(header + body_system_id)
-        await writer.drain()
+        async with writer.write_lock:
+            writer.write(header + body_system_id)
+            await writer.drain()
 
     # send_pdu is the only way your server can send a reply back to the client.
     async def send_pdu(self, writer, cmd_id, status, seq, body):
         """Constructs and writes the SMPP PDU"""
         length = 16 + len(body)
         header = struct.pack(">IIII", length, cmd_id, status, seq)
-        writer.write(header + body)
-        await writer.drain()
+        async with writer.write_lock:
+            writer.write(header + body)
+            await writer.drain()
 
     def read_c_string(self, data, offset):
         """Helper to read C-Style null-terminated strings correctly"""
-        # Slice from the current offset to the end
-        fragment = data[offset:]
-
-        # Find the first null byte in this fragment
-        end_idx = fragment.find(b"\0")
-
-        if end_idx == -1:
-            # If no null byte found, take the whole remaining data
-            return fragment.decode("ascii", errors="ignore"), len(data)
-
-        # Extract the string, decode it, and move the offset past the null byte
-        result = fragment[:end_idx].decode("ascii", errors="ignore")
-        return result, offset + end_idx + 1
+        return read_c_string(data, offset)
 
     def extract_c_string(self, data, offset):
         val, _ = self.read_c_string(data, offset)
         return val
 
-    @sync_to_async
-    def get_pending_dlrs(self):
-        """Fetches messages from the DB that are finished but haven't sent a DLR back to the client yet."""
+    @db_sync_to_async
+    def get_pending_dlrs(self, usernames, after_pk=0):
+        """
+        Fetches messages from the DB that are finished but haven't sent a DLR back to the client yet.
+        Pages by pk (after_pk), so one recovery pass never sees a row twice.
+        """
+        if not usernames:
+            return []
         return list(
             # WE ADDED .select_related('client') HERE so we can access the username!
             SMSMessage.objects.select_related("client")
@@ -1587,90 +1614,157 @@ class Command(BaseCommand):
                 sendClientDlr=True,
                 clientDlrPushed=False,
                 status__in=["delivered", "failed"],
-            )[:50]
+                client__smppUsername__in=usernames,
+                pk__gt=after_pk,
+            )
+            .order_by("pk")[:DLR_RECOVERY_BATCH]
         )
 
-    @sync_to_async
-    def mark_dlr_pushed(self, msg_obj):
-        """Marks the message so we don't send the same receipt twice."""
-        msg_obj.clientDlrPushed = True
-        msg_obj.save(update_fields=["clientDlrPushed"])
+    @db_sync_to_async
+    def mark_dlrs_pushed(self, msg_ids):
+        """
+        Marks the messages so we don't send the same receipt twice. Called by the
+        DLR outbox with what the client answered (ROK, or a final rejection).
+        """
+        SMSMessage.objects.filter(pk__in=msg_ids).update(clientDlrPushed=True)
 
-    async def dlr_dispatcher_loop(self):
-        """Runs constantly in the background looking for receipts to send."""
-        await asyncio.sleep(5)  # Let the server fully start up first
+    async def ensure_dlr_group(self, stream_key):
+        try:
+            await self.redis_client.xgroup_create(
+                stream_key, CLIENT_DLR_GROUP, id="0", mkstream=True
+            )
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):  # the group already exists
+                raise
 
+    async def client_dlr_stream_loop(self):
+        """
+        Pushes DLRs as soon as the vendor side publishes them. Each bound
+        username has its own stream; every worker reads it through the same
+        consumer group, so an event goes to one worker only.
+        """
+        groups_ready = set()
         while True:
+            usernames = list(self.active_clients)
+            if not usernames:
+                await asyncio.sleep(1)
+                continue
             try:
-                await self.reap_stale_messages()
-                pending_msgs = await self.get_pending_dlrs()
-                tasks = []  # ⚡️ Create a list of tasks
-
-                for msg in pending_msgs:
-                    # ---> THE FIX <---
-                    # Find the connection using the Client's login username ("yukesh"),
-                    # NOT the SMS Sender ID ("SQUAD")!
-                    target_username = msg.client.smppUsername if msg.client else None
-
-                    if target_username and target_username in self.active_clients:
-                        writer = self.active_clients[target_username]
-
-                        # Create a quick async wrapper
-                        async def push_dlr(w, m, username):
-                            await self.send_deliver_sm(w, m)
-                            await self.mark_dlr_pushed(m)
-
+                streams = {}
+                for username in usernames:
+                    stream_key = client_dlr_stream_key(username)
+                    if stream_key not in groups_ready:
+                        await self.ensure_dlr_group(stream_key)
+                        groups_ready.add(stream_key)
+                    streams[stream_key] = ">"
+
+                replies = await self.redis_client.xreadgroup(
+                    CLIENT_DLR_GROUP,
+                    self.worker_token,
+                    streams,
+                    count=100,
+                    block=1000,
+                )
+                tasks = []
+                for stream_key, entries in replies or []:
+                    for entry_id, event in entries:
                         tasks.append(
-                            asyncio.create_task(push_dlr(writer, msg, target_username))
+                            asyncio.create_task(
+                                self.push_streamed_dlr(stream_key, entry_id, event)
+                            )
                         )
                 # ⚡️ Blast them all out concurrently!
                 if tasks:
                     await asyncio.gather(*tasks)
+            except asyncio.CancelledError:
+                raise
+            except redis.RedisError as e:
+                logger.error(f"Client DLR stream error, retrying: {e}")
+                groups_ready.clear()  # the streams may be gone after a Redis restart
+                await asyncio.sleep(2)
+            except Exception as e:
+                logger.error(f"Client DLR stream error: {e}")
+                await asyncio.sleep(1)
+
+    async def push_streamed_dlr(self, stream_key, entry_id, event):
+        try:
+            writer = self.active_clients.get(event.get("username"))
+            # Not bound here anymore (or pushed by the recovery poll already):
+            # the DB poll of whichever worker holds the bind sends it
+            if writer is not None and await self.session_registry.claim_dlr(
+                event["pk"]
+            ):
+                self.push_dlr_event(writer, event)
+        except Exception as e:
+            logger.error(f"Streamed DLR {event.get('pk')} failed: {e}")
+        finally:
+            await self.redis_client.xack(stream_key, CLIENT_DLR_GROUP, entry_id)
+
+    async def dlr_dispatcher_loop(self):
+        """Runs constantly in the background looking for receipts to send."""
+        await asyncio.sleep(5)  # Let the server fully start up first
+
+        while True:
+            try:
+                # Drain everything missed, a batch at a time, then rest
+                after_pk = 0
+                while True:
+                    # Only DLRs of clients bound to THIS worker; the others pick up theirs
+                    pending_msgs = await self.get_pending_dlrs(
+                        list(self.active_clients), after_pk
+                    )
+                    await self.push_recovered_dlrs(pending_msgs)
+                    if len(pending_msgs) < DLR_RECOVERY_BATCH:
+                        break
+                    after_pk = pending_msgs[-1].pk
 
             except Exception as e:
                 logger.error(f"DLR Dispatcher Error: {e}")
 
-            # Wait 2 seconds before checking the database again
-            await asyncio.sleep(2)
+            # Only a recovery path now, client_dlr_stream_loop does the real work
+            # (stale messages are reaped by the reap-stale-messages beat job)
+            await asyncio.sleep(DLR_RECOVERY_INTERVAL)
+
+    async def push_recovered_dlrs(self, pending_msgs):
+        tasks = []  # ⚡️ Create a list of tasks
+
+        for msg in pending_msgs:
+            # ---> THE FIX <---
+            # Find the connection using the Client's login username ("yukesh"),
+            # NOT the SMS Sender ID ("SQUAD")!
+            target_username = msg.client.smppUsername if msg.client else None
+
+            if target_username and target_username in self.active_clients:
+                # A client bound to two workers must get each DLR once
+                if not await self.session_registry.claim_dlr(msg.id):
+                    continue
+                writer = self.active_clients[target_username]
+                # Queued on the bind's outbox; marked pushed on deliver_sm_resp
+                tasks.append(asyncio.create_task(self.send_deliver_sm(writer, msg)))
+        # ⚡️ Blast them all out concurrently!
+        if tasks:
+            await asyncio.gather(*tasks)
 
     async def send_deliver_sm(self, writer, msg_obj):
-        """Formats and sends the exact SMPP bytes for a Delivery Receipt."""
+        """Delivery Receipt for a message found by the DB recovery poll."""
+        event = await self.build_dlr_event(msg_obj)
+        self.push_dlr_event(writer, event)
 
+    @db_sync_to_async
+    def build_dlr_event(self, msg_obj):
         # grabs the most recent DLR event for this message to get the real status code (instead of just "delivered" or "failed" from the SMSMessage table)
-        latest_event = await sync_to_async(
-            lambda: msg_obj.dlrevent_set.order_by("-received_at").first()
-        )()
-        real_err = (
-            latest_event.status_code
-            if latest_event and latest_event.status_code
-            else "000"
-        )
-
-        # 1. Get the total parts from the parent message
-        total_parts = int(msg_obj.segmentNumber) if msg_obj.segmentNumber else 1
-
-        # 2. Count how many parts are actually marked 'DELIVERED' in the database
-        # Use sync_to_async because this is a new database query
-        delivered_parts_count = await sync_to_async(
-            lambda: msg_obj.parts.filter(submit_status="DELIVERED").count()
-        )()
-        # 1. Format Dates (YYMMDDHHMMSS)
-        submit_date = (
-            msg_obj.queued_at.strftime("%y%m%d%H%M%S")
-            if msg_obj.queued_at
-            else timezone.now().strftime("%y%m%d%H%M%S")
+        latest_event = msg_obj.dlrevent_set.order_by("-received_at").first()
+        # Count how many parts are actually marked 'DELIVERED' in the database
+        delivered_parts_count = msg_obj.parts.filter(submit_status="DELIVERED").count()
+        return build_client_dlr_event(
+            msg_obj,
+            msg_obj.client.smppUsername,
+            latest_event.status_code if latest_event else None,
+            delivered_parts_count,
         )
-        done_date = timezone.now().strftime("%y%m%d%H%M%S")
-
-        # 2. Map standard DB status to Telecom Status
-        stat_map = {"delivered": "DELIVRD", "failed": "REJECTD"}
-        smpp_stat = stat_map.get(msg_obj.status, "UNKNOWN")
-
-        # 3. Create the DLR text string
-
-        # ONLY GET 20 LETTER OF THE TEXT
-        short_text = msg_obj.text[:20] if msg_obj.text else ""
 
+    def push_dlr_event(self, writer, event):
+        """Formats the exact SMPP bytes for a Delivery Receipt and queues them on the bind."""
         # If your message has 1 part: it becomes 001.
 
         # If your message has 2 parts: it becomes 002.
@@ -1679,14 +1773,14 @@ class Command(BaseCommand):
         # The :03 part inside the curly braces tells
         # Python: "I want this number to be at least 3 characters wide
         dlr_string = (
-            f"id:{msg_obj.message_id} "
-            f"sub:{total_parts:03} "  # submitted parts (total parts in the message)
-            f"dlvrd:{delivered_parts_count:03} "
-            f"submit date:{submit_date} "
-            f"done date:{done_date} "
-            f"stat:{smpp_stat} "
-            f"err:{real_err} "  # <--- Now using your DLREvent table!
-            f"text:{short_text}"
+            f"id:{event['message_id']} "
+            f"sub:{int(event['sub']):03} "  # submitted parts (total parts in the message)
+            f"dlvrd:{int(event['dlvrd']):03} "
+            f"submit date:{event['submit_date']} "
+            f"done date:{event['done_date']} "
+            f"stat:{event['stat']} "
+            f"err:{event['err']} "  # <--- Real code from the DLREvent table
+            f"text:{event['text']}"
         )
         # We send back the exact message_id we generated for them in SUBMIT_SM_RESP
         # dlr_string = f"id:{msg_obj.message_id} sub:001 dlvrd:001 submit date:{submit_date} done date:{done_date} stat:{smpp_stat} err:000 text:{short_text}"
@@ -1696,11 +1790,11 @@ class Command(BaseCommand):
         service_type = b"\0"
         source_addr_ton = b"\x01"
         source_addr_npi = b"\x01"
-        source_addr = msg_obj.destination.encode("ascii") + b"\0"
+        source_addr = event["destination"].encode("ascii") + b"\0"
 
         dest_addr_ton = b"\x01"
         dest_addr_npi = b"\x01"
-        dest_addr = msg_obj.systemId.encode("ascii") + b"\0"
+        dest_addr = event["system_id"].encode("ascii") + b"\0"
 
         esm_class = b"\x04"  # 0x04 tells the client "This is a Receipt!"
         protocol_id = b"\x00"
@@ -1734,6 +1828,8 @@ class Command(BaseCommand):
             + dlr_bytes
         )
 
-        # 5. Send it (0x00000005 is CMD_DELIVER_SM)
-        seq_num = secrets.randbelow(0x7FFFFFFF)
-        await self.send_pdu(writer, 0x00000005, 0x00000000, seq_num, body)
+        # 5. Queue it (0x00000005 is CMD_DELIVER_SM); the outbox picks the sequence number
+        dlr_outbox = getattr(writer, "dlr_outbox", None)
+        if dlr_outbox is None:
+            return False
+        return dlr_outbox.enqueue(int(event["pk"]), body)
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("squadServices", "0128_remove_operatornetworkcode_networkname"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="clientpolicy",
+            name="maxBurst",
+            field=models.IntegerField(
+                default=0,
+                help_text="Max SUBMIT_SM accepted at once before maxTps applies (0=same as maxTps)",
+            ),
+        ),
+    ]
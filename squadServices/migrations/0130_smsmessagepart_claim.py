@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("squadServices", "0129_clientpolicy_maxburst"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="smsmessagepart",
+            name="claimed_by",
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name="smsmessagepart",
+            name="claim_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="smsmessagepart",
+            name="submit_status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("QUEUED", "Queued"),
+                    ("CLAIMED", "Claimed"),
+                    ("DELIVERED", "Delivered"),
+                    ("SUBMITTED", "Submitted"),
+                    ("FAILED", "Failed"),
+                ],
+                default="QUEUED",
+                max_length=20,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="smsmessagepart",
+            index=models.Index(
+                fields=["submit_status", "claim_expires_at"],
+                name="squadServic_submit__b010fb_idx",
+            ),
+        ),
+    ]
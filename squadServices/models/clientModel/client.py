@@ -126,6 +126,10 @@ class ClientPolicy(models.Model):
     maxTps = models.IntegerField(
         default=50, help_text="Max SUBMIT_SM per second (0=unlimited)"
     )
+    maxBurst = models.IntegerField(
+        default=0,
+        help_text="Max SUBMIT_SM accepted at once before maxTps applies (0=same as maxTps)",
+    )
     maxQueueDepth = models.IntegerField(
         default=1000,
         help_text="Max number of messages to queue for this client when rate limits are exceeded",
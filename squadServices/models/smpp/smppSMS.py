@@ -127,6 +127,7 @@ class SMSMessagePart(models.Model):
     STATUS_CHOICES = (
         ("PENDING", "Pending"),
         ("QUEUED", "Queued"),
+        ("CLAIMED", "Claimed"),  # taken by a dispatcher, submit in progress
         ("DELIVERED", "Delivered"),
         ("SUBMITTED", "Submitted"),
         ("FAILED", "Failed"),
@@ -157,6 +158,10 @@ class SMSMessagePart(models.Model):
         max_length=20, choices=STATUS_CHOICES, default="QUEUED"
     )
     vendor_msg_id = models.CharField(max_length=100, null=True, blank=True)
+    # Which dispatcher process holds a CLAIMED part, and until when. A claim
+    # that isn't renewed in time goes back to QUEUED (see partClaim).
+    claimed_by = models.CharField(max_length=100, null=True, blank=True)
+    claim_expires_at = models.DateTimeField(null=True, blank=True)
 
     # 0: ESME_ROK (Success. The vendor accepted the message into their system.)
     # 11: ESME_RINVDSTADR (Immediate failure: The destination phone number is completely invalid or missing digits.)
@@ -181,6 +186,9 @@ class SMSMessagePart(models.Model):
         # Ensures you don't accidentally create duplicate segment numbers for the same parent message
         unique_together = ("message", "part_no")
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["submit_status", "claim_expires_at"]),
+        ]
 
 
 class MessageAttempt(models.Model):
@@ -0,0 +1,138 @@
+"""
+Micro-benchmark: SUBMIT_SM decoding, old slice-per-field parser vs smppPdu.
+
+smppPdu decodes every field, checks bounds and keeps the TLVs, where the old
+parser skipped most of that, so the two come out roughly even (within run to
+run noise). This is a regression check that the shared decoder agrees with
+the old one and costs no more, not a speedup.
+
+Run from the project root (no Django or database needed):
+    python -m squadServices.pduDecoderBenchmark
+"""
+
+import struct
+import timeit
+
+from squadServices.helper.smppPdu import decode_submit_sm
+
+ROUNDS = 200000
+
+
+def build_submit_sm(text, destination="9779812345678", sar=False, payload_tlv=False):
+    body = (
+        b"\0"  # service_type
+        + b"\x05\x00SQUAD\0"  # source ton/npi/addr
+        + b"\x01\x01"
+        + destination.encode()
+        + b"\0"
+        + b"\x00\x00\x00"  # esm_class, protocol_id, priority_flag
+        + b"\0\0"  # schedule_delivery_time, validity_period
+        + b"\x01\x00\x00\x00"  # registered_delivery ... sm_default_msg_id
+    )
+    message = text.encode("latin1")
+    if payload_tlv:
+        body += b"\x00" + struct.pack(">HH", 0x0424, len(message)) + message
+    else:
+        body += bytes([len(message)]) + message
+    if sar:
+        body += struct.pack(">HHH", 0x020C, 2, 42)
+        body += struct.pack(">HHB", 0x020E, 1, 3)
+        body += struct.pack(">HHB", 0x020F, 1, 1)
+    return body
+
+
+# --- The parser handle_submit_sm used before smppPdu (kept here for comparison) ---
+def legacy_read_c_string(data, offset):
+    fragment = data[offset:]
+    end_idx = fragment.find(b"\0")
+    if end_idx == -1:
+        return fragment.decode("ascii", errors="ignore"), len(data)
+    return fragment[:end_idx].decode("ascii", errors="ignore"), offset + end_idx + 1
+
+
+def legacy_decode_submit_sm(body):
+    offset = 0
+    service_type, offset = legacy_read_c_string(body, offset)
+    source_addr_ton = body[offset]
+    offset += 1
+    source_addr_npi = body[offset]
+    offset += 1
+    source_addr, offset = legacy_read_c_string(body, offset)
+    dest_addr_ton = body[offset]
+    offset += 1
+    dest_addr_npi = body[offset]
+    offset += 1
+    destination_addr, offset = legacy_read_c_string(body, offset)
+    esm_class = body[offset]
+    offset += 1
+    protocol_id = body[offset]
+    offset += 1
+    priority_flag = body[offset]
+    offset += 1
+    schedule_delivery_time, offset = legacy_read_c_string(body, offset)
+    validity_period, offset = legacy_read_c_string(body, offset)
+    registered_delivery = body[offset]
+    offset += 1
+    replace_if_present_flag = body[offset]
+    offset += 1
+    data_coding = body[offset]
+    offset += 1
+    sm_default_msg_id = body[offset]
+    offset += 1
+    sm_length = body[offset]
+    offset += 1
+    short_message = body[offset : offset + sm_length]
+    offset += sm_length
+
+    sar = {}
+    while offset < len(body):
+        tlv_tag, tlv_len = struct.unpack(">HH", body[offset : offset + 4])
+        offset += 4
+        tlv_value = body[offset : offset + tlv_len]
+        offset += tlv_len
+        if tlv_tag == 0x0424:
+            short_message = tlv_value
+        elif tlv_tag == 0x020C:
+            sar["ref"] = struct.unpack(">H", tlv_value)[0]
+        elif tlv_tag == 0x020E:
+            sar["total"] = struct.unpack(">B", tlv_value)[0]
+        elif tlv_tag == 0x020F:
+            sar["part"] = struct.unpack(">B", tlv_value)[0]
+    return source_addr, destination_addr, data_coding, short_message, sar
+
+
+CASES = {
+    "short 20 chars": build_submit_sm("Your OTP is 482913."),
+    "160 chars": build_submit_sm("x" * 160),
+    "SAR part": build_submit_sm("y" * 153, sar=True),
+    "payload TLV 1KB": build_submit_sm("z" * 1024, payload_tlv=True),
+}
+
+
+def main():
+    print(f"{'case':<18}{'legacy us':>12}{'smppPdu us':>12}{'ratio':>10}")
+    for name, body in CASES.items():
+        # Both parsers must agree before we time them
+        legacy = legacy_decode_submit_sm(body)
+        pdu = decode_submit_sm(body)
+        assert legacy[:4] == (
+            pdu.source_addr,
+            pdu.destination_addr,
+            pdu.data_coding,
+            pdu.short_message,
+        )
+
+        legacy_time = min(
+            timeit.repeat(lambda: legacy_decode_submit_sm(body), number=ROUNDS, repeat=5)
+        )
+        new_time = min(
+            timeit.repeat(lambda: decode_submit_sm(body), number=ROUNDS, repeat=5)
+        )
+        print(
+            f"{name:<18}{legacy_time / ROUNDS * 1e6:>12.2f}"
+            f"{new_time / ROUNDS * 1e6:>12.2f}{legacy_time / new_time:>9.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from squadServices.helper.bindAuthCache import publish_auth_change
+from squadServices.helper.countryPrefixHelper import invalidate_country_prefix_index
+from squadServices.helper.routeCache import publish_route_change
+from squadServices.models.clientModel.client import Client, ClientPolicy, IpWhitelist
+from squadServices.models.connectivityModel.verdor import Vendor
+from squadServices.models.country import Country
+from squadServices.models.rateManagementModel.customerRate import CustomerRate
+from squadServices.models.rateManagementModel.vendorRate import VendorRate
+from squadServices.models.routeManager.customRoute import CustomRoute
+
+
+# The SMPP server and the campaign worker resolve destinations from an in-memory
+# country prefix trie, so any Country edit (including soft deletes) must bump its version.
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+def country_changed(sender, instance, **kwargs):
+    invalidate_country_prefix_index()
+
+
+def touches_fields(update_fields, fields):
+    # Full saves (the API) always count; bindStatus-style saves don't
+    return update_fields is None or bool(set(update_fields) & fields)
+
+
+# The SMPP server caches routes per (client, country). Route, rate and rate plan
+# edits bump the route version so every process drops its cached routes.
+@receiver(post_save, sender=CustomRoute)
+@receiver(post_delete, sender=CustomRoute)
+@receiver(post_save, sender=VendorRate)
+@receiver(post_delete, sender=VendorRate)
+@receiver(post_save, sender=CustomerRate)
+@receiver(post_delete, sender=CustomerRate)
+def route_changed(sender, instance, **kwargs):
+    publish_route_change()
+
+
+@receiver(post_save, sender=Vendor)
+@receiver(post_delete, sender=Vendor)
+def vendor_changed(sender, instance, update_fields=None, **kwargs):
+    if touches_fields(update_fields, {"ratePlanName", "smpp", "profileName"}):
+        publish_route_change()
+
+
+# Fields the SMPP server itself writes on every bind/unbind or submit
+CLIENT_RUNTIME_FIELDS = {"bindStatus", "usedCredit"}
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def client_changed(sender, instance, update_fields=None, **kwargs):
+    if touches_fields(update_fields, {"ratePlanName"}):
+        publish_route_change()
+    # The SMPP bind cache holds credentials, status and the policy of every client
+    if update_fields is None or set(update_fields) - CLIENT_RUNTIME_FIELDS:
+        publish_auth_change()
+
+
+@receiver(post_save, sender=ClientPolicy)
+@receiver(post_delete, sender=ClientPolicy)
+@receiver(post_save, sender=IpWhitelist)
+@receiver(post_delete, sender=IpWhitelist)
+def bind_auth_changed(sender, instance, **kwargs):
+    publish_auth_change()
@@ -0,0 +1,78 @@
+"""
+Micro-benchmark: encoding detection + segment counting, the old per-character
+loops vs smsCodec.
+
+Run from the project root (no Django or database needed):
+    python -m squadServices.smsCodecBenchmark
+"""
+
+import math
+import timeit
+
+from squadServices.helper.smsCodec import get_encoding_and_segments, split_message
+
+ROUNDS = 20000
+
+
+# --- What smpp_server / squad.task used before smsCodec (kept for comparison) ---
+def legacy_get_encoding_and_segments(text):
+    gsm7_basic = "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞ\x1bÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+    gsm7_ext = "^{}\\[~]|€"
+    encoding = "GSM-7"
+    for char in text:
+        if char not in gsm7_basic and char not in gsm7_ext:
+            encoding = "UCS-2"
+            break
+    length = len(text)
+    if encoding == "GSM-7":
+        segments = 1 if length <= 160 else math.ceil(length / 153)
+    else:
+        segments = 1 if length <= 70 else math.ceil(length / 67)
+    return encoding, segments, length
+
+
+CASES = {
+    "OTP 20 chars": "Your OTP is 482913.",
+    "GSM 160": "Dear customer, " + "x" * 145,
+    "GSM 918 (6 parts)": ("Lorem ipsum dolor sit amet. " * 33)[:918],
+    "GSM with {}[]€": "Promo {CODE} [50%] off, only €9.99! " * 5,
+    "UCS-2 Nepali": "तपाईंको OTP 482913 हो। " * 4,
+    "UCS-2 emoji": "Happy birthday 🎉🎂 " * 8,
+}
+
+
+def main():
+    print(
+        f"{'case':<20}{'legacy us':>11}{'codec us':>10}{'speedup':>9}"
+        f"{'segs old/new':>14}{'split us':>10}"
+    )
+    for name, text in CASES.items():
+        legacy = legacy_get_encoding_and_segments(text)
+        codec = get_encoding_and_segments(text)
+        # Segments may differ: the old loops counted characters, not septets
+        assert legacy[0] == codec[0], name
+        _, parts = split_message(text, 42)
+        assert len(parts) == codec[1] and "".join(p[0] for p in parts) == text
+
+        legacy_time = min(
+            timeit.repeat(
+                lambda: legacy_get_encoding_and_segments(text), number=ROUNDS, repeat=3
+            )
+        )
+        new_time = min(
+            timeit.repeat(
+                lambda: get_encoding_and_segments(text), number=ROUNDS, repeat=3
+            )
+        )
+        split_time = min(
+            timeit.repeat(lambda: split_message(text, 42), number=ROUNDS, repeat=3)
+        )
+        print(
+            f"{name:<20}{legacy_time / ROUNDS * 1e6:>11.2f}"
+            f"{new_time / ROUNDS * 1e6:>10.2f}{legacy_time / new_time:>8.2f}x"
+            f"{f'{legacy[1]}/{codec[1]}':>14}{split_time / ROUNDS * 1e6:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()